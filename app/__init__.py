@@ -1,16 +1,20 @@
 import logging
 from logging.handlers import SMTPHandler, RotatingFileHandler
 import os
+import click
 from flask import Flask, request, current_app
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_bootstrap import Bootstrap
 from flask_moment import Moment
 from flask_babel import Babel, lazy_gettext as _l
 from config import Config
+from app.cache import TTLCache
+from app.last_seen import LastSeen
+from app.passwords import Passwords
+from app import fragments
 
 db = SQLAlchemy(metadata=MetaData(naming_convention={
     'pk': 'pk_%(table_name)s',
@@ -19,7 +23,6 @@ db = SQLAlchemy(metadata=MetaData(naming_convention={
     'uq': 'uq_%(table_name)s_%(column_0_name)s',
     'ck': 'ck_%(table_name)s_%(constraint_name)s',
 }))
-migrate = Migrate()
 login = LoginManager()
 login.login_view = 'auth.login'
 login.login_message = _l('Please log in to access this page.')
@@ -27,6 +30,8 @@ mail = Mail()
 bootstrap = Bootstrap()
 moment = Moment()
 babel = Babel()
+last_seen = LastSeen()
+passwords = Passwords()
 
 
 def create_app(config_class=Config):
@@ -34,12 +39,29 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
 
     db.init_app(app)
-    migrate.init_app(app, db, render_as_batch=True)
+    if click.get_current_context(silent=True) is not None:
+        # Only the flask command needs migrations, so workers never import
+        # Alembic.
+        from flask_migrate import Migrate
+        Migrate(app, db, render_as_batch=True)
     login.init_app(app)
     mail.init_app(app)
     bootstrap.init_app(app)
     moment.init_app(app)
     babel.init_app(app, locale_selector=get_locale)
+    last_seen.init_app(app)
+    passwords.init_app(app)
+    app.extensions['caches'] = {
+        'users': TTLCache(app.config['USER_CACHE_SIZE'],
+                          app.config['USER_CACHE_TTL']),
+        'pages': TTLCache(None, app.config['PAGE_CACHE_TTL'],
+                          maxbytes=app.config['PAGE_CACHE_BYTES']),
+        'fragments': fragments.make_backend(app.config),
+    }
+    app.jinja_env.add_extension(fragments.FragmentCacheExtension)
+
+    from app.email import MailQueue
+    app.extensions['mail_queue'] = MailQueue(app)
 
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
@@ -50,6 +72,12 @@ def create_app(config_class=Config):
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
 
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+    from app.cli import bp as cli_bp
+    app.register_blueprint(cli_bp)
+
     if not app.debug and not app.testing:
         if app.config['MAIL_SERVER']:
             auth = None
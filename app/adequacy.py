@@ -0,0 +1,82 @@
+from collections import namedtuple
+import numpy as np
+from app.models import NUTRIENTS, RANGE_NUTRIENTS, LIMIT_NUTRIENTS, \
+    VECTOR_ATTRS
+
+BELOW, WITHIN, ABOVE = -1, 0, 1
+STATUS_NAMES = {BELOW: 'below', WITHIN: 'within', ABOVE: 'above'}
+
+# Calories have a single target; plans this close to it count as within.
+CALORIE_TOLERANCE = 0.1
+
+Adequacy = namedtuple('Adequacy', ['percent', 'status', 'scores'])
+
+
+def goal_bounds(goals):
+    """Turns a goal vector in VECTOR_ATTRS order into acceptable ranges.
+
+    Returns (low, high, target) arrays over NUTRIENTS: macros use the
+    ranges set_nutri_info derives, added sugar and saturated fat are upper
+    limits, calories allow CALORIE_TOLERANCE either way and every other
+    goal is a minimum.
+    """
+    goals = np.nan_to_num(np.asarray(goals, dtype=float))
+    target = goals[:len(NUTRIENTS)].copy()
+    low = target.copy()
+    high = np.full(len(NUTRIENTS), np.inf)
+    for attr, low_attr in RANGE_NUTRIENTS.items():
+        i = NUTRIENTS.index(attr)
+        low[i] = goals[VECTOR_ATTRS.index(low_attr)]
+        high[i] = target[i]
+    for attr in LIMIT_NUTRIENTS:
+        i = NUTRIENTS.index(attr)
+        low[i] = 0
+        high[i] = target[i]
+    i = NUTRIENTS.index('calories')
+    low[i] = target[i] * (1 - CALORIE_TOLERANCE)
+    high[i] = target[i] * (1 + CALORIE_TOLERANCE)
+    return low, high, target
+
+
+def score(plans, goals):
+    """Scores a (plans x NUTRIENTS) matrix of daily averages against goals.
+
+    Returns the percentage of target per plan and nutrient, a BELOW /
+    WITHIN / ABOVE status for each, and an overall 0-100 score per plan:
+    the mean over nutrients of 1 inside the range, otherwise the ratio of
+    the nearest bound to the plan's value.
+    """
+    plans = np.nan_to_num(np.atleast_2d(np.asarray(plans, dtype=float)))
+    low, high, target = goal_bounds(goals)
+    below = plans < low
+    above = plans > high
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(target > 0, plans * 100 / target, np.nan)
+        ratio = np.ones_like(plans)
+        ratio = np.where(below, np.where(low > 0, plans / low, 1), ratio)
+        ratio = np.where(above, high / plans, ratio)
+    status = np.where(below, BELOW, np.where(above, ABOVE, WITHIN))
+    return Adequacy(percent, status, ratio.mean(axis=1) * 100)
+
+
+def plan_matrix(infos):
+    """Stacks the NUTRIENTS part of each NutritionInfo's vector."""
+    if not infos:
+        return np.empty((0, len(NUTRIENTS)))
+    return np.stack([info.vector[:len(NUTRIENTS)] for info in infos])
+
+
+def rank_catalog(packed_rows, goals):
+    """Orders (mealplan id, packed vector) rows by score, best first.
+
+    Returns the ids and their scores as two arrays.
+    """
+    if not packed_rows:
+        return np.empty(0, dtype=int), np.empty(0)
+    ids = np.fromiter((row[0] for row in packed_rows), dtype=np.int64,
+                      count=len(packed_rows))
+    matrix = np.frombuffer(b''.join(row[1] for row in packed_rows),
+                           dtype=np.float64).reshape(-1, len(VECTOR_ATTRS))
+    scores = score(matrix[:, :len(NUTRIENTS)], goals).scores
+    order = np.argsort(-scores, kind='stable')
+    return ids[order], scores[order]
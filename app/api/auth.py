@@ -0,0 +1,37 @@
+from functools import wraps
+from flask import g, request
+from app import db, last_seen
+from app.models import User
+from app.api.errors import error_response
+
+
+def basic_auth_user():
+    """The user named by valid HTTP basic credentials, if any."""
+    auth = request.authorization
+    if auth is None or not auth.username:
+        return None
+    user = User.authenticate(auth.username, auth.password or '')
+    if user is not None:
+        db.session.commit()
+    return user
+
+
+def token_auth_user():
+    """The user a valid ``Authorization: Bearer`` token belongs to."""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return User.verify_api_token(token.strip())
+
+
+def token_required(f):
+    """Runs the view with the token's user as ``g.api_user``, else 401."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        user = token_auth_user()
+        if user is None:
+            return error_response(401)
+        g.api_user = user
+        last_seen.touch(user.id)
+        return f(*args, **kwargs)
+    return decorated
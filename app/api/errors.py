@@ -0,0 +1,20 @@
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import HTTP_STATUS_CODES
+from app.api import bp
+
+
+def error_response(status_code, message=None, **extra):
+    payload = {'error': HTTP_STATUS_CODES.get(status_code, 'Unknown error')}
+    if message:
+        payload['message'] = message
+    payload.update(extra)
+    return payload, status_code
+
+
+def bad_request(message, **extra):
+    return error_response(400, message, **extra)
+
+
+@bp.errorhandler(HTTPException)
+def handle_exception(e):
+    return error_response(e.code)
@@ -0,0 +1,42 @@
+from flask import g, request
+from app import db
+from app.models import GOAL_ATTRS
+from app.api import bp
+from app.api.auth import token_required
+from app.api.errors import bad_request
+from app.api.schema import SchemaError, Choice, Number, validate
+
+PROFILE = {
+    'sex': Choice(('M', 'F'), required=True),
+    'age': Number(min=1, max=120, integer=True, required=True),
+    'height': Number(min=0.5, max=2.5, required=True),
+    'weight': Number(min=10, max=400, required=True),
+    'exercise': Choice((1.2, 1.375, 1.55, 1.725, 1.9), required=True),
+}
+
+
+def goals_to_dict(user):
+    return {'profile': {attr: getattr(user, attr) for attr in PROFILE},
+            'goals': {attr: getattr(user.info, attr) for attr in GOAL_ATTRS}
+            if user.info is not None else None}
+
+
+@bp.route('/goals', methods=['GET'])
+@token_required
+def get_goals():
+    return goals_to_dict(g.api_user)
+
+
+@bp.route('/goals', methods=['PUT'])
+@token_required
+def update_goals():
+    try:
+        data = validate(PROFILE, request.get_json(silent=True))
+    except SchemaError as e:
+        return bad_request('Invalid profile', errors=e.errors)
+    user = g.api_user
+    for attr, value in data.items():
+        setattr(user, attr, value)
+    user.set_nutri_info()
+    db.session.commit()
+    return goals_to_dict(user)
@@ -0,0 +1,271 @@
+from flask import current_app, g, request, url_for
+from app import db
+from app.models import NUTRIENTS, Food, FoodItem, MealPlan
+from app.pagination import keyset_paginate
+from app.api import bp
+from app.api.auth import token_required
+from app.api.errors import bad_request, error_response
+from app.api.schema import SchemaError, List, Nested, Number, String, \
+    validate
+
+MAX_ITEMS = 1000
+MAX_BATCH = 100
+
+FOODITEM = dict({attr: Number(min=0) for attr in NUTRIENTS},
+                name=String(max_length=40, required=True),
+                no_servings=Number(min=0, default=1),
+                food_id=Number(min=1, integer=True))
+FOODITEMS = {'fooditems': List(Nested(FOODITEM), max_items=MAX_ITEMS,
+                               required=True)}
+MEALPLAN = {'id': Number(min=1, integer=True),
+            'name': String(max_length=40, required=True),
+            'length': Number(min=1, max=3650, integer=True, required=True),
+            'fooditems': List(Nested(FOODITEM), max_items=MAX_ITEMS,
+                              default=())}
+BATCH = {'mealplans': List(Nested(MEALPLAN), max_items=MAX_BATCH,
+                           required=True)}
+
+
+def fooditem_to_dict(item):
+    data = {'id': item.id, 'name': item.name,
+            'no_servings': item.no_servings, 'food_id': item.food_id}
+    info = item.info
+    data.update((attr, getattr(info, attr) if info is not None else None)
+                for attr in NUTRIENTS)
+    return data
+
+
+def mealplan_to_dict(mealplan, fooditems=None):
+    data = {
+        'id': mealplan.id,
+        'name': mealplan.name,
+        'length': mealplan.length,
+        'user': mealplan.user.username if mealplan.user is not None else None,
+        'timestamp': mealplan.timestamp.isoformat() + 'Z',
+        'info': {attr: getattr(mealplan.info, attr) for attr in NUTRIENTS}
+        if mealplan.info is not None else None,
+        '_links': {
+            'self': url_for('api.get_mealplan', id=mealplan.id),
+            'fooditems': url_for('api.get_fooditems', id=mealplan.id),
+        },
+    }
+    if fooditems is not None:
+        data['fooditems'] = [fooditem_to_dict(item) for item in fooditems]
+    return data
+
+
+def _check_items(items, path, errors):
+    for i, item in enumerate(items):
+        if 'food_id' in item and any(attr in item for attr in NUTRIENTS):
+            errors['{}.{}'.format(path, i)] = \
+                'give either food_id or nutrient values'
+
+
+def _insert_items(pairs):
+    """Adds (mealplan, items) pairs with one executemany INSERT.
+
+    Items carrying nutrient values are interned in the food catalog in
+    bulk; items naming a food_id reference it directly.
+    """
+    values = [item for _, items in pairs for item in items
+              if 'food_id' not in item]
+    food_ids = iter(Food.intern_ids(values))
+    rows = []
+    for mealplan, items in pairs:
+        for item in items:
+            rows.append({
+                'mealplan_id': mealplan.id,
+                'name': item['name'],
+                'no_servings': item.get('no_servings', 1),
+                'food_id': item['food_id'] if 'food_id' in item
+                else next(food_ids)})
+    if rows:
+        db.session.execute(FoodItem.__table__.insert(), rows)
+
+
+def _missing_foods(payloads):
+    wanted = {item['food_id'] for items in payloads for item in items
+              if 'food_id' in item}
+    if not wanted:
+        return set()
+    return wanted - set(db.session.scalars(
+        db.select(Food.id).where(Food.id.in_(wanted))))
+
+
+def save_mealplans(user, payloads):
+    """Creates or replaces meal plans in one transaction.
+
+    A payload with an ``id`` replaces the name, length and food items of
+    that plan, which must belong to ``user``; others create a plan. Food
+    items are written set-based and the daily averages come from one
+    grouped query. Raises SchemaError naming every bad plan or item.
+    """
+    ids = [p['id'] for p in payloads if 'id' in p]
+    existing = {m.id: m for m in MealPlan.query.filter(
+        MealPlan.id.in_(ids))} if ids else {}
+    errors = {}
+    for i, payload in enumerate(payloads):
+        path = 'mealplans.{}'.format(i)
+        if 'id' in payload:
+            mealplan = existing.get(payload['id'])
+            if mealplan is None or mealplan.user_id != user.id:
+                errors[path + '.id'] = 'is not one of your meal plans'
+        _check_items(payload['fooditems'], path + '.fooditems', errors)
+    missing = _missing_foods([p['fooditems'] for p in payloads])
+    if missing:
+        errors['food_id'] = 'unknown foods {}'.format(sorted(missing))
+    if errors:
+        raise SchemaError(errors)
+
+    mealplans = []
+    for payload in payloads:
+        mealplan = existing.get(payload.get('id'))
+        if mealplan is None:
+            mealplan = MealPlan(user=user)
+            db.session.add(mealplan)
+        mealplan.name = payload['name']
+        mealplan.length = payload['length']
+        mealplans.append(mealplan)
+    db.session.flush()
+    if existing:
+        db.session.execute(FoodItem.__table__.delete().where(
+            FoodItem.mealplan_id.in_(list(existing))))
+    _insert_items([(m, p['fooditems']) for m, p in zip(mealplans, payloads)])
+    MealPlan.set_nutri_info_many(mealplans)
+    return mealplans
+
+
+def _own_mealplan(id):
+    mealplan = db.get_or_404(MealPlan, id)
+    if mealplan.user_id != g.api_user.id:
+        return None, error_response(403)
+    return mealplan, None
+
+
+def _get_json(schema):
+    return validate(schema, request.get_json(silent=True))
+
+
+@bp.route('/mealplans', methods=['GET'])
+@token_required
+def get_mealplans():
+    query = MealPlan.query.options(*MealPlan.card_options())
+    username = request.args.get('user')
+    if username is not None:
+        query = query.join(MealPlan.user).filter_by(username=username)
+    else:
+        query = query.filter(MealPlan.user_id == g.api_user.id)
+    page = keyset_paginate(query, (MealPlan.timestamp, MealPlan.id),
+                           current_app.config['POSTS_PER_PAGE'],
+                           after=request.args.get('after'))
+    return {'items': [mealplan_to_dict(m) for m in page.items],
+            '_links': {'next': url_for('api.get_mealplans', user=username,
+                                       after=page.next_cursor)
+                       if page.has_next else None}}
+
+
+@bp.route('/mealplans', methods=['POST'])
+@token_required
+def create_mealplan():
+    try:
+        data = _get_json(MEALPLAN)
+        data.pop('id', None)
+        mealplan, = save_mealplans(g.api_user, [data])
+    except SchemaError as e:
+        return bad_request('Invalid meal plan', errors=e.errors)
+    db.session.commit()
+    return mealplan_to_dict(mealplan, mealplan.fooditems_with_info()), 201, \
+        {'Location': url_for('api.get_mealplan', id=mealplan.id)}
+
+
+@bp.route('/mealplans/batch', methods=['POST'])
+@token_required
+def batch_mealplans():
+    try:
+        data = _get_json(BATCH)
+        mealplans = save_mealplans(g.api_user, data['mealplans'])
+    except SchemaError as e:
+        return bad_request('Invalid meal plans', errors=e.errors)
+    db.session.commit()
+    return {'items': [mealplan_to_dict(m) for m in mealplans]}
+
+
+@bp.route('/mealplans/<int:id>', methods=['GET'])
+@token_required
+def get_mealplan(id):
+    mealplan = db.get_or_404(MealPlan, id)
+    return mealplan_to_dict(mealplan, mealplan.fooditems_with_info())
+
+
+@bp.route('/mealplans/<int:id>', methods=['PUT'])
+@token_required
+def update_mealplan(id):
+    mealplan, error = _own_mealplan(id)
+    if error is not None:
+        return error
+    try:
+        data = _get_json(MEALPLAN)
+        data['id'] = id
+        save_mealplans(g.api_user, [data])
+    except SchemaError as e:
+        return bad_request('Invalid meal plan', errors=e.errors)
+    db.session.commit()
+    return mealplan_to_dict(mealplan, mealplan.fooditems_with_info())
+
+
+@bp.route('/mealplans/<int:id>', methods=['DELETE'])
+@token_required
+def delete_mealplan(id):
+    mealplan, error = _own_mealplan(id)
+    if error is not None:
+        return error
+    db.session.delete(mealplan)
+    db.session.commit()
+    return '', 204
+
+
+@bp.route('/mealplans/<int:id>/fooditems', methods=['GET'])
+@token_required
+def get_fooditems(id):
+    mealplan = db.get_or_404(MealPlan, id)
+    return {'items': [fooditem_to_dict(item)
+                      for item in mealplan.fooditems_with_info()]}
+
+
+@bp.route('/mealplans/<int:id>/fooditems', methods=['POST'])
+@token_required
+def add_fooditems(id):
+    mealplan, error = _own_mealplan(id)
+    if error is not None:
+        return error
+    try:
+        items = _get_json(FOODITEMS)['fooditems']
+        errors = {}
+        _check_items(items, 'fooditems', errors)
+        missing = _missing_foods([items])
+        if missing:
+            errors['food_id'] = 'unknown foods {}'.format(sorted(missing))
+        if errors:
+            raise SchemaError(errors)
+    except SchemaError as e:
+        return bad_request('Invalid food items', errors=e.errors)
+    if not mealplan.length:
+        return bad_request('Set the meal plan length first')
+    _insert_items([(mealplan, items)])
+    MealPlan.set_nutri_info_many([mealplan])
+    db.session.commit()
+    return mealplan_to_dict(mealplan, mealplan.fooditems_with_info()), 201
+
+
+@bp.route('/mealplans/<int:id>/fooditems/<int:item_id>', methods=['DELETE'])
+@token_required
+def delete_fooditem(id, item_id):
+    mealplan, error = _own_mealplan(id)
+    if error is not None:
+        return error
+    item = FoodItem.query.filter_by(id=item_id,
+                                    mealplan_id=mealplan.id).first_or_404()
+    db.session.delete(item)
+    MealPlan.set_nutri_info_many([mealplan])
+    db.session.commit()
+    return '', 204
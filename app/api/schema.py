@@ -0,0 +1,133 @@
+"""Minimal declarative validation for JSON request bodies.
+
+A schema is a dict of field name to Field. validate() walks the payload
+once, coercing values and collecting every problem under a dotted path
+such as ``fooditems.3.calories`` before raising a single SchemaError.
+"""
+import math
+from numbers import Real
+
+
+class SchemaError(ValueError):
+    def __init__(self, errors):
+        super(SchemaError, self).__init__('Invalid request')
+        self.errors = errors
+
+
+class Field(object):
+    def __init__(self, required=False, default=None):
+        self.required = required
+        self.default = default
+
+    def clean(self, value, path, errors):
+        return value
+
+
+class String(Field):
+    def __init__(self, max_length=None, **kwargs):
+        super(String, self).__init__(**kwargs)
+        self.max_length = max_length
+
+    def clean(self, value, path, errors):
+        if not isinstance(value, str):
+            errors[path] = 'must be a string'
+        elif self.max_length is not None and len(value) > self.max_length:
+            errors[path] = 'must be at most {} characters'.format(
+                self.max_length)
+        return value
+
+
+class Number(Field):
+    def __init__(self, min=None, max=None, integer=False, **kwargs):
+        super(Number, self).__init__(**kwargs)
+        self.min = min
+        self.max = max
+        self.integer = integer
+
+    def clean(self, value, path, errors):
+        if isinstance(value, bool) or not isinstance(value, Real) or \
+                not _finite(value) or (self.integer and value != int(value)):
+            errors[path] = 'must be an integer' if self.integer \
+                else 'must be a number'
+            return value
+        value = int(value) if self.integer else float(value)
+        if self.min is not None and value < self.min:
+            errors[path] = 'must be at least {}'.format(self.min)
+        elif self.max is not None and value > self.max:
+            errors[path] = 'must be at most {}'.format(self.max)
+        return value
+
+
+def _finite(value):
+    # JSON allows NaN, Infinity and 1e999, and ints too big for a float.
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+class Choice(Field):
+    def __init__(self, choices, **kwargs):
+        super(Choice, self).__init__(**kwargs)
+        self.choices = choices
+
+    def clean(self, value, path, errors):
+        if value not in self.choices:
+            errors[path] = 'must be one of {}'.format(
+                ', '.join(map(str, self.choices)))
+        return value
+
+
+class Nested(Field):
+    def __init__(self, schema, **kwargs):
+        super(Nested, self).__init__(**kwargs)
+        self.schema = schema
+
+    def clean(self, value, path, errors):
+        return _validate(self.schema, value, path + '.', errors)
+
+
+class List(Field):
+    def __init__(self, item, max_items=None, **kwargs):
+        super(List, self).__init__(**kwargs)
+        self.item = item
+        self.max_items = max_items
+
+    def clean(self, value, path, errors):
+        if not isinstance(value, list):
+            errors[path] = 'must be a list'
+            return value
+        if self.max_items is not None and len(value) > self.max_items:
+            errors[path] = 'must have at most {} items'.format(self.max_items)
+            return value
+        return [self.item.clean(item, '{}.{}'.format(path, i), errors)
+                for i, item in enumerate(value)]
+
+
+def _validate(schema, data, prefix, errors):
+    if not isinstance(data, dict):
+        errors[prefix.rstrip('.') or 'body'] = 'must be an object'
+        return data
+    cleaned = {}
+    for name, field in schema.items():
+        value = data.get(name)
+        if value is None:
+            if field.required:
+                errors[prefix + name] = 'is required'
+            elif field.default is not None:
+                cleaned[name] = field.default
+            continue
+        cleaned[name] = field.clean(value, prefix + name, errors)
+    for name in data:
+        if name not in schema:
+            errors[prefix + name] = 'is not a known field'
+    return cleaned
+
+
+def validate(schema, data):
+    """Returns a cleaned copy of ``data`` or raises SchemaError."""
+    errors = {}
+    cleaned = _validate(schema, data, '', errors)
+    if errors:
+        raise SchemaError(errors)
+    return cleaned
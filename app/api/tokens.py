@@ -0,0 +1,14 @@
+from flask import current_app
+from app.api import bp
+from app.api.auth import basic_auth_user
+from app.api.errors import error_response
+
+
+@bp.route('/tokens', methods=['POST'])
+def get_token():
+    user = basic_auth_user()
+    if user is None:
+        return error_response(401)
+    expires_in = current_app.config['API_TOKEN_EXPIRES']
+    return {'token': user.get_api_token(expires_in),
+            'expires_in': expires_in}
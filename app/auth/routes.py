@@ -8,6 +8,7 @@ from app.auth.forms import LoginForm, RegistrationForm, \
     ResetPasswordRequestForm, ResetPasswordForm
 from app.models import User
 from app.auth.email import send_password_reset_email
+from app.email import MailQueueFull
 
 
 @bp.route('/login', methods=['GET', 'POST'])
@@ -16,10 +17,11 @@ def login():
         return redirect(url_for('main.index'))
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
-        if user is None or not user.check_password(form.password.data):
+        user = User.authenticate(form.username.data, form.password.data)
+        if user is None:
             flash(_('Invalid username or password'))
             return redirect(url_for('auth.login'))
+        db.session.commit()
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
         if not next_page or url_parse(next_page).netloc != '':
@@ -58,7 +60,12 @@ def reset_password_request():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user:
-            send_password_reset_email(user)
+            try:
+                send_password_reset_email(user)
+            except MailQueueFull:
+                flash(_('We are sending a lot of emails right now, please '
+                        'try again in a minute.'))
+                return redirect(url_for('auth.reset_password_request'))
         flash(
             _('Check your email for the instructions to reset your password'))
         return redirect(url_for('auth.login'))
@@ -0,0 +1,82 @@
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+
+class TTLCache(object):
+    """A thread safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Holds at most ``maxsize`` entries and, when ``maxbytes`` is set, values
+    whose ``sys.getsizeof`` adds up to at most ``maxbytes``, dropping the
+    least recently used first. Either bound can be None. A ``ttl`` of None
+    keeps entries until they are evicted. Hits, misses and evictions are
+    counted for the /metrics endpoint.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _full(self):
+        return (self.maxsize is not None and
+                len(self._data) > self.maxsize) or \
+            (self.maxbytes is not None and self.nbytes > self.maxbytes)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] is not None and \
+                    item[1] < monotonic():
+                del self._data[key]
+                self.nbytes -= item[2]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        expires = monotonic() + self.ttl if self.ttl is not None else None
+        size = sys.getsizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._data[key] = (value, expires, size)
+            self.nbytes += size
+            while self._full():
+                self.nbytes -= self._data.popitem(last=False)[1][2]
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self.nbytes -= item[2]
+        return item[0] if item is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'bytes': self.nbytes, 'maxbytes': self.maxbytes,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else None}
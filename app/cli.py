@@ -0,0 +1,139 @@
+import click
+from flask import Blueprint
+
+bp = Blueprint('cli', __name__, cli_group=None)
+
+
+@bp.cli.group()
+def timeline():
+    """Home timeline maintenance commands."""
+    pass
+
+
+@timeline.command()
+def rebuild():
+    """Rebuild every user's home timeline from the follow graph."""
+    from app.models import rebuild_timelines
+    rebuild_timelines()
+    click.echo('Timelines rebuilt.')
+
+
+@bp.cli.group()
+def followers():
+    """Follower graph maintenance commands."""
+    pass
+
+
+@followers.command()
+def recount():
+    """Recount every user's follower and following counters."""
+    from app.models import recount_follows
+    recount_follows()
+    click.echo('Follow counters recounted.')
+
+
+@bp.cli.group()
+def food():
+    """Food catalog commands."""
+    pass
+
+
+@food.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']),
+              help='File format, by default taken from the extension.')
+@click.option('--chunk-size', default=5000, show_default=True,
+              help='Foods written per transaction.')
+@click.option('--code-column', default='food_code', show_default=True)
+@click.option('--name-column', default='food_name', show_default=True)
+@click.option('--nutrient-column', default='nutrient', show_default=True)
+@click.option('--amount-column', default='amount', show_default=True)
+@click.option('--aliases', type=click.File(),
+              help='JSON object mapping the file\'s nutrient names to '
+                   'nutrient columns such as "protein".')
+@click.option('--restart', is_flag=True,
+              help='Start over instead of resuming an earlier run.')
+def import_(path, format, chunk_size, code_column, name_column,
+            nutrient_column, amount_column, aliases, restart):
+    """Import a long-format food composition file into the catalog.
+
+    Amounts are taken as one serving's worth in the units the app shows.
+    An interrupted import resumes where it stopped when run again.
+    """
+    import json
+    from app.food_import import FoodImporter
+    columns = {'code': code_column, 'name': name_column,
+               'nutrient': nutrient_column, 'amount': amount_column}
+    try:
+        importer = FoodImporter(path, format, chunk_size, columns,
+                                json.load(aliases) if aliases else None)
+        job = importer.job(restart)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if job.finished is not None:
+        click.echo('{} was already imported ({} foods), use --restart to '
+                   'import it again.'.format(path, job.foods))
+        return
+    if job.offset:
+        click.echo('Resuming at byte {} after {} foods.'.format(job.offset,
+                                                                job.foods))
+
+    def progress(job, rate):
+        click.echo('{:>10} foods {:>12} rows {:>6.1f}% {:>10.0f} rows/s'.format(
+            job.foods, job.rows, 100 * job.offset / (job.size or 1), rate))
+
+    rate = importer.run(job, progress)
+    click.echo('Imported {} foods from {} rows at {:.0f} rows/s, skipped {} '
+               'rows.'.format(job.foods, job.rows, rate,
+                              importer.skipped['rows']))
+
+
+@bp.cli.group()
+def mealplans():
+    """Meal plan commands."""
+    pass
+
+
+@mealplans.command()
+@click.argument('username')
+@click.option('--format', type=click.Choice(['csv', 'ndjson']),
+              default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('-o', '--output', type=click.File('wb'), default='-',
+              help='File to write, by default standard output.')
+def export(username, format, compress, output):
+    """Export a user's meal plans with per-item nutrients."""
+    from app.export import export_mealplans
+    from app.models import User
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException('User {} not found.'.format(username))
+    for chunk in export_mealplans(user.id, format, compress):
+        output.write(chunk if compress else chunk.encode('utf-8'))
+
+
+@bp.cli.command('startup-profile')
+@click.option('--module', default='nutritrack', show_default=True,
+              help='Module gunicorn loads the app from.')
+@click.option('--top', default=15, show_default=True,
+              help='Packages to list.')
+@click.option('--check', is_flag=True,
+              help='Fail when the start is over its budget.')
+def startup_profile(module, top, check):
+    """Report the import time and memory a fresh worker spends on startup."""
+    from app import startup
+    report = startup.profile(module)
+    click.echo('{} imported in {:.3f} s, peak RSS {:.1f} MiB, {} modules'
+               .format(module, report['seconds'], report['rss_mib'],
+                       len(report['modules'])))
+    click.echo('{:<24} {:>10} {:>12}'.format('package', 'import ms',
+                                             'memory KiB'))
+    times, memory = report['times'], report['memory']
+    for name in sorted(times, key=times.get, reverse=True)[:top]:
+        click.echo('{:<24} {:>10.1f} {:>12.1f}'.format(
+            name, times[name] * 1000, memory.get(name, 0) / 1024))
+    problems = startup.over_budget(report)
+    for problem in problems:
+        click.echo('Over budget: ' + problem)
+    if check and problems:
+        raise click.ClickException('Worker startup is over its budget.')
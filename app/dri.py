@@ -0,0 +1,119 @@
+import csv
+import os
+from bisect import bisect_left
+import numpy as np
+
+DRI_CSV = os.path.join(os.path.dirname(__file__), 'static', 'micronutrients.csv')
+
+# Macronutrients given as a percentage range of daily calories, with the
+# number of kcal per gram used to turn the range into grams.
+MACROS = (('protein', 4), ('carbs', 4), ('fat', 9))
+
+# Order of the values returned by DRITable.goals_batch().
+GOAL_FIELDS = ('calories', 'protein', 'protein_low', 'carbs', 'carbs_low',
+               'fiber', 'sugar', 'fat', 'fat_low', 'sat_fat')
+
+
+def tdee(sex, age, height, weight, exercise):
+    """Total daily energy expenditure from the Mifflin-St Jeor formula."""
+    s = -161 if sex == 'F' else 5
+    return float(exercise) * (10 * float(weight) + 6.25 * 100 * float(height)
+                              - 5 * float(age) + s)
+
+
+class DRITable(object):
+    """Dietary reference intakes indexed by (sex, age band).
+
+    The CSV is parsed once; each sex keeps a sorted list of band start ages
+    next to a matrix of macro percentage ranges and one of fixed
+    micronutrient amounts, so a lookup is a bisect and a row read.
+    """
+
+    def __init__(self, path=DRI_CSV):
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            columns = reader.fieldnames
+            rows = sorted(reader, key=lambda r: (r['sex'], int(r['age'])))
+        self.micronutrients = tuple(columns[columns.index('sat_fat') + 1:])
+        self.fields = GOAL_FIELDS + self.micronutrients
+        self.ages = {}
+        self.macros = {}
+        self.micros = {}
+        for sex in sorted({r['sex'] for r in rows}):
+            band = [r for r in rows if r['sex'] == sex]
+            self.ages[sex] = [int(r['age']) for r in band]
+            self.macros[sex] = np.array(
+                [[[int(v) for v in r[name + '_p'].split('-')]
+                  for name, _ in MACROS] for r in band], dtype=float)
+            self.micros[sex] = np.array(
+                [[float(r[name]) for name in self.micronutrients]
+                 for r in band], dtype=float)
+
+    def band(self, sex, age):
+        """Index of the oldest band starting strictly below ``age``."""
+        return max(bisect_left(self.ages[sex], age) - 1, 0)
+
+    def goals(self, sex, age, height, weight, exercise):
+        """Returns the daily goals of one person as a dict."""
+        energy = tdee(sex, age, height, weight, exercise)
+        i = self.band(sex, age)
+        goals = {'calories': energy}
+        for (name, kcal), (low, high) in zip(MACROS, self.macros[sex][i]):
+            goals[name + '_low'] = (low * energy) / (100 * kcal)
+            goals[name] = (high * energy) / (100 * kcal)
+        goals['sat_fat'] = int((.1 * energy) / 9)
+        goals['sugar'] = int((.1 * energy) / 4)
+        goals['fiber'] = int(.014 * energy)
+        for name, value in zip(self.micronutrients, self.micros[sex][i]):
+            goals[name] = float(value)
+        return goals
+
+    def goals_batch(self, sex, age, height, weight, exercise):
+        """Computes the goals of many people at once.
+
+        Takes equal length sequences and returns an array with one row per
+        person and one column per entry of ``self.fields``.
+        """
+        sex = np.asarray(sex)
+        age = np.asarray(age, dtype=float)
+        height = np.asarray(height, dtype=float)
+        weight = np.asarray(weight, dtype=float)
+        exercise = np.asarray(exercise, dtype=float)
+        female = sex == 'F'
+        energy = exercise * (10 * weight + 625 * height - 5 * age
+                             + np.where(female, -161, 5))
+
+        macros = np.empty((len(sex), len(MACROS), 2))
+        micros = np.empty((len(sex), len(self.micronutrients)))
+        for s in self.ages:
+            mask = sex == s
+            if not mask.any():
+                continue
+            bands = np.searchsorted(self.ages[s], age[mask], side='left') - 1
+            bands = np.clip(bands, 0, None)
+            macros[mask] = self.macros[s][bands]
+            micros[mask] = self.micros[s][bands]
+
+        kcal = np.array([k for _, k in MACROS], dtype=float)
+        grams = macros * energy[:, None, None] / (100 * kcal[None, :, None])
+        out = np.empty((len(sex), len(self.fields)))
+        out[:, 0] = energy
+        out[:, 1], out[:, 2] = grams[:, 0, 1], grams[:, 0, 0]
+        out[:, 3], out[:, 4] = grams[:, 1, 1], grams[:, 1, 0]
+        out[:, 5] = np.trunc(.014 * energy)
+        out[:, 6] = np.trunc((.1 * energy) / 4)
+        out[:, 7], out[:, 8] = grams[:, 2, 1], grams[:, 2, 0]
+        out[:, 9] = np.trunc((.1 * energy) / 9)
+        out[:, len(GOAL_FIELDS):] = micros
+        return out
+
+
+_table = None
+
+
+def get_table():
+    """Returns the process wide DRI table, loading it on first use."""
+    global _table
+    if _table is None:
+        _table = DRITable()
+    return _table
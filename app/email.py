@@ -1,17 +1,164 @@
-from threading import Thread
+import atexit
+import queue
+import smtplib
+import threading
+import weakref
 from flask import current_app
 from flask_mail import Message
 from app import mail
 
+_STOP = object()
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+# Queues still in use, drained by one handler when the process exits.
+_live = weakref.WeakSet()
+
+
+@atexit.register
+def _shutdown_all():
+    for mail_queue in list(_live):
+        mail_queue.shutdown()
+
+
+def _work(ref, messages):
+    # Holds the MailQueue only while sending, so a discarded app and its
+    # queue can be collected; that stops the workers.
+    stop = False
+    while not stop:
+        batch = [messages.get()]
+        mail_queue = ref()
+        if mail_queue is None:
+            messages.task_done()
+            return
+        while batch[-1] is not _STOP and len(batch) < mail_queue.batch_size:
+            try:
+                batch.append(messages.get_nowait())
+            except queue.Empty:
+                break
+        if batch[-1] is _STOP:
+            stop = True
+            batch.pop()
+        try:
+            mail_queue._send(batch)
+        finally:
+            for _ in range(len(batch) + stop):
+                messages.task_done()
+        del mail_queue
+
+
+def _stop_workers(messages, count):
+    # Workers blocked on a full queue find the MailQueue gone anyway.
+    for _ in range(count):
+        try:
+            messages.put_nowait(_STOP)
+        except queue.Full:
+            return
+
+
+class MailQueueFull(Exception):
+    """Raised when a message can't be queued within MAIL_QUEUE_TIMEOUT."""
+
+
+class MailQueue(object):
+    """Sends mail from a bounded queue on a fixed pool of worker threads.
+
+    Workers start with the first message. Each one takes up to
+    ``MAIL_BATCH_SIZE`` waiting messages at a time and sends them over a
+    single SMTP connection, reconnecting if the server drops it. Once
+    ``MAIL_QUEUE_SIZE`` messages are waiting, senders block for up to
+    ``MAIL_QUEUE_TIMEOUT`` seconds before MailQueueFull is raised. The
+    queue is drained when the process exits; an app that is discarded
+    earlier should call shutdown() first.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.size = app.config['MAIL_WORKERS']
+        self.batch_size = app.config['MAIL_BATCH_SIZE']
+        self.timeout = app.config['MAIL_QUEUE_TIMEOUT']
+        self.queue = queue.Queue(app.config['MAIL_QUEUE_SIZE'])
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        _live.add(self)
+
+    def put(self, msg):
+        with self._lock:
+            if not self._threads:
+                self._threads = [threading.Thread(
+                    target=_work, args=(weakref.ref(self), self.queue),
+                    name='mail-worker-{}'.format(i), daemon=True)
+                    for i in range(self.size)]
+                for thread in self._threads:
+                    thread.start()
+                weakref.finalize(self, _stop_workers, self.queue,
+                                 self.size)
+        try:
+            self.queue.put(msg, timeout=self.timeout)
+        except queue.Full:
+            raise MailQueueFull('{} messages are waiting to be sent'.format(
+                self.queue.maxsize))
+
+    def join(self):
+        """Blocks until every queued message was sent or given up on."""
+        self.queue.join()
+
+    def _send(self, batch):
+        # Messages are sent and counted one by one, so one refused message
+        # doesn't lose the rest of the batch. A dropped connection is
+        # reopened, but a message that drops it twice is given up on.
+        pending = batch[::-1]
+        sent = failed = 0
+        retried = None
+        while pending:
+            try:
+                with self.app.app_context():
+                    with mail.connect() as connection:
+                        with self._lock:
+                            self.connections += 1
+                        while pending:
+                            try:
+                                connection.send(pending[-1])
+                                sent += 1
+                            except smtplib.SMTPServerDisconnected:
+                                raise
+                            except Exception:
+                                self.app.logger.exception(
+                                    'Could not send an email')
+                                failed += 1
+                            pending.pop()
+            except smtplib.SMTPServerDisconnected:
+                if pending and pending[-1] is not retried:
+                    retried = pending[-1]
+                elif pending:
+                    self.app.logger.exception('Could not send an email')
+                    failed += 1
+                    pending.pop()
+            except Exception:
+                self.app.logger.exception('Could not send {} emails'.format(
+                    len(pending)))
+                failed += len(pending)
+                break
+        with self._lock:
+            self.sent += sent
+            self.failed += failed
+
+    def shutdown(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self.queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'sent': self.sent,
+                'failed': self.failed, 'connections': self.connections}
 
 
 def send_email(subject, sender, recipients, text_body, html_body):
     msg = Message(subject, sender=sender, recipients=recipients)
     msg.body = text_body
     msg.html = html_body
-    Thread(target=send_async_email,
-           args=(current_app._get_current_object(), msg)).start()
+    current_app.extensions['mail_queue'].put(msg)
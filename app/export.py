@@ -0,0 +1,92 @@
+"""Streaming export of a user's meal plans with per-item nutrients.
+
+Rows come from one joined query read in chunks with ``yield_per`` and are
+encoded as they arrive, so memory stays flat whatever the account size.
+Plans without food items are exported as one row with empty item fields.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from app import db
+from app.models import NUTRIENTS, FoodItem, MealPlan, NutritionInfo
+
+COLUMNS = ('mealplan_id', 'mealplan_name', 'length', 'timestamp',
+           'fooditem_id', 'fooditem_name', 'no_servings') + NUTRIENTS
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+CHUNK_ROWS = 1000
+
+
+def export_rows(user_id, chunk=CHUNK_ROWS):
+    """Yields one tuple in COLUMNS order per food item of the user's plans."""
+    query = db.select(
+        MealPlan.id, MealPlan.name, MealPlan.length, MealPlan.timestamp,
+        FoodItem.id, FoodItem.name, FoodItem.no_servings,
+        *[getattr(NutritionInfo, attr) for attr in NUTRIENTS]).outerjoin(
+            FoodItem, FoodItem.mealplan_id == MealPlan.id).outerjoin(
+                NutritionInfo, NutritionInfo.food_id == FoodItem.food_id) \
+        .where(MealPlan.user_id == user_id) \
+        .order_by(MealPlan.id, FoodItem.id)
+    result = db.session.execute(query.execution_options(yield_per=chunk))
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _value(value):
+    return value.isoformat() + 'Z' if isinstance(value, datetime) else value
+
+
+def csv_chunks(rows, size=CHUNK_ROWS):
+    """Encodes rows as CSV text, a header and then ``size`` rows a chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in _batched(rows, size):
+        writer.writerows([_value(v) for v in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, size=CHUNK_ROWS):
+    """Encodes rows as one JSON object per line, ``size`` lines a chunk."""
+    for batch in _batched(rows, size):
+        yield ''.join(json.dumps(dict(zip(COLUMNS, map(_value, row)))) + '\n'
+                      for row in batch)
+
+
+ENCODERS = {'csv': csv_chunks, 'ndjson': ndjson_chunks}
+
+
+def gzip_chunks(chunks, level=6):
+    """Compresses a stream of text chunks into a gzip byte stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_mealplans(user_id, format='csv', compress=False):
+    """The export of a user's plans as a generator of str, or of bytes
+    when ``compress`` is set."""
+    chunks = ENCODERS[format](export_rows(user_id))
+    return gzip_chunks(chunks) if compress else chunks
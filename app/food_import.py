@@ -0,0 +1,186 @@
+"""Streaming import of food composition dumps in long format.
+
+Each record holds one nutrient of one food: a food code, the food's name,
+the nutrient and its amount per serving. Records of a food must be
+consecutive, as they are in dumps sorted by food. CSV files need a header
+row; JSON files hold one object per line (NDJSON).
+"""
+import csv
+import json
+import os
+from datetime import datetime
+from time import perf_counter
+from app import db
+from app.models import NUTRIENTS, NUTRIENT_LABELS, Food, FoodImport
+
+FORMATS = {'.csv': 'csv', '.json': 'ndjson', '.jsonl': 'ndjson',
+           '.ndjson': 'ndjson'}
+DEFAULT_COLUMNS = {'code': 'food_code', 'name': 'food_name',
+                   'nutrient': 'nutrient', 'amount': 'amount'}
+
+
+def nutrient_lookup(aliases=None):
+    """Maps lowercased source nutrient names to NutritionInfo columns.
+
+    Column names and the labels shown in the app are always recognised;
+    ``aliases`` adds the names a particular dataset uses.
+    """
+    lookup = {attr.lower(): attr for attr in NUTRIENTS}
+    lookup.update((label.lower(), attr)
+                  for attr, label in zip(NUTRIENTS, NUTRIENT_LABELS))
+    for name, attr in (aliases or {}).items():
+        if attr not in NUTRIENTS:
+            raise ValueError('Unknown nutrient column {!r} for {!r}'.format(
+                attr, name))
+        lookup[name.strip().lower()] = attr
+    return lookup
+
+
+def _lines(f, position):
+    # Counts the bytes handed out so callers know where each record ends.
+    for line in f:
+        position[0] += len(line)
+        yield line.decode('utf-8')
+
+
+def csv_records(f, offset=0):
+    """Yields (start offset, record) pairs from a CSV file opened in binary.
+
+    Reading starts at ``offset``, which must be the start of a record, or
+    just after the header when it is 0.
+    """
+    header = f.readline()
+    fields = next(csv.reader([header.decode('utf-8-sig')]))
+    position = [max(offset, len(header))]
+    f.seek(position[0])
+    start = position[0]
+    for row in csv.reader(_lines(f, position)):
+        yield start, dict(zip(fields, row))
+        start = position[0]
+
+
+def ndjson_records(f, offset=0):
+    """Yields (start offset, record) pairs from a file of JSON lines."""
+    f.seek(offset)
+    position = offset
+    for line in f:
+        start, position = position, position + len(line)
+        if line.strip():
+            yield start, json.loads(line)
+
+
+READERS = {'csv': csv_records, 'ndjson': ndjson_records}
+
+
+def pivot(records, lookup, columns=DEFAULT_COLUMNS, skipped=None):
+    """Groups consecutive records of a food into one dict per food.
+
+    Each food has its ``code``, ``name``, the ``start`` offset of its first
+    record, the number of ``rows`` read and the ``values`` found. Records
+    for unknown nutrients or without a numeric amount are counted in
+    ``skipped['rows']`` and left out.
+    """
+    food = None
+    for start, record in records:
+        code = record.get(columns['code'])
+        if food is None or code != food['code']:
+            if food is not None:
+                yield food
+            food = {'code': code, 'name': record.get(columns['name']),
+                    'start': start, 'rows': 0, 'values': {}}
+        food['rows'] += 1
+        attr = lookup.get(str(record.get(columns['nutrient']) or '')
+                          .strip().lower())
+        try:
+            amount = float(record.get(columns['amount']))
+        except (TypeError, ValueError):
+            attr = None
+        if attr is None:
+            if skipped is not None:
+                skipped['rows'] = skipped.get('rows', 0) + 1
+            continue
+        food['values'][attr] = amount
+    if food is not None:
+        yield food
+
+
+class FoodImporter(object):
+    """Imports one file into the Food catalog in chunks of foods.
+
+    Foods and their nutrition info are written with one executemany
+    INSERT each per chunk, and the chunk is committed together with the
+    FoodImport row recording where the next one starts. Running again on
+    the same path resumes from there.
+    """
+
+    def __init__(self, path, format=None, chunk_size=5000,
+                 columns=DEFAULT_COLUMNS, aliases=None):
+        self.path = os.path.abspath(path)
+        self.format = format or FORMATS.get(
+            os.path.splitext(path)[1].lower())
+        if self.format not in READERS:
+            raise ValueError('Cannot tell the format of {}, pass one of '
+                             '{}'.format(path, ', '.join(READERS)))
+        self.chunk_size = chunk_size
+        self.columns = dict(DEFAULT_COLUMNS, **columns)
+        self.lookup = nutrient_lookup(aliases)
+        self.skipped = {'rows': 0}
+        self._name_length = Food.__table__.c.name.type.length
+
+    def job(self, restart=False):
+        """The FoodImport row for this file, new or reset as needed."""
+        size = os.path.getsize(self.path)
+        job = FoodImport.query.filter_by(path=self.path).first()
+        if job is None:
+            job = FoodImport(path=self.path, offset=0, foods=0, rows=0)
+            db.session.add(job)
+        elif restart:
+            job.offset, job.foods, job.rows = 0, 0, 0
+            job.started, job.finished = datetime.utcnow(), None
+        elif job.size != size:
+            raise ValueError('{} changed since it was last imported, '
+                             'restart the import instead'.format(self.path))
+        job.size = size
+        db.session.commit()
+        return job
+
+    def run(self, job, progress=None):
+        """Imports from ``job.offset`` to the end of the file.
+
+        ``progress`` is called with the job and the rows per second read
+        so far after each chunk. Returns the rate for the whole run.
+        """
+        started = perf_counter()
+        read = 0
+        chunk = []
+        with open(self.path, 'rb') as f:
+            foods = pivot(READERS[self.format](f, job.offset), self.lookup,
+                          self.columns, self.skipped)
+            for food in foods:
+                if len(chunk) == self.chunk_size:
+                    read += self._write(job, chunk, food['start'])
+                    chunk = []
+                    if progress is not None:
+                        progress(job, read / (perf_counter() - started))
+                chunk.append(food)
+        job.finished = datetime.utcnow()
+        read += self._write(job, chunk, job.size)
+        return read / max(perf_counter() - started, 1e-9)
+
+    def _write(self, job, chunk, offset):
+        if chunk:
+            self._insert_foods(chunk)
+        rows = sum(food['rows'] for food in chunk)
+        job.offset = offset
+        job.foods += len(chunk)
+        job.rows += rows
+        db.session.commit()
+        return rows
+
+    def _insert_foods(self, chunk):
+        # Foods with the values of one already in the catalog are skipped.
+        foods = {}
+        for food in chunk:
+            foods.setdefault(Food.digest_of(food['values']), (
+                (food['name'] or '')[:self._name_length], food['values']))
+        return Food.add_missing(foods, len(foods))
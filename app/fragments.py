@@ -0,0 +1,99 @@
+"""Caching of rendered template fragments.
+
+Templates wrap markup in ``{% cache 'name', key... %}...{% endcache %}``.
+The body is rendered once per distinct key and locale and reused from the
+``fragments`` entry of ``app.extensions['caches']``, so keys must name
+everything the body shows, usually an id and a version. SQLite reuses the
+id of a deleted newest row, so a creation time goes in as well. Anything
+that changes with time, such as Flask-Moment's relative timestamps, has
+to be rendered client-side.
+
+The backend is a bounded in-process LRU, or a SharedCache over a
+Redis-like client when FRAGMENT_CACHE_URL is set so that workers share
+renders.
+"""
+import threading
+from hashlib import sha1
+from flask import current_app
+from flask_babel import get_locale
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from app.cache import TTLCache
+
+
+class SharedCache(object):
+    """Stores fragments in an external store such as Redis.
+
+    ``client`` needs ``get(key)`` and ``set(key, value, ex=seconds)``.
+    Hits and misses are counted in this process only.
+    """
+
+    def __init__(self, client, prefix='fragment:', ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        value = self.client.get(self.prefix + key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            return default
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'backend': 'shared', 'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None}
+
+
+def make_backend(config):
+    """The fragment cache backend the configuration asks for."""
+    url = config['FRAGMENT_CACHE_URL']
+    if url:
+        import redis
+        return SharedCache(redis.Redis.from_url(url),
+                           ttl=config['FRAGMENT_CACHE_TTL'])
+    return TTLCache(config['FRAGMENT_CACHE_SIZE'],
+                    config['FRAGMENT_CACHE_TTL'])
+
+
+def fragment_key(name, parts, locale):
+    return sha1(repr((name, locale) + tuple(parts)).encode(
+        'utf-8')).hexdigest()
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the ``{% cache name, key... %}`` tag to templates."""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        parts = []
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        args.append(nodes.List(parts))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', args), [], [],
+                               body).set_lineno(lineno)
+
+    def _cache(self, name, parts, caller):
+        cache = current_app.extensions['caches']['fragments']
+        key = fragment_key(name, parts, str(get_locale()))
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, str(html))
+        return Markup(html)
@@ -0,0 +1,111 @@
+import atexit
+import threading
+import weakref
+from datetime import datetime
+from time import monotonic
+from flask import current_app
+
+# Buffers still in use, flushed by one handler when the process exits.
+_live = weakref.WeakSet()
+
+
+@atexit.register
+def _shutdown_all():
+    for buffer in list(_live):
+        buffer.shutdown()
+
+
+def _flush_periodically(ref, stop, interval):
+    # Holds the buffer only while flushing, so a discarded app and its
+    # buffer can be collected, which stops the thread.
+    while not stop.wait(interval):
+        buffer = ref()
+        if buffer is None:
+            return
+        try:
+            buffer.flush()
+        except Exception:
+            buffer.app.logger.exception('Could not write last_seen times')
+        del buffer
+
+
+class LastSeenBuffer(object):
+    """Collects last_seen times in memory and writes them in bulk.
+
+    A user is recorded at most once every ``LAST_SEEN_MIN_INTERVAL``
+    seconds. A daemon thread writes whatever is pending every
+    ``LAST_SEEN_FLUSH_INTERVAL`` seconds as one executemany UPDATE, and the
+    buffer is flushed one last time when the process exits. An app that
+    is discarded earlier should call shutdown() first.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.min_interval = app.config['LAST_SEEN_MIN_INTERVAL']
+        self.flush_interval = app.config['LAST_SEEN_FLUSH_INTERVAL']
+        self._pending = {}
+        self._recorded = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        weakref.finalize(self, self._stop.set)
+        _live.add(self)
+
+    def touch(self, user_id, when=None):
+        now = monotonic()
+        with self._lock:
+            last = self._recorded.get(user_id)
+            if last is not None and now - last < self.min_interval:
+                return
+            self._recorded[user_id] = now
+            self._pending[user_id] = when or datetime.utcnow()
+            if self._thread is None and self.flush_interval:
+                self._thread = threading.Thread(
+                    target=_flush_periodically, args=(
+                        weakref.ref(self), self._stop, self.flush_interval),
+                    name='last-seen-flusher', daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """Writes pending times to the database, returns how many."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            cutoff = monotonic() - self.min_interval
+            self._recorded = {user_id: t for user_id, t in
+                              self._recorded.items() if t > cutoff}
+        if not pending:
+            return 0
+        from app import db
+        from app.models import User
+        with self.app.app_context():
+            db.session.execute(db.update(User), [
+                {'id': user_id, 'last_seen': when}
+                for user_id, when in pending.items()])
+            db.session.commit()
+            db.session.remove()
+        return len(pending)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            self.app.logger.exception('Could not write last_seen times')
+
+
+class LastSeen(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['last_seen'] = LastSeenBuffer(app)
+
+    def touch(self, user_id):
+        current_app.extensions['last_seen'].touch(user_id)
+
+    def flush(self):
+        return current_app.extensions['last_seen'].flush()
@@ -1,8 +1,9 @@
 from flask_wtf import FlaskForm, Form
 from wtforms import (StringField, SubmitField, TextAreaField, IntegerField,
                       DecimalField, RadioField, SelectField, FieldList,
-                      FormField)
-from wtforms.validators import ValidationError, DataRequired, Length
+                      FormField, HiddenField, FloatField)
+from wtforms.validators import ValidationError, DataRequired, Length, \
+    NumberRange
 from app.models import User
 
 
@@ -41,34 +42,35 @@ class EditNutritionForm(FlaskForm):
     submit = SubmitField('Submit')
 
 class FoodItemForm(Form):
+    id = HiddenField()
     name = StringField('Food Item Name',  default='New Food Item')
     no_servings = DecimalField('Number of Servings Eaten', default=1)
-    calories = IntegerField('Calories (kcal)',  default=0)
-    protein = IntegerField('Protein (g)',  default=0)
-    carbs = IntegerField('Carbohydrates (g)',  default=0)
-    fiber = IntegerField('Fiber (g)',  default=0)
-    sugar = IntegerField('Added Sugars (g)',  default=0)
-    fat = IntegerField('Total Fat (g)',  default=0)
-    sat_fat = IntegerField('Saturated Fat (g)',  default=0)
-    calcium = IntegerField('Calcium (mg)',  default=0)
-    iron = IntegerField('Iron (mg)',  default=0)
-    magnesium = IntegerField('Magnesium (mg)',  default=0)
-    phosphorus = IntegerField('Phosphorus (mg)',  default=0)
-    potassium = IntegerField('Potassium (mg)',  default=0)
-    sodium = IntegerField('Sodium (mg)',  default=0)
-    zinc = IntegerField('Zinc (mg)',  default=0)
-    vitA = IntegerField('Vitamin A (mcg RAE)',  default=0)
-    vitE = IntegerField('Vitamin E (mg AT)',  default=0)
-    vitD = IntegerField('Vitamin D (IU)',  default=0)
-    vitC = IntegerField('Vitamin C (mg)',  default=0)
-    thiamin = IntegerField('Thiamin (mg)',  default=0)
-    riboflavin = IntegerField('Riboflavin (mg)',  default=0)
-    niacin = IntegerField('Niacin (mg)',  default=0)
-    vitB6 = IntegerField('Vitamin B6 (mg)',  default=0)
-    vitB12 = IntegerField('Vitamin B12 (mcg)',  default=0)
-    chlorine = IntegerField('Chlorine (mg)',  default=0)
-    vitK = IntegerField('Vitamin K (mcg)',  default=0)
-    folate = IntegerField('Folate (mcg DFE)',  default=0)
+    calories = FloatField('Calories (kcal)',  default=0)
+    protein = FloatField('Protein (g)',  default=0)
+    carbs = FloatField('Carbohydrates (g)',  default=0)
+    fiber = FloatField('Fiber (g)',  default=0)
+    sugar = FloatField('Added Sugars (g)',  default=0)
+    fat = FloatField('Total Fat (g)',  default=0)
+    sat_fat = FloatField('Saturated Fat (g)',  default=0)
+    calcium = FloatField('Calcium (mg)',  default=0)
+    iron = FloatField('Iron (mg)',  default=0)
+    magnesium = FloatField('Magnesium (mg)',  default=0)
+    phosphorus = FloatField('Phosphorus (mg)',  default=0)
+    potassium = FloatField('Potassium (mg)',  default=0)
+    sodium = FloatField('Sodium (mg)',  default=0)
+    zinc = FloatField('Zinc (mg)',  default=0)
+    vitA = FloatField('Vitamin A (mcg RAE)',  default=0)
+    vitE = FloatField('Vitamin E (mg AT)',  default=0)
+    vitD = FloatField('Vitamin D (IU)',  default=0)
+    vitC = FloatField('Vitamin C (mg)',  default=0)
+    thiamin = FloatField('Thiamin (mg)',  default=0)
+    riboflavin = FloatField('Riboflavin (mg)',  default=0)
+    niacin = FloatField('Niacin (mg)',  default=0)
+    vitB6 = FloatField('Vitamin B6 (mg)',  default=0)
+    vitB12 = FloatField('Vitamin B12 (mcg)',  default=0)
+    chlorine = FloatField('Chlorine (mg)',  default=0)
+    vitK = FloatField('Vitamin K (mcg)',  default=0)
+    folate = FloatField('Folate (mcg DFE)',  default=0)
     
 class MealPlanForm(FlaskForm):
     name = StringField('Meal Plan Name', default='New Meal Plan')
@@ -76,3 +78,12 @@ class MealPlanForm(FlaskForm):
     fooditems = FieldList(FormField(FoodItemForm))
     submit = SubmitField('Submit')
     
+
+class GenerateMealPlanForm(FlaskForm):
+    name = StringField('Meal Plan Name', default='Generated Meal Plan',
+                       validators=[DataRequired(), Length(max=40)])
+    length = IntegerField('Meal Plan Length (days)', default=7,
+                          validators=[DataRequired(), NumberRange(1, 365)])
+    max_items = IntegerField('Most Food Items per Day', default=8,
+                             validators=[DataRequired(), NumberRange(1, 20)])
+    submit = SubmitField('Generate')
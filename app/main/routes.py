@@ -1,31 +1,44 @@
-from datetime import datetime
-from flask import render_template, flash, redirect, url_for, request, g, current_app
+from hashlib import sha1
+from flask import render_template, flash, redirect, url_for, request, g, \
+    current_app, jsonify, stream_with_context, make_response, session
 from flask_login import current_user, login_required
-from app import db
-from app.main.forms import EditProfileForm, EmptyForm, EditNutritionForm, MealPlanForm
-from app.models import User, MealPlan, FoodItem, NutritionInfo
+from markupsafe import Markup
+from app import db, last_seen, adequacy, similar, search, planner, export, \
+    get_locale
+from app.main.forms import EditProfileForm, EmptyForm, EditNutritionForm, MealPlanForm, \
+    GenerateMealPlanForm
+from app.models import NUTRIENTS, User, MealPlan, NutritionInfo
 from app.main import bp
-from sqlalchemy import inspect
+from app.pagination import keyset_paginate
 
 
 @bp.before_app_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        last_seen.touch(current_user.id)
+
+
+@bp.route('/metrics')
+@login_required
+def metrics():
+    caches = current_app.extensions['caches']
+    return jsonify({'caches': {name: cache.stats()
+                               for name, cache in caches.items()},
+                    'mail': current_app.extensions['mail_queue'].stats()})
 
 
 @bp.route('/', methods=['GET', 'POST'])
 @bp.route('/index', methods=['GET', 'POST'])
 @login_required
 def index():
-    page = request.args.get('page', 1, type=int)
-    mealplans = current_user.followed_mealplans().paginate(
-        page=page, per_page=current_app.config['POSTS_PER_PAGE'],
-        error_out=False)
-    next_url = url_for('main.index', page=mealplans.next_num) \
+    query, columns = current_user.feed_source()
+    mealplans = keyset_paginate(
+        query.options(*MealPlan.card_options()), columns,
+        current_app.config['POSTS_PER_PAGE'],
+        after=request.args.get('after'), before=request.args.get('before'))
+    next_url = url_for('main.index', after=mealplans.next_cursor) \
         if mealplans.has_next else None
-    prev_url = url_for('main.index', page=mealplans.prev_num) \
+    prev_url = url_for('main.index', before=mealplans.prev_cursor) \
         if mealplans.has_prev else None
     return render_template('index.html', title='Home',
                            mealplans=mealplans.items, next_url=next_url,
@@ -35,31 +48,126 @@ def index():
 @bp.route('/explore')
 @login_required
 def explore():
-    page = request.args.get('page', 1, type=int)
-    mealplans = MealPlan.query.order_by(MealPlan.timestamp.desc()).paginate(
-        page=page, per_page=current_app.config['POSTS_PER_PAGE'],
-        error_out=False)
-    next_url = url_for('main.explore', page=mealplans.next_num) \
+    goals = current_user.info.vector if current_user.info is not None \
+        else None
+    if request.args.get('sort') == 'adequacy' and goals is not None:
+        return explore_by_adequacy(goals)
+    mealplans = keyset_paginate(
+        MealPlan.query.options(*MealPlan.card_options()),
+        (MealPlan.timestamp, MealPlan.id),
+        current_app.config['POSTS_PER_PAGE'],
+        after=request.args.get('after'), before=request.args.get('before'))
+    next_url = url_for('main.explore', after=mealplans.next_cursor) \
         if mealplans.has_next else None
-    prev_url = url_for('main.explore', page=mealplans.prev_num) \
+    prev_url = url_for('main.explore', before=mealplans.prev_cursor) \
         if mealplans.has_prev else None
+    scores = {}
+    if goals is not None:
+        scored = [m for m in mealplans.items if m.info is not None]
+        result = adequacy.score(adequacy.plan_matrix(
+            [m.info for m in scored]), goals)
+        scores = dict(zip([m.id for m in scored], result.scores.tolist()))
+    sort_url = url_for('main.explore', sort='adequacy') \
+        if goals is not None else None
     return render_template('index.html', title='Explore',
                            mealplans=mealplans.items, next_url=next_url,
-                           prev_url=prev_url)
+                           prev_url=prev_url, scores=scores,
+                           sort_url=sort_url)
+
+
+def explore_by_adequacy(goals):
+    """Explore ordered by how well each plan meets the viewer's goals."""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['POSTS_PER_PAGE']
+    rows = db.session.execute(db.select(
+        NutritionInfo.mealplan_id, NutritionInfo.packed).where(
+            NutritionInfo.mealplan_id != None,
+            NutritionInfo.packed != None)).all()
+    ids, scores = adequacy.rank_catalog(rows, goals)
+    start = (page - 1) * per_page
+    page_ids = ids[start:start + per_page].tolist()
+    found = {m.id: m for m in MealPlan.query.options(
+        *MealPlan.card_options()).filter(MealPlan.id.in_(page_ids))}
+    mealplans = [found[id] for id in page_ids if id in found]
+    next_url = url_for('main.explore', sort='adequacy', page=page + 1) \
+        if start + per_page < len(ids) else None
+    prev_url = url_for('main.explore', sort='adequacy', page=page - 1) \
+        if page > 1 else None
+    return render_template('index.html', title='Explore',
+                           mealplans=mealplans, next_url=next_url,
+                           prev_url=prev_url,
+                           scores=dict(zip(page_ids, scores[
+                               start:start + per_page].tolist())),
+                           sort_url=url_for('main.explore'))
+
+
+def render_similar(target, title, exclude=()):
+    """Lists the plans nearest to a target daily nutrient profile."""
+    nearest = similar.get_index().query(
+        target, k=current_app.config['SIMILAR_RESULTS'], exclude=exclude)
+    ids = [id for id, _ in nearest]
+    found = {m.id: m for m in MealPlan.query.options(
+        *MealPlan.card_options()).filter(MealPlan.id.in_(ids))}
+    return render_template('index.html', title=title,
+                           mealplans=[found[id] for id in ids if id in found])
+
+
+@bp.route('/similar')
+@login_required
+def similar_to_goals():
+    if current_user.info is None:
+        flash('Set your nutrition goals to find plans that match them.')
+        return redirect(url_for('main.edit_nutrition'))
+    return render_similar(similar.goal_target(current_user.info.vector),
+                          'Closest to your goals')
+
+
+@bp.route('/<int:mealplan_id>/similar')
+@login_required
+def similar_to_mealplan(mealplan_id):
+    mealplan = MealPlan.query.options(*MealPlan.card_options()).filter_by(
+        id=mealplan_id).first()
+    if mealplan is None or mealplan.info is None:
+        flash('Meal plan not found.')
+        return redirect(url_for('main.index'))
+    return render_similar(mealplan.info.vector, 'Similar meal plans',
+                          exclude=(mealplan.id,))
+
+
+@bp.route('/search')
+@login_required
+def search_mealplans():
+    q = request.args.get('q', '')
+    ids = search.search_mealplans(q, current_app.config['POSTS_PER_PAGE'])
+    found = {m.id: m for m in MealPlan.query.options(
+        *MealPlan.card_options()).filter(MealPlan.id.in_(ids))}
+    return render_template('search.html', title='Search', q=q,
+                           mealplans=[found[id] for id in ids if id in found])
+
+
+@bp.route('/search/autocomplete')
+@login_required
+def autocomplete():
+    q = request.args.get('q', '')
+    return jsonify({'q': q, 'suggestions': search.suggest(
+        q, current_app.config['SEARCH_SUGGESTIONS'])})
 
 
 @bp.route('/user/<username>')
 @login_required
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
-    page = request.args.get('page', 1, type=int)
-    mealplans = user.mealplans.order_by(MealPlan.timestamp.desc()).paginate(
-        page=page, per_page=current_app.config['POSTS_PER_PAGE'],
-        error_out=False)
+    mealplans = keyset_paginate(
+        user.mealplans.options(*MealPlan.card_options()),
+        (MealPlan.timestamp, MealPlan.id),
+        current_app.config['POSTS_PER_PAGE'],
+        after=request.args.get('after'), before=request.args.get('before'))
     next_url = url_for('main.user', username=user.username,
-                       page=mealplans.next_num) if mealplans.has_next else None
+                       after=mealplans.next_cursor) \
+        if mealplans.has_next else None
     prev_url = url_for('main.user', username=user.username,
-                       page=mealplans.prev_num) if mealplans.has_prev else None
+                       before=mealplans.prev_cursor) \
+        if mealplans.has_prev else None
     form = EmptyForm()
     return render_template('user.html', user=user, mealplans=mealplans.items,
                            next_url=next_url, prev_url=prev_url, form=form)
@@ -166,18 +274,95 @@ def user_mealplans(username):
     return render_template('user_mealplans.html', user=user)
 
 
+@bp.route('/user/<username>/mealplans.<format>')
+@login_required
+def export_mealplans(username, format):
+    if username != current_user.username or format not in export.FORMATS:
+        flash('You can only export your own meal plans as CSV or NDJSON.')
+        return redirect(url_for('main.user_mealplans', username=username))
+    compress = request.args.get('gzip', type=int) == 1
+    filename = 'mealplans.' + format + ('.gz' if compress else '')
+    chunks = export.export_mealplans(current_user.id, format, compress)
+    return current_app.response_class(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else export.FORMATS[format],
+        headers={'Content-Disposition':
+                 'attachment; filename="{}"'.format(filename)})
+
+
+def show_mealplan_key(mealplan_id):
+    """What the rendered plan page depends on, or None if there is none.
+
+    Besides the plan version, the viewer's goals version and the locale,
+    the viewer's and the author's usernames are part of the key because
+    the page shows them. So is the plan's creation time, as SQLite hands
+    the id of a deleted newest plan to the next one, which starts over at
+    version 1.
+    """
+    row = db.session.execute(db.select(MealPlan.id, MealPlan.version,
+                                       MealPlan.timestamp,
+                                       User.username).outerjoin(
+        MealPlan.user).where(MealPlan.id == mealplan_id)).first()
+    if row is None:
+        return None
+    return ('show_mealplan', row.id, row.version, row.timestamp,
+            row.username,
+            current_user.id, current_user.username,
+            current_user.goals_version, get_locale())
+
+
+def render_ingredients(mealplan):
+    """The plan's ingredients table, which is the same for every viewer.
+
+    It is the bulk of the page, so it is kept in the ``pages`` cache under
+    the plan's id, version and creation time and the locale, while the
+    overview around it is rendered for each viewer.
+    """
+    pages = current_app.extensions['caches']['pages']
+    key = ('ingredients', mealplan.id, mealplan.version, mealplan.timestamp,
+           get_locale())
+    html = pages.get(key)
+    if html is None:
+        html = render_template('_ingredients.html',
+                               fooditems=mealplan.fooditems_with_info(),
+                               nutri_attrs=NUTRIENTS)
+        pages.set(key, html)
+    return Markup(html)
+
+
+def render_show_mealplan(mealplan_id):
+    mealplan = MealPlan.query.options(*MealPlan.card_options()).filter_by(
+        id=mealplan_id).first()
+    percent = status = None
+    if current_user.info is not None and mealplan.info is not None:
+        result = adequacy.score(mealplan.info.vector[:len(NUTRIENTS)],
+                                current_user.info.vector)
+        percent = result.percent[0].tolist()
+        status = [adequacy.STATUS_NAMES[s] for s in result.status[0].tolist()]
+    return render_template('show_mealplan.html', mealplan=mealplan,
+                           ingredients=render_ingredients(mealplan),
+                           percent=percent, status=status)
+
+
 @bp.route('/<mealplan_id>')
 @login_required
 def show_mealplan(mealplan_id):
-    mealplan = MealPlan.query.filter_by(id=mealplan_id).first()
-    if mealplan is None:
+    key = show_mealplan_key(mealplan_id)
+    if key is None:
         flash('Meal plan not found.')
         return redirect(url_for('main.index'))
-    nutri_attrs = inspect(NutritionInfo).columns.keys()[1:-3]
-    nutri_attrs.remove('protein_low')
-    nutri_attrs.remove('fat_low')
-    nutri_attrs.remove('carbs_low')
-    return render_template('show_mealplan.html', mealplan=mealplan, nutri_attrs=nutri_attrs)
+    if session.get('_flashes'):
+        # The page shows pending messages once, so it can't be revalidated.
+        return render_show_mealplan(mealplan_id)
+    etag = sha1(repr(key).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render_show_mealplan(mealplan_id))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 @bp.route('/<mealplan_id>/form', methods=['POST', 'GET'])
@@ -199,20 +384,8 @@ def mealplan_form(mealplan_id):
     form = MealPlanForm()
     if form.validate_on_submit():
         mealplan.name = form.name.data
-        mealplan.length = form.length.data
         mealplan.user = current_user
-        for item in mealplan.fooditems:
-            db.session.delete(item)
-        for fooditem_data in form.fooditems.data:
-            fooditem = FoodItem()
-            db.session.add(fooditem)
-            fooditem.mealplan = mealplan
-            fooditem.name = fooditem_data['name']
-            fooditem.no_servings = fooditem_data['no_servings']
-            fooditem.info = NutritionInfo()
-            for field, value in fooditem_data.items():
-                setattr(fooditem.info, field, value)
-        mealplan.set_nutri_info()
+        mealplan.update_fooditems(form.fooditems.data, form.length.data)
         db.session.commit()
         flash('Meal plan '+ flashcomment + '!')
         return redirect(url_for('main.index', username=current_user.username))
@@ -224,6 +397,33 @@ def mealplan_form(mealplan_id):
     return render_template('mealplan_form.html', title=(mealplan.name), form=form)
 
 
+@bp.route('/generate', methods=['GET', 'POST'])
+@login_required
+def generate_mealplan():
+    if current_user.info is None:
+        flash('Set your nutrition goals before generating a meal plan.')
+        return redirect(url_for('main.edit_nutrition'))
+    form = GenerateMealPlanForm()
+    if form.validate_on_submit():
+        pool = planner.get_pool().shortlist(
+            current_user.info.vector, current_app.config['PLANNER_POOL_SIZE'])
+        plan = planner.solve(pool, current_user.info.vector,
+                             max_items=form.max_items.data)
+        if not len(plan.indexes):
+            flash('There are no foods in the catalog to build a plan from.')
+            return redirect(url_for('main.generate_mealplan'))
+        mealplan = planner.create_mealplan(current_user, form.name.data,
+                                           form.length.data, pool, plan)
+        db.session.commit()
+        if plan.cost > 0:
+            flash('Meal plan generated, but it misses some of your goals.')
+        else:
+            flash('Meal plan generated!')
+        return redirect(url_for('main.show_mealplan', mealplan_id=mealplan.id))
+    return render_template('generic_form.html', title='Generate a Meal Plan',
+                           form=form)
+
+
 @bp.route('/<mealplan_id>/delete')
 def delete_mealplan(mealplan_id):
     mealplan = MealPlan.query.filter_by(id=mealplan_id).first()
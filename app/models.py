@@ -1,18 +1,101 @@
 from datetime import datetime
-from hashlib import md5
+from hashlib import md5, sha1
 from time import time
+from types import MappingProxyType
 from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-import jwt, sys
-import pandas as pd
-from app import db, login
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+import jwt
+import numpy as np
+from app import db, login, dri, passwords
+
+
+# Nutrients tracked for food items and meal plans, in display order.
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fiber', 'sugar', 'fat', 'sat_fat',
+             'calcium', 'iron', 'magnesium', 'phosphorus', 'potassium',
+             'sodium', 'zinc', 'vitA', 'vitE', 'vitD', 'vitC', 'thiamin',
+             'riboflavin', 'niacin', 'vitB6', 'vitB12', 'chlorine', 'vitK',
+             'folate')
+
+NUTRIENT_LABELS = ('Calories (kcal)', 'Protein (g)', 'Carbohydrates (g)',
+                   'Fiber (g)', 'Added Sugars (g)', 'Total Fat (g)',
+                   'Saturated Fat (g)', 'Calcium (mg)', 'Iron (mg)',
+                   'Magnesium (mg)', 'Phosphorus (mg)', 'Potassium (mg)',
+                   'Sodium (mg)', 'Zinc (mg)', 'Vitamin A (mcg RAE)',
+                   'Vitamin E (mg AT)', 'Vitamin D (IU)', 'Vitamin C (mg)',
+                   'Thiamin (mg)', 'Riboflavin (mg)', 'Niacin (mg)',
+                   'Vitamin B6 (mg)', 'Vitamin B12 (mcg)', 'Chlorine (mg)',
+                   'Vitamin K (mcg)', 'Folate (mcg DFE)')
+
+# Goals give a (low, high) range for the macros and an upper limit for added
+# sugar and saturated fat; the other goals are minimums.
+RANGE_NUTRIENTS = {'protein': 'protein_low', 'carbs': 'carbs_low',
+                   'fat': 'fat_low'}
+LIMIT_NUTRIENTS = ('sugar', 'sat_fat')
+GOAL_ATTRS = NUTRIENTS + tuple(RANGE_NUTRIENTS.values())
+
+# Fixed order of the values packed into NutritionInfo.packed
+VECTOR_ATTRS = GOAL_ATTRS
+VECTOR_DTYPE = np.dtype('<f8')
+
+_DISPLAY_ROWS = tuple((attr, label, RANGE_NUTRIENTS.get(attr))
+                      for attr, label in zip(NUTRIENTS, NUTRIENT_LABELS))
+
+
+def pack_nutrients(values):
+    """Packs values in VECTOR_ATTRS order, None as NaN, into bytes."""
+    return np.asarray(values, dtype=VECTOR_DTYPE).tobytes()
+
+
+def unpack_nutrients(packed):
+    """A read-only array over packed bytes, sharing their memory."""
+    return np.frombuffer(packed, dtype=VECTOR_DTYPE)
+
+
+def insert_returning_ids(table, rows):
+    """Inserts rows with one executemany and returns their ids in order."""
+    if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+        return db.session.scalars(table.insert().returning(
+            table.c.id, sort_by_parameter_order=True), rows).all()
+    # Without RETURNING for executemany the ids are fetched one by one.
+    return [db.session.execute(table.insert(), row).inserted_primary_key[0]
+            for row in rows]
+
+
+def insert_ignoring_conflicts(table, rows, *columns):
+    """Inserts rows with one executemany, skipping any whose values in the
+    unique ``columns`` are taken, also by a concurrent transaction."""
+    dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+    dialect = dialects.get(db.engine.dialect.name)
+    if dialect is not None:
+        statement = dialect.insert(table).on_conflict_do_nothing(
+            index_elements=columns)
+    else:
+        # MySQL
+        statement = table.insert().prefix_with('IGNORE')
+    db.session.execute(statement, rows)
 
 
 followers = db.Table(
     'followers',
-    db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('follower_id', db.Integer, db.ForeignKey('user.id'),
+              index=True),
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'),
+              index=True)
+)
+
+# Materialized home timelines: one row per meal plan shown to a user, written
+# when the plan is created so the home page is a range read on one index.
+timeline = db.Table(
+    'timeline',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'),
+              primary_key=True),
+    db.Column('mealplan_id', db.Integer, db.ForeignKey('mealplan.id'),
+              primary_key=True),
+    db.Column('timestamp', db.DateTime),
+    db.Index('ix_timeline_user_id_timestamp', 'user_id', 'timestamp')
 )
 
 
@@ -20,7 +103,7 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     about_me = db.Column(db.String(140))
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -31,6 +114,17 @@ class User(UserMixin, db.Model):
     exercise = db.Column(db.Float)
     sex = db.Column(db.String(1))
 
+    # Cleared once the user has too many followers to copy each new meal
+    # plan into their timelines; followers then read the full query.
+    timeline_fanout = db.Column(db.Boolean, default=True,
+                                server_default=db.true())
+
+    # Kept up to date by follow() and unfollow(), see recount_follows()
+    followers_count = db.Column(db.Integer, default=0, server_default='0')
+    followed_count = db.Column(db.Integer, default=0, server_default='0')
+    goals_version = db.Column(db.Integer, nullable=False, default=0,
+                              server_default='0')
+
     # Relationships
     followed = db.relationship(
         'User', secondary=followers,
@@ -42,14 +136,34 @@ class User(UserMixin, db.Model):
     mealplans = db.relationship('MealPlan', back_populates='user',
                             lazy='dynamic', cascade="all, delete-orphan")
 
+    _followed_ids = None
+
     def __repr__(self):
         return '<User {}>'.format(self.username)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+
+    @staticmethod
+    def authenticate(username, password):
+        """The user with these credentials, or None.
+
+        Unknown usernames cost as much as a wrong password. A hash made
+        with an outdated method or cost is replaced, for the caller to
+        commit.
+        """
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            passwords.dummy_verify(password)
+            return None
+        if not user.check_password(password):
+            return None
+        if passwords.needs_rehash(user.password_hash):
+            user.set_password(password)
+        return user
 
     def avatar(self, size):
         digest = md5(self.email.lower().encode('utf-8')).hexdigest()
@@ -59,16 +173,67 @@ class User(UserMixin, db.Model):
     def follow(self, user):
         if not self.is_following(user):
             self.followed.append(user)
+            self.followed_ids().add(user.id)
+            self._adjust_count('followed_count', 1)
+            user._adjust_count('followers_count', 1)
+            plans = db.select(db.literal(self.id), MealPlan.id,
+                              MealPlan.timestamp).where(
+                MealPlan.user_id == user.id, ~db.exists().where(
+                    timeline.c.user_id == self.id,
+                    timeline.c.mealplan_id == MealPlan.id))
+            db.session.execute(timeline.insert().from_select(
+                ['user_id', 'mealplan_id', 'timestamp'], plans))
 
     def unfollow(self, user):
         if self.is_following(user):
             self.followed.remove(user)
+            self.followed_ids().discard(user.id)
+            self._adjust_count('followed_count', -1)
+            user._adjust_count('followers_count', -1)
+            db.session.execute(timeline.delete().where(
+                timeline.c.user_id == self.id,
+                timeline.c.mealplan_id.in_(db.select(MealPlan.id).where(
+                    MealPlan.user_id == user.id))))
 
     def is_following(self, user):
-        return self.followed.filter(
-            followers.c.followed_id == user.id).count() > 0
+        return user.id in self.followed_ids()
+
+    def _adjust_count(self, attr, delta):
+        # Stored users are changed in SQL so that concurrent requests, or a
+        # stale cached snapshot of this user, cannot lose an update.
+        if db.inspect(self).persistent:
+            setattr(self, attr, getattr(User, attr) + delta)
+        else:
+            setattr(self, attr, (getattr(self, attr) or 0) + delta)
+
+    def followed_ids(self):
+        """Ids of the followed users, loaded once per instance.
+
+        User instances live for one request, so this is a request scoped
+        cache that follow() and unfollow() keep current.
+        """
+        if self._followed_ids is None:
+            self._followed_ids = set(db.session.scalars(
+                db.select(followers.c.followed_id).where(
+                    followers.c.follower_id == self.id)))
+        return self._followed_ids
 
     def followed_mealplans(self):
+        query, (timestamp, id) = self.feed_source()
+        return query.order_by(timestamp.desc(), id.desc())
+
+    def feed_source(self):
+        """Returns the unsorted home page query and its sort key columns."""
+        if self.followed.filter_by(timeline_fanout=False).first() is not None:
+            query = self.followed_mealplans_query().order_by(None)
+            return query, (MealPlan.timestamp, MealPlan.id)
+        query = MealPlan.query.join(
+            timeline, timeline.c.mealplan_id == MealPlan.id).filter(
+                timeline.c.user_id == self.id)
+        return query, (timeline.c.timestamp, timeline.c.mealplan_id)
+
+    def followed_mealplans_query(self):
+        """Builds the home page from the follow graph at read time."""
         followed = MealPlan.query.join(
             followers, (followers.c.followed_id == MealPlan.user_id)).filter(
                 followers.c.follower_id == self.id)
@@ -88,43 +253,96 @@ class User(UserMixin, db.Model):
         except:
             return
         return User.query.get(id)
+
+    def get_api_token(self, expires_in=3600):
+        return jwt.encode(
+            {'api': self.id, 'exp': time() + expires_in},
+            current_app.config['SECRET_KEY'], algorithm='HS256')
+
+    @staticmethod
+    def verify_api_token(token):
+        try:
+            id = jwt.decode(token, current_app.config['SECRET_KEY'],
+                            algorithms=['HS256'])['api']
+        except:
+            return
+        return load_user(id)
     
     def set_nutri_info(self):
         if self.info is None:
             self.info = NutritionInfo()
-        sex = -161 if self.sex == 'F' else 5
-        TDEE = float(self.exercise) * (10 * float(self.weight) + 6.25 * 100 * float(self.height) - 5 * float(self.age) + sex)
-        all_goals = pd.read_csv('app/static/micronutrients.csv')
-        indiv_goals = all_goals[(all_goals.sex == self.sex) & (all_goals.age < self.age)].nlargest(1, 'age').squeeze()
-        
-        # Finds the gram values (upper and lower range) for macronutrients
-        find_g = {'protein':4, 'carbs':4, 'fat':9}
-        for key, value in find_g.items():
-            lower_upper = list(map(int, indiv_goals.at[key + '_p'].split('-')))
-            indiv_goals.at[key + '_low'] = (lower_upper[0] * TDEE) / (100 * value)
-            indiv_goals.at[key] = (lower_upper[1] * TDEE) / (100 * value)
-
-        # Finds the gram values for sat fat sugar and fiber
-        indiv_goals.at['sat_fat'] = int((.1 * TDEE) / 9)
-        indiv_goals.at['sugar'] = int((.1 * TDEE) / 4)
-        indiv_goals.at['fiber'] = int(.014 * TDEE)
-        indiv_goals.iloc[2] = TDEE
-
-        # fixes up labels
-        indiv_goals.drop(labels=['rowtype', 'sex', 'protein_p', 'carbs_p',
-                                'sugar_p', 'fat_p', 'sat_fat_p'], inplace=True)
-        indiv_goals.rename({'age':'calories'}, inplace=True)
-
-        indiv_goals = indiv_goals.to_dict()
-        for key, value in indiv_goals.items():
+        self.goals_version = (self.goals_version or 0) + 1
+        goals = dri.get_table().goals(self.sex, self.age, self.height,
+                                      self.weight, self.exercise)
+        for key, value in goals.items():
             setattr(self.info, key, value)
-        
 
+    @staticmethod
+    def set_nutri_info_many(users):
+        """Recomputes the goals of many users in one vectorized pass."""
+        users = [u for u in users if u.height is not None]
+        if not users:
+            return
+        table = dri.get_table()
+        goals = table.goals_batch([u.sex for u in users],
+                                  [u.age for u in users],
+                                  [u.height for u in users],
+                                  [u.weight for u in users],
+                                  [u.exercise for u in users])
+        for user, row in zip(users, goals.tolist()):
+            if user.info is None:
+                user.info = NutritionInfo()
+            user.goals_version = (user.goals_version or 0) + 1
+            for key, value in zip(table.fields, row):
+                setattr(user.info, key, value)
 
 
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    """Loads the logged in user, from a snapshot cache when possible.
+
+    A cache hit rebuilds the User from its cached column values and
+    attaches it to the session without a query; relationships still load
+    lazily. Snapshots are dropped when a change to the user row made
+    through the ORM is committed and otherwise expire after USER_CACHE_TTL
+    seconds. Each worker has its own cache, so a change made in another
+    worker shows only once the snapshot here expires.
+    """
+    cache = current_app.extensions['caches']['users']
+    id = int(id)
+    snapshot = cache.get(id)
+    if snapshot is None:
+        user = db.session.get(User, id)
+        if user is not None:
+            cache.set(id, {attr.key: getattr(user, attr.key)
+                           for attr in db.inspect(User).column_attrs})
+        return user
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def _evict_user(mapper, connection, target):
+    # Evicting at flush would let another request cache the old row again
+    # before the commit, so it waits for the commit.
+    db.inspect(target).session.info.setdefault('evict_users', set()).add(
+        target.id)
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _evict_committed_users(session):
+    ids = session.info.pop('evict_users', None)
+    if ids:
+        cache = current_app.extensions['caches']['users']
+        for id in ids:
+            cache.pop(id)
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _keep_rolled_back_users(session):
+    session.info.pop('evict_users', None)
 
 
 class NutritionInfo(db.Model):
@@ -164,27 +382,64 @@ class NutritionInfo(db.Model):
     # Relationships
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     mealplan_id = db.Column(db.Integer, db.ForeignKey('mealplan.id'))
-    fooditem_id = db.Column(db.Integer, db.ForeignKey('fooditem.id'))
+    food_id = db.Column(db.Integer, db.ForeignKey('food.id'))
+
+    # The columns above packed as float64 in VECTOR_ATTRS order, refreshed
+    # on every insert and update
+    packed = db.Column(db.LargeBinary)
 
     def __repr__(self):
         return '<NutritionInfo {}>'.format(self.id)
+
+    @property
+    def vector(self):
+        """The nutrient values as a float64 array in VECTOR_ATTRS order.
+
+        Missing values are NaN. While the row is unchanged this is a
+        read-only view of ``packed`` and nothing is copied.
+        """
+        if self.packed is not None and not db.inspect(self).modified:
+            return unpack_nutrients(self.packed)
+        return np.array([getattr(self, attr) for attr in VECTOR_ATTRS],
+                        dtype=VECTOR_DTYPE)
+
+    @vector.setter
+    def vector(self, values):
+        values = np.asarray(values, dtype=VECTOR_DTYPE)
+        for attr, value in zip(VECTOR_ATTRS, values.tolist()):
+            setattr(self, attr, None if value != value else value)
+        self.packed = values.tobytes()
+
+    def nutrients(self):
+        """The NUTRIENTS part of the vector with missing values as 0."""
+        return np.nan_to_num(self.vector[:len(NUTRIENTS)])
     
     def get_data(self, display=False):
-        data = self.__dict__
-        is_user_info = True if User.query.filter_by(info=self).first() != None else False
-        del (data['_sa_instance_state'], data['id'], data['user_id'],
-            data['mealplan_id'], data['fooditem_id'])
-        if not is_user_info:
-            del data['protein_low'], data['carbs_low'], data['fat_low']
-        if display:
-            data = {'Calories (kcal)': int(self.calories), 'Protein (g)': int(self.protein), 'Carbohydrates (g)': self.carbs, 'Fiber (g)': int(self.fiber), 'Added Sugars (g)': str(int(self.sugar)), 'Total Fat (g)': int(self.fat), 'Saturated Fat (g)': str(int(self.sat_fat)), 'Calcium (mg)': int(self.calcium), 'Iron (mg)': int(self.iron), 'Magnesium (mg)': int(self.magnesium), 'Phosphorus (mg)': int(self.phosphorus), 'Potassium (mg)': int(self.potassium), 'Sodium (mg)': int(self.sodium), 'Zinc (mg)': int(self.zinc), 'Vitamin A (mcg RAE)': int(self.vitA), 'Vitamin E (mg AT)': int(self.vitE), 'Vitamin D (IU)': int(self.vitD), 'Vitamin C (mg)': int(self.vitC), 'Thiamin (mg)': int(self.thiamin), 'Riboflavin (mg)': int(self.riboflavin), 'Niacin (mg)': int(self.niacin), 'Vitamin B6 (mg)': int(self.vitB6), 'Vitamin B12 (mcg)': int(self.vitB12), 'Chlorine (mg)': int(self.chlorine), 'Vitamin K (mcg)': int(self.vitK), 'Folate (mcg DFE)': int(self.folate)}
-            if is_user_info:
-                data['Protein (g)'] = str(int(self.protein_low)) + '-' + str(int(self.protein))
-                data['Carbohydrates (g)'] = str(int(self.carbs_low)) + '-' + str(int(self.carbs))
-                data['Total Fat (g)'] = str(int(self.fat_low)) + '-' + str(int(self.fat))
-                data['Added Sugars (g)'] = '<' + str(int(self.sugar))
-                data['Saturated Fat (g)'] = '<' + str(int(self.sat_fat))
-        return data
+        """Returns the nutrient values as a read-only mapping.
+
+        User goal rows, recognised by their user_id, also include the low
+        ends of the macro ranges. With ``display`` the keys are labels and
+        the values are formatted for the templates, goals as ranges and
+        upper limits.
+        """
+        is_user_info = self.user_id is not None
+        if not display:
+            attrs = GOAL_ATTRS if is_user_info else NUTRIENTS
+            return MappingProxyType({attr: getattr(self, attr)
+                                     for attr in attrs})
+        data = {}
+        for attr, label, low in _DISPLAY_ROWS:
+            value = int(getattr(self, attr) or 0)
+            if not is_user_info:
+                data[label] = value
+            elif low is not None:
+                data[label] = '{}-{}'.format(int(getattr(self, low) or 0),
+                                             value)
+            elif attr in LIMIT_NUTRIENTS:
+                data[label] = '<{}'.format(value)
+            else:
+                data[label] = value
+        return MappingProxyType(data)
 
 
 class MealPlan(db.Model):
@@ -193,10 +448,16 @@ class MealPlan(db.Model):
     name = db.Column(db.String(40))
     length = db.Column(db.Integer)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
 
     # Relationships
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user = db.relationship('User', back_populates='mealplans')
+
+    __table_args__ = (
+        db.Index('ix_mealplan_user_id_timestamp', 'user_id', 'timestamp'),
+    )
     info = db.relationship('NutritionInfo', uselist=False,
                            cascade="all, delete-orphan")
     fooditems = db.relationship('FoodItem', back_populates='mealplan',
@@ -204,29 +465,331 @@ class MealPlan(db.Model):
 
     def __repr__(self):
         return '<NutritionInfo {}>'.format(self.name)
+
+    def bump_version(self):
+        """Marks the plan as changed so cached renderings of it go stale."""
+        self.version = (self.version or 0) + 1
+
+    @staticmethod
+    def card_options():
+        """Loader options for lists rendered with _mealplan.html."""
+        return (joinedload(MealPlan.user), joinedload(MealPlan.info))
+
+    def fooditems_with_info(self):
+        """The plan's items with their nutrition info loaded alongside."""
+        return self.fooditems.options(*FoodItem.info_options()).all()
     
     def get_item_data(self):
         item_data = []
-        for fooditem in self.fooditems:
-            item_info = fooditem.info.__dict__
-            print(item_info, file=sys.stderr)
-            item_info.pop('_sa_instance_state')
-            item_info.pop('id')
-            item_info['name'] = fooditem.name
-            item_data.append(fooditem.info.__dict__)
+        for fooditem in self.fooditems_with_info():
+            data = {attr: getattr(fooditem.info, attr) for attr in NUTRIENTS}
+            data['id'] = fooditem.id
+            data['name'] = fooditem.name
+            data['no_servings'] = fooditem.no_servings
+            item_data.append(data)
         return item_data
 
+    def update_fooditems(self, rows, length):
+        """Applies submitted food item rows to the plan.
+
+        Rows carrying the id of one of the plan's items update that item
+        when something changed, rows without a known id are inserted and
+        stored items missing from ``rows`` are deleted. The daily averages
+        are then adjusted by the change in totals rather than recomputed.
+        """
+        rebuild = self.id is not None and (self.info is None or
+                                           not self.length)
+        if self.info is None:
+            self.info = NutritionInfo()
+        self.bump_version()
+        totals = np.zeros(len(NUTRIENTS))
+        stored = {}
+        if self.id is not None:
+            if not rebuild:
+                totals = self.info.nutrients() * self.length
+            stored = {item.id: item for item in
+                      self.fooditems.options(*FoodItem.info_options())}
+
+        changed = []
+        for row in rows:
+            item_id = str(row.get('id') or '')
+            item = stored.pop(int(item_id), None) if item_id.isdigit() else None
+            if item is None:
+                item = FoodItem(mealplan=self)
+                db.session.add(item)
+            elif item.matches(row):
+                continue
+            else:
+                totals -= item.totals()
+            changed.append((item, FoodItem._clean(row)))
+        foods = Food.intern_many([data for _, data in changed])
+        for (item, data), food in zip(changed, foods):
+            item.set_data(data, food)
+            totals += item.totals()
+        for item in stored.values():
+            totals -= item.totals()
+            db.session.delete(item)
+
+        self.length = length
+        if rebuild:
+            self.set_nutri_info()
+        else:
+            for attr, value in zip(NUTRIENTS, (totals / length).tolist()):
+                setattr(self.info, attr, value)
+
     def set_nutri_info(self):
+        """Sets the plan's daily averages with a single aggregate query."""
         if (self.info is None):
             self.info = NutritionInfo()
-        averages = {'calories': 0,'protein': 0,'carbs': 0,'fiber': 0,'sugar': 0,'fat': 0,'sat_fat': 0,'calcium': 0,'iron': 0,'magnesium': 0,'phosphorus': 0,'potassium': 0,'sodium': 0,'zinc': 0,'vitA': 0,'vitE': 0,'vitD': 0,'vitC': 0,'thiamin': 0,'riboflavin': 0,'niacin': 0,'vitB6': 0,'vitB12': 0,'chlorine': 0,'vitK': 0,'folate': 0}
-        for attr in averages.keys():
-            for item in self.fooditems:
-                averages[attr] += (getattr(item.info, attr) * float(item.no_servings))
-            averages[attr] /= self.length
-            setattr(self.info, attr, averages[attr])
+        self.bump_version()
+        db.session.flush()
+        totals = db.session.query(*[
+            func.coalesce(func.sum(getattr(NutritionInfo, attr) *
+                                   FoodItem.no_servings), 0)
+            for attr in NUTRIENTS]).select_from(FoodItem).join(
+                NutritionInfo, NutritionInfo.food_id == FoodItem.food_id).filter(
+                    FoodItem.mealplan_id == self.id).one()
+        for attr, total in zip(NUTRIENTS, totals):
+            setattr(self.info, attr, total / self.length)
+
+    @staticmethod
+    def set_nutri_info_many(mealplans):
+        """Sets the daily averages of many plans with one grouped query."""
+        mealplans = list(mealplans)
+        if not mealplans:
+            return
+        db.session.flush()
+        rows = db.session.query(FoodItem.mealplan_id, *[
+            func.sum(getattr(NutritionInfo, attr) * FoodItem.no_servings)
+            for attr in NUTRIENTS]).join(
+                NutritionInfo, NutritionInfo.food_id == FoodItem.food_id).filter(
+                    FoodItem.mealplan_id.in_([m.id for m in mealplans])).group_by(
+                        FoodItem.mealplan_id)
+        totals = {row[0]: row[1:] for row in rows}
+        for mealplan in mealplans:
+            if mealplan.info is None:
+                mealplan.info = NutritionInfo()
+            mealplan.bump_version()
+            for attr, total in zip(NUTRIENTS, totals.get(
+                    mealplan.id, (0,) * len(NUTRIENTS))):
+                setattr(mealplan.info, attr, (total or 0) / mealplan.length)
+
+
+def _add_to_timelines(connection, mealplan_id):
+    plan = MealPlan.__table__
+    user_id = connection.scalar(
+        db.select(plan.c.user_id).where(plan.c.id == mealplan_id))
+    if user_id is None:
+        return
+    columns = ['user_id', 'mealplan_id', 'timestamp']
+    connection.execute(timeline.insert().from_select(columns, db.select(
+        plan.c.user_id, plan.c.id, plan.c.timestamp).where(
+            plan.c.id == mealplan_id)))
+
+    author = User.__table__
+    fanout, count = connection.execute(db.select(
+        author.c.timeline_fanout, author.c.followers_count).where(
+            author.c.id == user_id)).one()
+    if not fanout:
+        return
+    if (count or 0) > current_app.config['TIMELINE_FANOUT_LIMIT']:
+        connection.execute(author.update().where(
+            author.c.id == user_id).values(timeline_fanout=False))
+        return
+    connection.execute(timeline.insert().from_select(columns, db.select(
+        followers.c.follower_id, plan.c.id, plan.c.timestamp).where(
+            plan.c.id == mealplan_id,
+            followers.c.followed_id == plan.c.user_id)))
+
+
+def _remove_from_timelines(connection, mealplan_id):
+    connection.execute(timeline.delete().where(
+        timeline.c.mealplan_id == mealplan_id))
+
+
+@db.event.listens_for(MealPlan, 'after_insert')
+def _mealplan_inserted(mapper, connection, target):
+    _add_to_timelines(connection, target.id)
+
+
+@db.event.listens_for(MealPlan, 'after_update')
+def _mealplan_updated(mapper, connection, target):
+    if db.inspect(target).attrs.user_id.history.has_changes():
+        _remove_from_timelines(connection, target.id)
+        _add_to_timelines(connection, target.id)
+
+
+@db.event.listens_for(MealPlan, 'after_delete')
+def _mealplan_deleted(mapper, connection, target):
+    _remove_from_timelines(connection, target.id)
+
+
+def rebuild_timelines():
+    """Recreates every home timeline from the follow graph."""
+    author = User.__table__
+    plan = MealPlan.__table__
+    columns = ['user_id', 'mealplan_id', 'timestamp']
+    limit = current_app.config['TIMELINE_FANOUT_LIMIT']
+    counts = db.select(followers.c.followed_id).group_by(
+        followers.c.followed_id).having(func.count() > limit)
+    db.session.execute(timeline.delete())
+    db.session.execute(author.update().values(
+        timeline_fanout=~author.c.id.in_(counts)))
+    db.session.execute(timeline.insert().from_select(columns, db.select(
+        plan.c.user_id, plan.c.id, plan.c.timestamp).where(
+            plan.c.user_id != None)))
+    db.session.execute(timeline.insert().from_select(columns, db.select(
+        followers.c.follower_id, plan.c.id, plan.c.timestamp).join(
+            author, author.c.id == plan.c.user_id).join(
+                followers, followers.c.followed_id == author.c.id).where(
+                    author.c.timeline_fanout == db.true())))
+    db.session.commit()
+
+
+def recount_follows():
+    """Recomputes every user's follower and following counters."""
+    author = User.__table__
+    db.session.execute(author.update().values(
+        followers_count=db.select(func.count()).where(
+            followers.c.followed_id == author.c.id).scalar_subquery(),
+        followed_count=db.select(func.count()).where(
+            followers.c.follower_id == author.c.id).scalar_subquery()))
+    db.session.commit()
+
+
+@db.event.listens_for(NutritionInfo, 'before_insert')
+@db.event.listens_for(NutritionInfo, 'before_update')
+def _pack_nutrition_info(mapper, connection, target):
+    target.packed = pack_nutrients([getattr(target, attr)
+                                    for attr in VECTOR_ATTRS])
+
+
+class Food(db.Model):
+    """A canonical set of nutrient values shared by food items.
+
+    Items entered with the same numbers point at the same Food, found
+    through ``digest``, a hash of the values that is unique in the table.
+    """
+    __tablename__ = 'food'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(40))
+    digest = db.Column(db.String(40), index=True, unique=True)
+
+    info = db.relationship('NutritionInfo', uselist=False,
+                           cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return '<Food {}>'.format(self.name)
+
+    @staticmethod
+    def digest_of(data):
+        """Hex digest of the NUTRIENTS values in ``data``."""
+        values = np.nan_to_num(np.array([data.get(attr) or 0 for attr in
+                                         NUTRIENTS], dtype=VECTOR_DTYPE))
+        # Adding 0.0 turns -0.0 into 0.0 so that both hash the same.
+        return sha1((values + 0.0).tobytes()).hexdigest()
+
+    @staticmethod
+    def intern_many(rows):
+        """Returns a Food for each row, adding those not in the catalog.
+
+        Rows are mappings with a value for each of NUTRIENTS and a name.
+        The foods are interned with intern_ids and then loaded with their
+        info in one query.
+        """
+        ids = Food.intern_ids(rows)
+        if not ids:
+            return []
+        found = {food.id: food for food in Food.query.options(
+            joinedload(Food.info)).filter(Food.id.in_(set(ids)))}
+        return [found[id] for id in ids]
+
+    @staticmethod
+    def intern_ids(rows, chunk=500):
+        """Like intern_many, but set-based and returning Food ids.
+
+        Looks digests up ``chunk`` at a time and adds the missing foods
+        with add_missing, so no ORM objects are created. Meant for bulk
+        writes.
+        """
+        digests = [Food.digest_of(row) for row in rows]
+        found = {}
+        wanted = list(set(digests))
+        for start in range(0, len(wanted), chunk):
+            found.update(db.session.execute(db.select(
+                Food.digest, Food.id).where(Food.digest.in_(
+                    wanted[start:start + chunk]))).all())
+        missing = {}
+        for row, digest in zip(rows, digests):
+            if digest not in found and digest not in missing:
+                missing[digest] = (row.get('name'), {
+                    attr: float(row.get(attr) or 0) for attr in NUTRIENTS})
+        found.update(Food.add_missing(missing, chunk))
+        return [found[digest] for digest in digests]
+
+    @staticmethod
+    def add_missing(foods, chunk=500):
+        """Adds foods to the catalog unless their digest is there already.
+
+        ``foods`` maps digests to (name, nutrient values) pairs. Inserts
+        skip the digests that are taken, also by a concurrent
+        transaction, so each digest keeps exactly one Food; only the foods
+        that were inserted get nutrition info. Returns the id of the Food
+        for each digest.
+        """
+        ids = {}
+        digests = list(foods)
+        for start in range(0, len(digests), chunk):
+            part = digests[start:start + chunk]
+            insert_ignoring_conflicts(Food.__table__, [
+                {'name': foods[digest][0], 'digest': digest}
+                for digest in part], 'digest')
+            found = dict(db.session.execute(db.select(
+                Food.digest, Food.id).where(Food.digest.in_(part))).all())
+            with_info = set(db.session.scalars(db.select(
+                NutritionInfo.food_id).where(NutritionInfo.food_id.in_(
+                    found.values()))))
+            infos = []
+            for digest in part:
+                if found[digest] in with_info:
+                    continue
+                values = foods[digest][1]
+                infos.append(dict(
+                    {attr: values.get(attr) for attr in NUTRIENTS},
+                    food_id=found[digest], packed=pack_nutrients(
+                        [values.get(attr) for attr in VECTOR_ATTRS])))
+            if infos:
+                db.session.execute(NutritionInfo.__table__.insert(), infos)
+            ids.update(found)
+        return ids
+
+
+@db.event.listens_for(Food, 'before_insert')
+def _digest_food(mapper, connection, target):
+    if target.digest is None and target.info is not None:
+        target.digest = Food.digest_of(target.info.get_data())
+
+
+class FoodImport(db.Model):
+    """Progress of a ``flask food import`` run over one file.
+
+    ``offset`` is the byte position after the last food committed, saved
+    in the same transaction as the foods so that a resumed run neither
+    skips nor repeats any.
+    """
+    __tablename__ = 'food_import'
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), index=True, unique=True)
+    size = db.Column(db.BigInteger)
+    offset = db.Column(db.BigInteger, default=0)
+    foods = db.Column(db.Integer, default=0)
+    rows = db.Column(db.BigInteger, default=0)
+    started = db.Column(db.DateTime, default=datetime.utcnow)
+    finished = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<FoodImport {}>'.format(self.path)
 
-            
 
 class FoodItem(db.Model):
     __tablename__ = 'fooditem'
@@ -237,8 +800,42 @@ class FoodItem(db.Model):
     # Relationships
     mealplan_id = db.Column(db.Integer, db.ForeignKey('mealplan.id'))
     mealplan = db.relationship('MealPlan', back_populates='fooditems')
-    info = db.relationship('NutritionInfo', uselist=False,
-                           cascade="all, delete-orphan")
+    food_id = db.Column(db.Integer, db.ForeignKey('food.id'), index=True)
+    food = db.relationship('Food')
 
     def __repr__(self):
         return '<FoodItem {}>'.format(self.name)
+
+    @property
+    def info(self):
+        """The nutrition info of one serving, shared through the catalog."""
+        return self.food.info if self.food is not None else None
+
+    @staticmethod
+    def info_options():
+        """Loader options that fetch each item's food and info with it."""
+        return (joinedload(FoodItem.food).joinedload(Food.info),)
+
+    @staticmethod
+    def _clean(row):
+        data = {attr: float(row.get(attr) or 0) for attr in NUTRIENTS}
+        data['no_servings'] = float(row.get('no_servings') or 0)
+        data['name'] = row.get('name')
+        return data
+
+    def totals(self):
+        """The item's nutrients multiplied by its number of servings."""
+        return self.info.nutrients() * (self.no_servings or 0)
+
+    def matches(self, row):
+        """Whether a submitted row holds the values already stored."""
+        data = self._clean(row)
+        return (self.name == data['name'] and
+                self.no_servings == data['no_servings'] and
+                self.food is not None and
+                self.food.digest == Food.digest_of(data))
+
+    def set_data(self, data, food):
+        self.name = data['name']
+        self.no_servings = data['no_servings']
+        self.food = food
@@ -0,0 +1,66 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+def encode_cursor(timestamp, id):
+    """Packs a (timestamp, id) sort key into an opaque URL-safe token."""
+    raw = '{}|{}'.format(timestamp.isoformat(), id).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Unpacks a token made by encode_cursor, or returns None if invalid."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        timestamp, id = raw.decode('utf-8').split('|')
+        return datetime.fromisoformat(timestamp), int(id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage(object):
+    def __init__(self, items, has_next, has_prev, total=None):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return encode_cursor(self.items[-1].timestamp, self.items[-1].id)
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return encode_cursor(self.items[0].timestamp, self.items[0].id)
+
+
+def keyset_paginate(query, columns, per_page, after=None, before=None,
+                    count=False):
+    """Returns a page of ``query`` newest first, keyed on (timestamp, id).
+
+    ``columns`` are the timestamp and id columns the query is sorted on and
+    ``after``/``before`` are cursor tokens from a previous page. Each page
+    is a range read on those columns, so deep pages cost the same as the
+    first one. The total is only counted when ``count`` is set.
+    """
+    timestamp, id = columns
+    total = query.order_by(None).count() if count else None
+    before = decode_cursor(before)
+    after = decode_cursor(after) if before is None else None
+    if before is not None:
+        rows = query.filter(tuple_(timestamp, id) > tuple_(*before)) \
+            .order_by(timestamp.asc(), id.asc()).limit(per_page + 1).all()
+        items = rows[:per_page][::-1]
+        return KeysetPage(items, has_next=True,
+                          has_prev=len(rows) > per_page, total=total)
+    if after is not None:
+        query = query.filter(tuple_(timestamp, id) < tuple_(*after))
+    rows = query.order_by(timestamp.desc(), id.desc()) \
+        .limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page,
+                      has_prev=after is not None, total=total)
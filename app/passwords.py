@@ -0,0 +1,104 @@
+import atexit
+import secrets
+import threading
+import weakref
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Hashers still in use, whose pools one handler shuts down at exit.
+_live = weakref.WeakSet()
+
+
+@atexit.register
+def _shutdown_all():
+    for hasher in list(_live):
+        hasher.shutdown()
+
+
+class PasswordHasher(object):
+    """Hashes and verifies passwords on a pool of worker processes.
+
+    ``method`` is any Werkzeug hash method, such as ``pbkdf2:sha256:600000``
+    or ``scrypt:32768:8:1``. The pool has ``workers`` processes and starts
+    with the first hash; with 0 workers, the default, the work is done in
+    the calling thread. Either way the caller waits for the result, so a
+    pool only helps a process that serves requests on several threads: a
+    thread waiting on the pool leaves the interpreter to the others. Each
+    process has its own pool.
+    """
+
+    def __init__(self, method='pbkdf2', workers=0):
+        self.method = method
+        self.workers = workers
+        self._pool = None
+        self._dummy_hash = None
+        self._lock = threading.Lock()
+        _live.add(self)
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        with self._lock:
+            if self._pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                method = 'forkserver' if 'forkserver' in \
+                    multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context(
+                        method))
+        return self._pool.submit(func, *args).result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            self.dummy_verify(password)
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    @property
+    def dummy_hash(self):
+        """A hash of a random password made with the current method."""
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(secrets.token_hex(16))
+        return self._dummy_hash
+
+    def dummy_verify(self, password):
+        """Takes as long as verifying a real password, then fails."""
+        self._run(check_password_hash, self.dummy_hash, password)
+        return False
+
+    def needs_rehash(self, pwhash):
+        """Whether ``pwhash`` was made with another method or cost."""
+        return pwhash.split('$', 1)[0] != self.dummy_hash.split('$', 1)[0]
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+class Passwords(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['passwords'] = PasswordHasher(
+            app.config['PASSWORD_HASH_METHOD'],
+            app.config['PASSWORD_HASH_WORKERS'])
+
+    def hash(self, password):
+        return current_app.extensions['passwords'].hash(password)
+
+    def verify(self, pwhash, password):
+        return current_app.extensions['passwords'].verify(pwhash, password)
+
+    def dummy_verify(self, password):
+        return current_app.extensions['passwords'].dummy_verify(password)
+
+    def needs_rehash(self, pwhash):
+        return current_app.extensions['passwords'].needs_rehash(pwhash)
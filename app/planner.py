@@ -0,0 +1,203 @@
+"""Builds meal plans from the food catalog that meet a user's goals.
+
+The search works on one day. Each food is a vector of nutrients per
+serving and a plan is a vector of servings; its cost is the squared
+relative distance of the daily totals from the ranges adequacy.goal_bounds
+gives, so a plan inside every range costs nothing. Foods are added
+greedily, the one whose best serving count lowers the cost most first,
+then coordinate descent tunes the servings and items the plan does as
+well without are dropped to keep it short.
+"""
+from collections import namedtuple
+import numpy as np
+from flask import current_app
+from app import adequacy, db
+from app.models import NUTRIENTS, VECTOR_ATTRS, Food, FoodItem, MealPlan, \
+    NutritionInfo, unpack_nutrients
+
+# Serving counts tried for a food, per day: the whole range in steps of
+# SERVING_STEP, then FINE_STEP either side of the result.
+SERVING_STEP = 0.25
+FINE_STEP = 0.05
+MAX_SERVINGS = 4
+GREEDY_STEPS = np.array([0.5, 1, 1.5, 2, 3])
+
+# Greedy additions must lower the cost by at least this fraction.
+MIN_GAIN = 1e-6
+
+Plan = namedtuple('Plan', ['indexes', 'servings', 'cost'])
+
+
+class Pool(object):
+    """Foods to build plans from, as ids, names and a nutrient matrix."""
+
+    def __init__(self, ids, names, matrix):
+        self.ids = np.asarray(ids)
+        self.names = list(names)
+        self.matrix = np.nan_to_num(np.asarray(matrix, dtype=float))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, indexes):
+        return Pool(self.ids[indexes], [self.names[i] for i in indexes],
+                    self.matrix[indexes])
+
+    def shortlist(self, goals, size):
+        """A pool of at most ``size`` foods likely to help meet ``goals``.
+
+        Half are the foods that on their own bring the day closest to
+        the goals. The rest are the richest sources of each nutrient, so
+        the one good source of a mineral isn't cut.
+        """
+        if len(self) <= size:
+            return self
+        objective = Objective(goals)
+        gain = objective(np.zeros(len(NUTRIENTS))) - objective(self.matrix)
+        keep = set(np.argpartition(-gain, size // 2)[:size // 2].tolist())
+        columns = np.flatnonzero(objective.scale > 0)
+        per_nutrient = (size - len(keep)) // max(len(columns), 1)
+        if per_nutrient:
+            for column in columns.tolist():
+                keep.update(np.argpartition(
+                    -self.matrix[:, column], per_nutrient)[
+                    :per_nutrient].tolist())
+        return self.take(sorted(keep))
+
+    @classmethod
+    def from_catalog(cls, limit=None):
+        """The foods in the catalog with any nutrient values."""
+        query = db.select(Food.id, Food.name, NutritionInfo.packed).join(
+            NutritionInfo, NutritionInfo.food_id == Food.id).where(
+                NutritionInfo.packed != None).order_by(Food.id)
+        if limit is not None:
+            query = query.limit(limit)
+        rows = db.session.execute(query).all()
+        if not rows:
+            return cls([], [], np.empty((0, len(NUTRIENTS))))
+        matrix = unpack_nutrients(b''.join(row[2] for row in rows)).reshape(
+            -1, len(VECTOR_ATTRS))[:, :len(NUTRIENTS)]
+        pool = cls([row[0] for row in rows], [row[1] for row in rows],
+                   matrix)
+        useful = pool.matrix.any(axis=1)
+        if not useful.all():
+            pool = pool.take(np.flatnonzero(useful).tolist())
+        return pool
+
+
+def get_pool():
+    """Returns this app's pool of catalog foods, reloading it on changes.
+
+    Each worker holds its own copy. Foods are only ever added or removed,
+    never changed, so their count and highest id tell when to reload.
+    """
+    version = tuple(db.session.execute(db.select(
+        db.func.count(Food.id), db.func.max(Food.id))).one())
+    cached = current_app.extensions.get('planner_pool')
+    if cached is None or cached[0] != version:
+        cached = current_app.extensions['planner_pool'] = (
+            version, Pool.from_catalog())
+    return cached[1]
+
+
+class Objective(object):
+    """Squared shortfall and excess relative to each goal's target."""
+
+    def __init__(self, goals):
+        self.low, self.high, target = adequacy.goal_bounds(goals)
+        self.scale = np.divide(1, target, out=np.zeros_like(target),
+                               where=target > 0)
+
+    def __call__(self, totals):
+        """Cost of daily totals, over the last axis."""
+        short = np.maximum(self.low - totals, 0)
+        over = np.maximum(totals - self.high, 0)
+        over = np.where(np.isfinite(over), over, 0)
+        return (((short + over) * self.scale) ** 2).sum(axis=-1)
+
+
+def _tune(matrix, servings, objective, passes=4):
+    """Coordinate descent over the serving grid, one item at a time."""
+    coarse = np.arange(0, MAX_SERVINGS + SERVING_STEP / 2, SERVING_STEP)
+    fine = np.arange(-SERVING_STEP, SERVING_STEP + FINE_STEP / 2, FINE_STEP)
+    totals = servings @ matrix
+    for offsets in (None, fine):
+        for _ in range(passes):
+            changed = False
+            for i in range(len(servings)):
+                if offsets is None:
+                    grid = coarse
+                else:
+                    grid = np.round(np.clip(servings[i] + offsets, 0,
+                                            MAX_SERVINGS), 2)
+                rest = totals - servings[i] * matrix[i]
+                costs = objective(rest + grid[:, None] * matrix[i])
+                best = grid[np.argmin(costs)]
+                if best != servings[i]:
+                    servings[i] = best
+                    totals = rest + best * matrix[i]
+                    changed = True
+            if not changed:
+                break
+    return servings, float(objective(totals))
+
+
+def solve(pool, goals, max_items=12):
+    """Chooses foods from ``pool`` and daily servings meeting ``goals``.
+
+    ``goals`` is a user's nutrition goal vector in VECTOR_ATTRS order.
+    Returns a Plan with the chosen pool indexes, their daily servings and
+    the remaining cost, 0 when every range and minimum is met.
+    """
+    objective = Objective(goals)
+    matrix = pool.matrix
+    chosen = []
+    servings = np.empty(0)
+    totals = np.zeros(len(NUTRIENTS))
+    cost = float(objective(totals))
+    available = np.ones(len(pool), dtype=bool)
+    while len(chosen) < max_items and cost > 0 and available.any():
+        # Cost of adding each food at each step size: (foods, steps).
+        costs = objective(totals + GREEDY_STEPS[None, :, None] *
+                          matrix[:, None, :])
+        costs[~available] = np.inf
+        food, step = np.unravel_index(np.argmin(costs), costs.shape)
+        if cost - costs[food, step] <= MIN_GAIN * cost:
+            break
+        chosen.append(food)
+        available[food] = False
+        servings, cost = _tune(matrix[chosen], np.append(
+            servings, GREEDY_STEPS[step]), objective, passes=2)
+        totals = servings @ matrix[chosen]
+
+    chosen = np.array(chosen, dtype=int)
+    if len(chosen):
+        servings, cost = _tune(matrix[chosen], servings, objective)
+    # Drop, smallest first, the items the plan can do without.
+    dropped = True
+    while dropped and len(chosen) > 1:
+        dropped = False
+        for i in np.argsort(servings):
+            keep = np.arange(len(chosen)) != i
+            trial, trial_cost = _tune(matrix[chosen[keep]],
+                                      servings[keep].copy(), objective)
+            if trial_cost <= cost:
+                chosen, servings, cost = chosen[keep], trial, trial_cost
+                dropped = True
+                break
+    keep = servings > 0
+    return Plan(chosen[keep], servings[keep], cost)
+
+
+def create_mealplan(user, name, length, pool, plan):
+    """Saves a solved plan as an ordinary meal plan of ``length`` days."""
+    mealplan = MealPlan(name=name, length=length, user=user)
+    db.session.add(mealplan)
+    foods = {food.id: food for food in Food.query.filter(
+        Food.id.in_(pool.ids[plan.indexes].tolist()))}
+    for index, servings in zip(plan.indexes.tolist(), plan.servings.tolist()):
+        food = foods[int(pool.ids[index])]
+        db.session.add(FoodItem(name=food.name, no_servings=servings * length,
+                                food=food, mealplan=mealplan))
+    mealplan.set_nutri_info()
+    return mealplan
@@ -0,0 +1,286 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from time import monotonic
+from flask import current_app
+from sqlalchemy import DDL, text
+from sqlalchemy.orm import Session
+from app import db
+from app.models import MealPlan, FoodItem
+
+# Tables whose ``name`` column is searchable.
+SEARCHABLE = {'mealplan': MealPlan, 'fooditem': FoodItem}
+
+# Prefixes shorter than this are not looked up; FTS5 keeps prefix indexes
+# for 2 and 3 characters so that autocomplete does not scan the full index.
+MIN_PREFIX = 2
+
+# Autocomplete reads this many matches per wanted suggestion before
+# removing duplicate names, so popular foods cannot make it scan everything.
+SUGGEST_SCAN = 20
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(value):
+    """Lowercase words without diacritics, as FTS5's unicode61 splits them."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return _TOKEN.findall(value.lower())
+
+
+def fts_ddl(table):
+    """Statements creating the FTS5 index of ``table`` and its triggers."""
+    return [
+        "CREATE VIRTUAL TABLE {0}_fts USING fts5(name, content='{0}', "
+        "content_rowid='id', prefix='2 3', "
+        "tokenize='unicode61 remove_diacritics 2')".format(table),
+        "CREATE TRIGGER {0}_fts_ai AFTER INSERT ON {0} BEGIN "
+        "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+        "END".format(table),
+        "CREATE TRIGGER {0}_fts_ad AFTER DELETE ON {0} BEGIN "
+        "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+        "VALUES ('delete', old.id, old.name); END".format(table),
+        "CREATE TRIGGER {0}_fts_au AFTER UPDATE OF name ON {0} BEGIN "
+        "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+        "VALUES ('delete', old.id, old.name); "
+        "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+        "END".format(table),
+    ]
+
+
+for _table, _model in SEARCHABLE.items():
+    for _statement in fts_ddl(_table):
+        db.event.listen(_model.__table__, 'after_create',
+                        DDL(_statement).execute_if(dialect='sqlite'))
+    db.event.listen(_model.__table__, 'before_drop', DDL(
+        'DROP TABLE IF EXISTS {}_fts'.format(_table)).execute_if(
+            dialect='sqlite'))
+
+
+class FTSBackend(object):
+    """Searches the SQLite FTS5 tables that the triggers keep in sync."""
+
+    def match(self, table, query, limit):
+        """Ids of rows whose name matches ``query``, newest first."""
+        expression = self._expression(query)
+        if expression is None:
+            return []
+        return db.session.scalars(text(
+            'SELECT rowid FROM {0}_fts WHERE {0}_fts MATCH :q '
+            'ORDER BY rowid DESC LIMIT :limit'.format(table)),
+            {'q': expression, 'limit': limit}).all()
+
+    def suggest(self, table, query, limit):
+        """Up to ``limit`` distinct names completing ``query``."""
+        expression = self._expression(query)
+        if expression is None:
+            return []
+        names = db.session.scalars(text(
+            'SELECT name FROM {0}_fts WHERE {0}_fts MATCH :q '
+            'ORDER BY rowid DESC LIMIT :limit'.format(table)),
+            {'q': expression, 'limit': limit * SUGGEST_SCAN})
+        return _distinct(names, limit)
+
+    @staticmethod
+    def _expression(query):
+        tokens = tokenize(query)
+        if not tokens or len(tokens[-1]) < MIN_PREFIX:
+            return None
+        return ' '.join('"{}"'.format(t) for t in tokens) + '*'
+
+
+class _Postings(object):
+    def __init__(self):
+        self.names = {}
+        self.tokens = {}
+        self.terms = []
+        self.dirty = False
+
+    def add(self, id, name):
+        self.names[id] = name
+        for token in set(tokenize(name)):
+            ids = self.tokens.get(token)
+            if ids is None:
+                ids = self.tokens[token] = set()
+                self.dirty = True
+            ids.add(id)
+
+    def discard(self, id):
+        name = self.names.pop(id, None)
+        for token in set(tokenize(name)):
+            ids = self.tokens.get(token)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.tokens[token]
+                    self.dirty = True
+
+    def prefixed(self, prefix):
+        if self.dirty:
+            self.terms = sorted(self.tokens)
+            self.dirty = False
+        ids = set()
+        for i in range(bisect_left(self.terms, prefix), len(self.terms)):
+            if not self.terms[i].startswith(prefix):
+                break
+            ids |= self.tokens[self.terms[i]]
+        return ids
+
+    def match(self, tokens):
+        sets = [self.tokens.get(t, set()) for t in tokens[:-1]]
+        sets.append(self.prefixed(tokens[-1]))
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+
+class InvertedIndex(object):
+    """Token to id postings held in memory, for databases without FTS5.
+
+    Built from the database on first use and rebuilt after
+    SEARCH_INDEX_MAX_AGE seconds; ORM saves made by this process are
+    applied when they are committed.
+    """
+
+    def __init__(self):
+        self.built_at = None
+        self._tables = {table: _Postings() for table in SEARCHABLE}
+        self._lock = threading.Lock()
+
+    def build(self):
+        tables = {}
+        for table, model in SEARCHABLE.items():
+            postings = tables[table] = _Postings()
+            for id, name in db.session.execute(
+                    db.select(model.id, model.name)):
+                postings.add(id, name)
+        with self._lock:
+            self._tables = tables
+            self.built_at = monotonic()
+
+    def add(self, table, id, name):
+        with self._lock:
+            postings = self._tables[table]
+            postings.discard(id)
+            postings.add(id, name)
+
+    def discard(self, table, id):
+        with self._lock:
+            self._tables[table].discard(id)
+
+    def match(self, table, query, limit):
+        tokens = tokenize(query)
+        if not tokens or len(tokens[-1]) < MIN_PREFIX:
+            return []
+        with self._lock:
+            ids = self._tables[table].match(tokens)
+        return heapq.nlargest(limit, ids)
+
+    def suggest(self, table, query, limit):
+        ids = self.match(table, query, limit * SUGGEST_SCAN)
+        with self._lock:
+            names = self._tables[table].names
+            return _distinct((names.get(id) for id in ids), limit)
+
+
+def _distinct(names, limit):
+    seen = {}
+    for name in names:
+        if name and name.lower() not in seen:
+            seen[name.lower()] = name
+            if len(seen) == limit:
+                break
+    return list(seen.values())
+
+
+def get_backend():
+    """Returns this app's search backend, FTS5 on SQLite by default.
+
+    SEARCH_BACKEND can force 'fts' or 'memory'.
+    """
+    backend = current_app.extensions.get('search')
+    if backend is None:
+        kind = current_app.config['SEARCH_BACKEND'] or (
+            'fts' if db.engine.dialect.name == 'sqlite' else 'memory')
+        backend = current_app.extensions['search'] = \
+            FTSBackend() if kind == 'fts' else InvertedIndex()
+    if isinstance(backend, InvertedIndex):
+        max_age = current_app.config['SEARCH_INDEX_MAX_AGE']
+        if backend.built_at is None or \
+                monotonic() - backend.built_at > max_age:
+            backend.build()
+    return backend
+
+
+def search_mealplans(query, limit):
+    """Ids of meal plans named like ``query`` or holding a food named so."""
+    backend = get_backend()
+    ids = backend.match('mealplan', query, limit)
+    if len(ids) < limit:
+        fooditem_ids = backend.match('fooditem', query, limit * SUGGEST_SCAN)
+        if fooditem_ids:
+            ids += [id for id in db.session.scalars(
+                db.select(FoodItem.mealplan_id).distinct().where(
+                    FoodItem.id.in_(fooditem_ids),
+                    FoodItem.mealplan_id.not_in(ids)).order_by(
+                        FoodItem.mealplan_id.desc()).limit(
+                            limit - len(ids)))]
+    return ids
+
+
+def suggest(query, limit):
+    """Autocomplete names, meal plans before foods."""
+    backend = get_backend()
+    names = backend.suggest('mealplan', query, limit)
+    if len(names) < limit:
+        names = _distinct(names + backend.suggest('fooditem', query, limit),
+                          limit)
+    return names
+
+
+# Changes wait in session.info until the commit, so a rolled back save
+# never reaches the index. Each (table, id) maps to its name, or to None
+# once the row is deleted.
+def _pending_changes(target):
+    index = current_app.extensions.get('search')
+    if isinstance(index, InvertedIndex) and index.built_at is not None:
+        return db.inspect(target).session.info.setdefault('search', {})
+    return None
+
+
+def _indexed_saved(mapper, connection, target):
+    changes = _pending_changes(target)
+    if changes is not None:
+        changes[target.__tablename__, target.id] = target.name
+
+
+def _indexed_deleted(mapper, connection, target):
+    changes = _pending_changes(target)
+    if changes is not None:
+        changes[target.__tablename__, target.id] = None
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _apply_indexed_changes(session):
+    changes = session.info.pop('search', None)
+    index = current_app.extensions.get('search')
+    if not changes or not isinstance(index, InvertedIndex):
+        return
+    for (table, id), name in changes.items():
+        if name is None:
+            index.discard(table, id)
+        else:
+            index.add(table, id, name)
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _discard_indexed_changes(session):
+    session.info.pop('search', None)
+
+
+for _model in SEARCHABLE.values():
+    db.event.listen(_model, 'after_insert', _indexed_saved)
+    db.event.listen(_model, 'after_update', _indexed_saved)
+    db.event.listen(_model, 'after_delete', _indexed_deleted)
@@ -0,0 +1,192 @@
+import threading
+from time import monotonic
+import numpy as np
+from flask import current_app
+from sqlalchemy.orm import Session
+from app import db, dri
+from app.models import NUTRIENTS, RANGE_NUTRIENTS, VECTOR_ATTRS, \
+    NutritionInfo, unpack_nutrients
+
+# Plans are compared per day, each nutrient divided by the goals of a
+# reference adult so that milligrams of sodium do not drown out grams of
+# fiber.
+REFERENCE_PERSON = ('M', 40, 1.75, 70, 1.55)
+
+
+def reference_scale():
+    goals = dri.get_table().goals(*REFERENCE_PERSON)
+    reference = np.array([goals[attr] for attr in NUTRIENTS], dtype=float)
+    return np.where(reference > 0, 1 / reference, 0).astype(np.float32)
+
+
+def goal_target(goals):
+    """The plan profile a goal vector asks for, ranges at their midpoint."""
+    goals = np.nan_to_num(np.asarray(goals, dtype=float))
+    target = goals[:len(NUTRIENTS)].copy()
+    for attr, low_attr in RANGE_NUTRIENTS.items():
+        i = NUTRIENTS.index(attr)
+        target[i] = (target[i] + goals[VECTOR_ATTRS.index(low_attr)]) / 2
+    return target
+
+
+class PlanIndex(object):
+    """In-memory nearest neighbour index over meal plan daily averages.
+
+    Vectors are kept scaled in one float32 matrix that grows by doubling;
+    queries scan it in blocks of ``block`` rows keeping a running top-k,
+    so memory use per query stays bounded and the result is exact.
+    """
+
+    def __init__(self, scale, block=65536):
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.block = block
+        self.built_at = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, len(self.scale)), dtype=np.float32)
+        self._size = 0
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _prepare(self, vector):
+        vector = np.nan_to_num(np.asarray(vector, dtype=np.float32))
+        return vector[..., :len(self.scale)] * self.scale
+
+    def build(self, rows):
+        """Replaces the contents with (mealplan id, vector) rows."""
+        rows = list(rows)
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        vectors = self._prepare(np.array([row[1] for row in rows]).reshape(
+            len(rows), -1)) if rows else np.empty((0, len(self.scale)),
+                                                  dtype=np.float32)
+        with self._lock:
+            self._ids = ids
+            self._vectors = np.ascontiguousarray(vectors)
+            self._size = len(rows)
+            self._rows = {id: i for i, id in enumerate(ids.tolist())}
+            self.built_at = monotonic()
+
+    def upsert(self, id, vector):
+        vector = self._prepare(vector)
+        with self._lock:
+            row = self._rows.get(id)
+            if row is None:
+                if self._size == len(self._ids):
+                    capacity = max(16, 2 * self._size)
+                    ids = np.empty(capacity, dtype=np.int64)
+                    vectors = np.empty((capacity, len(self.scale)),
+                                       dtype=np.float32)
+                    ids[:self._size] = self._ids[:self._size]
+                    vectors[:self._size] = self._vectors[:self._size]
+                    self._ids, self._vectors = ids, vectors
+                row = self._size
+                self._size += 1
+                self._rows[id] = row
+                self._ids[row] = id
+            self._vectors[row] = vector
+
+    def remove(self, id):
+        with self._lock:
+            row = self._rows.pop(id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                moved = int(self._ids[last])
+                self._ids[row] = moved
+                self._vectors[row] = self._vectors[last]
+                self._rows[moved] = row
+            self._size = last
+
+    def query(self, vector, k=10, exclude=()):
+        """Returns up to ``k`` (mealplan id, distance) pairs, nearest first."""
+        target = self._prepare(vector)
+        exclude = set(exclude)
+        want = k + len(exclude)
+        best_ids = np.empty(0, dtype=np.int64)
+        best = np.empty(0, dtype=np.float32)
+        with self._lock:
+            for start in range(0, self._size, self.block):
+                stop = min(start + self.block, self._size)
+                diff = self._vectors[start:stop] - target
+                distances = np.einsum('ij,ij->i', diff, diff)
+                if len(distances) > want:
+                    keep = np.argpartition(distances, want)[:want]
+                else:
+                    keep = np.arange(len(distances))
+                best = np.concatenate([best, distances[keep]])
+                best_ids = np.concatenate([best_ids,
+                                           self._ids[start:stop][keep]])
+                if len(best) > want:
+                    keep = np.argpartition(best, want)[:want]
+                    best, best_ids = best[keep], best_ids[keep]
+        order = np.argsort(best, kind='stable')
+        results = [(id, float(np.sqrt(best[i])))
+                   for i, id in zip(order, best_ids[order].tolist())
+                   if id not in exclude]
+        return results[:k]
+
+
+def _load_rows():
+    rows = db.session.execute(db.select(
+        NutritionInfo.mealplan_id, NutritionInfo.packed).where(
+            NutritionInfo.mealplan_id != None,
+            NutritionInfo.packed != None)).all()
+    return [(id, unpack_nutrients(packed)) for id, packed in rows]
+
+
+def get_index():
+    """Returns this app's plan index, (re)building it when missing or old.
+
+    Each worker holds its own copy. Saves made through this process are
+    applied when they are committed; rebuilding after SIMILAR_INDEX_MAX_AGE seconds
+    picks up those made by other workers.
+    """
+    index = current_app.extensions.get('plan_index')
+    if index is None:
+        index = current_app.extensions['plan_index'] = PlanIndex(
+            reference_scale())
+    max_age = current_app.config['SIMILAR_INDEX_MAX_AGE']
+    if index.built_at is None or monotonic() - index.built_at > max_age:
+        index.build(_load_rows())
+    return index
+
+
+# Changes wait in session.info until the commit, so a rolled back save
+# never reaches the index. Each plan id maps to its vector, or to None
+# once the plan is deleted.
+@db.event.listens_for(NutritionInfo, 'after_insert')
+@db.event.listens_for(NutritionInfo, 'after_update')
+def _plan_info_saved(mapper, connection, target):
+    if 'plan_index' in current_app.extensions and \
+            target.mealplan_id is not None:
+        db.inspect(target).session.info.setdefault('plan_index', {})[
+            target.mealplan_id] = unpack_nutrients(target.packed)
+
+
+@db.event.listens_for(NutritionInfo, 'after_delete')
+def _plan_info_deleted(mapper, connection, target):
+    if 'plan_index' in current_app.extensions and \
+            target.mealplan_id is not None:
+        db.inspect(target).session.info.setdefault('plan_index', {})[
+            target.mealplan_id] = None
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _apply_plan_changes(session):
+    changes = session.info.pop('plan_index', None)
+    index = current_app.extensions.get('plan_index')
+    if not changes or index is None:
+        return
+    for id, vector in changes.items():
+        if vector is None:
+            index.remove(id)
+        else:
+            index.upsert(id, vector)
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _discard_plan_changes(session):
+    session.info.pop('plan_index', None)
@@ -0,0 +1,107 @@
+"""What importing the app costs a freshly started worker.
+
+profile() imports the WSGI module in two child processes, so nothing the
+caller loaded skews the numbers. One run gives the wall time, the peak
+RSS and, from ``python -X importtime``, each top-level package's own
+import time. The other traces allocations to report the memory each
+package's code still holds once the app is up.
+"""
+import json
+import os
+import subprocess
+import sys
+
+# Limits a worker's start must stay within, checked by tests.py.
+BUDGET_SECONDS = 2.5
+BUDGET_RSS_MIB = 150
+FORBIDDEN = ('alembic', 'flask_migrate', 'pandas')
+
+# ru_maxrss survives exec on Linux, so it can report the parent's peak;
+# VmHWM belongs to the new process image.
+_TIMED = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open('/proc/self/status') as f:
+        rss_kib = int(next(line for line in f
+                           if line.startswith('VmHWM:')).split()[1])
+except (OSError, StopIteration):
+    pass
+print(json.dumps({{'seconds': seconds, 'rss_kib': rss_kib,
+                  'modules': sorted(sys.modules)}}))
+'''
+
+_TRACED = '''
+import json, os, sys, tracemalloc
+tracemalloc.start()
+import {module}
+snapshot = tracemalloc.take_snapshot()
+roots = sorted((os.path.join(os.path.abspath(p or '.'), '')
+                for p in sys.path), key=len, reverse=True)
+memory = {{}}
+for stat in snapshot.statistics('filename'):
+    name = stat.traceback[0].filename
+    for root in roots:
+        if name.startswith(root):
+            name = name[len(root):].split(os.sep)[0]
+            break
+    name = name.rsplit('.py', 1)[0] if name.endswith('.py') else name
+    memory[name] = memory.get(name, 0) + stat.size
+print(json.dumps(memory))
+'''
+
+
+def _run(script, *options):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, *options, '-c', script],
+                            cwd=root, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def import_times(stderr):
+    """Self import time in seconds per top-level package."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        times[package] = times.get(package, 0) + int(own) / 1e6
+    return times
+
+
+def profile(module='nutritrack'):
+    """Imports ``module`` in fresh interpreters and reports the cost.
+
+    Returns a dict with the total ``seconds``, ``rss_mib``, the imported
+    ``modules`` and, per top-level package, its import ``times`` in
+    seconds and the bytes of ``memory`` it holds.
+    """
+    timed, stderr = _run(_TIMED.format(module=module), '-X', 'importtime')
+    memory, _ = _run(_TRACED.format(module=module))
+    return {'seconds': timed['seconds'],
+            'rss_mib': timed['rss_kib'] / 1024,
+            'modules': timed['modules'],
+            'times': import_times(stderr),
+            'memory': memory}
+
+
+def over_budget(report):
+    """Descriptions of every way ``report`` breaks the budget."""
+    problems = []
+    if report['seconds'] > BUDGET_SECONDS:
+        problems.append('import took {:.2f} s, the budget is {} s'.format(
+            report['seconds'], BUDGET_SECONDS))
+    if report['rss_mib'] > BUDGET_RSS_MIB:
+        problems.append('peak RSS was {:.0f} MiB, the budget is {} '
+                        'MiB'.format(report['rss_mib'], BUDGET_RSS_MIB))
+    loaded = {name.split('.')[0] for name in report['modules']}
+    for name in FORBIDDEN:
+        if name in loaded:
+            problems.append('{} was imported, workers should not need '
+                            'it'.format(name))
+    return problems
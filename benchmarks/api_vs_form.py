@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Saving a large meal plan through the JSON API versus the HTML form.
+
+Posts the same plan of distinct foods to ``/<id>/form`` and to
+``/api/v1/mealplans``, first to create it and then to replace its items,
+and reports the best wall time and SQL statement count of each path.
+
+    python -m benchmarks.api_vs_form [items]
+"""
+import sys
+from time import perf_counter
+from sqlalchemy import event
+from app import create_app, db, last_seen
+from app.models import NUTRIENTS, User
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def make_items(size, salt):
+    return [dict({attr: (i * 7 + j + salt) % 97 + 0.5
+                  for j, attr in enumerate(NUTRIENTS)},
+                 name='item {}'.format(i), no_servings=1.5)
+            for i in range(size)]
+
+
+def form_data(name, items):
+    data = {'name': name, 'length': 7}
+    for i, item in enumerate(items):
+        data.update(('fooditems-{}-{}'.format(i, key), value)
+                    for key, value in item.items())
+        data['fooditems-{}-id'.format(i)] = ''
+    return data
+
+
+def measure(app, post, size, repeat=5):
+    statements = []
+    listener = lambda *args: statements.append(1)
+    best = None
+    for n in range(repeat):
+        items = make_items(size, n)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        start = perf_counter()
+        post(items)
+        elapsed = perf_counter() - start
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(statements) // repeat
+
+
+def main(size):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench',
+                                     'password': 'bench'})
+    token = client.post('/api/v1/tokens', auth=('bench', 'bench')) \
+        .get_json()['token']
+    headers = {'Authorization': 'Bearer ' + token}
+
+    def form_post(url):
+        def post(items):
+            response = client.post(url, data=form_data('form', items))
+            assert response.status_code == 302, response.status_code
+        return post
+
+    def api_post(method, url):
+        def post(items):
+            response = client.open(url, method=method, headers=headers, json={
+                'name': 'api', 'length': 7, 'fooditems': items})
+            assert response.status_code in (200, 201), response.get_json()
+        return post
+
+    api_id = client.post('/api/v1/mealplans', headers=headers, json={
+        'name': 'api', 'length': 7}).get_json()['id']
+    form_post('/new/form')(make_items(1, 0))
+    with app.app_context():
+        form_id = max(m.id for m in User.query.first().mealplans)
+
+    results = [
+        ('form create', measure(app, form_post('/new/form'), size)),
+        ('api create', measure(app, api_post(
+            'POST', '/api/v1/mealplans'), size)),
+        ('form replace', measure(app, form_post(
+            '/{}/form'.format(form_id)), size)),
+        ('api replace', measure(app, api_post(
+            'PUT', '/api/v1/mealplans/{}'.format(api_id)), size)),
+    ]
+    print('{} items per plan'.format(size))
+    print('{:<14} {:>10} {:>10}'.format('path', 'ms', 'queries'))
+    for name, (elapsed, statements) in results:
+        print('{:<14} {:>10.1f} {:>10}'.format(name, elapsed * 1000,
+                                               statements))
+    with app.app_context():
+        last_seen.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""Seeds a database with a synthetic, realistically skewed NutriTrack.
+
+Users get random profiles and goals. Who follows whom is drawn from a
+power law, so a few users have most of the followers, and the number of
+plans per user is Zipf distributed. Plans hold 5 to 300 items drawn
+log-uniformly from a shared food catalog. Everything is derived from
+``seed``, so two runs at the same scale produce the same data.
+
+    python -m benchmarks.datagen [users] [database-path]
+"""
+import os
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+from time import perf_counter
+import numpy as np
+from app import create_app, db
+from app.models import NUTRIENTS, User, Food, FoodItem, MealPlan, \
+    followers, insert_returning_ids, rebuild_timelines, recount_follows
+from config import Config
+
+MIN_ITEMS = 5
+MAX_ITEMS = 300
+MEAN_FOLLOWING = 20
+MAX_PLANS = 40
+PASSWORD = 'bench'
+CHUNK = 500
+
+# Rough per serving scale of each nutrient, a tenth of an adult's day.
+SERVING_SCALE = np.array([200, 5, 25, 3, 5, 7, 2, 100, 1.5, 40, 70, 450,
+                          230, 1, 90, 1.5, 2, 9, 0.1, 0.1, 1.6, 0.1, 0.2,
+                          230, 12, 40], dtype=float)
+
+Dataset = namedtuple('Dataset', ['users', 'foods', 'mealplans', 'fooditems',
+                                 'viewer', 'author', 'mealplan_id'])
+
+
+def power_law_weights(n, exponent=1.1):
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def seed_users(rng, count, password_hash):
+    sexes = rng.choice(['F', 'M'], count)
+    ages = rng.integers(18, 80, count)
+    heights = np.round(rng.normal(1.70, 0.09, count).clip(1.45, 2.05), 2)
+    weights = np.round(rng.normal(72, 13, count).clip(42, 160), 1)
+    exercise = rng.choice([1.2, 1.375, 1.55, 1.725, 1.9], count)
+    ids = []
+    for start in range(0, count, CHUNK):
+        users = [User(username='user{}'.format(i),
+                      email='user{}@example.com'.format(i),
+                      password_hash=password_hash, sex=str(sexes[i]),
+                      age=int(ages[i]), height=float(heights[i]),
+                      weight=float(weights[i]),
+                      exercise=float(exercise[i]))
+                 for i in range(start, min(start + CHUNK, count))]
+        User.set_nutri_info_many(users)
+        db.session.add_all(users)
+        db.session.commit()
+        ids.extend(user.id for user in users)
+    return np.array(ids)
+
+
+def seed_follows(rng, user_ids):
+    """Each user follows about MEAN_FOLLOWING others, popular ones most."""
+    n = len(user_ids)
+    popularity = power_law_weights(n)
+    degrees = np.minimum(rng.lognormal(np.log(MEAN_FOLLOWING), 1, n)
+                         .astype(int), n - 1)
+    rows = []
+    for i, degree in enumerate(degrees.tolist()):
+        followed = np.unique(rng.choice(n, degree, p=popularity))
+        rows.extend({'follower_id': int(user_ids[i]),
+                     'followed_id': int(user_ids[j])}
+                    for j in followed.tolist() if j != i)
+        if len(rows) >= 50000:
+            db.session.execute(followers.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(followers.insert(), rows)
+    db.session.commit()
+    recount_follows()
+
+
+def seed_foods(rng, count):
+    amounts = rng.gamma(1.0, 1.0, (count, len(NUTRIENTS))) * SERVING_SCALE * \
+        (rng.random((count, len(NUTRIENTS))) < 0.6)
+    ids = []
+    for start in range(0, count, CHUNK):
+        ids.extend(Food.intern_ids([
+            dict(zip(NUTRIENTS, row), name='food {}'.format(start + i))
+            for i, row in enumerate(amounts[start:start + CHUNK].tolist())]))
+    db.session.commit()
+    return np.array(ids)
+
+
+def seed_mealplans(rng, user_ids, food_ids, now):
+    counts = np.minimum(rng.zipf(2.0, len(user_ids)), MAX_PLANS)
+    owners = np.repeat(user_ids, counts)
+    rng.shuffle(owners)
+    ages = rng.uniform(0, 90 * 24 * 3600, len(owners))
+    items = np.exp(rng.uniform(np.log(MIN_ITEMS), np.log(MAX_ITEMS + 1),
+                               len(owners))).astype(int)
+    mealplan_ids = []
+    total_items = 0
+    for start in range(0, len(owners), CHUNK):
+        stop = min(start + CHUNK, len(owners))
+        ids = insert_returning_ids(MealPlan.__table__, [
+            {'name': 'plan {}'.format(i), 'length': int(rng.integers(1, 15)),
+             'user_id': int(owners[i]),
+             'timestamp': now - timedelta(seconds=float(ages[i]))}
+            for i in range(start, stop)])
+        rows = []
+        for mealplan_id, size in zip(ids, items[start:stop].tolist()):
+            foods = rng.choice(food_ids, size)
+            servings = np.round(rng.uniform(0.5, 14, size) * 4) / 4
+            rows.extend({'mealplan_id': mealplan_id,
+                         'name': 'item {}'.format(j), 'food_id': int(food),
+                         'no_servings': float(serving)}
+                        for j, (food, serving) in enumerate(zip(
+                            foods.tolist(), servings.tolist())))
+        db.session.execute(FoodItem.__table__.insert(), rows)
+        MealPlan.set_nutri_info_many(
+            MealPlan.query.filter(MealPlan.id.in_(ids)).all())
+        db.session.commit()
+        db.session.expunge_all()
+        mealplan_ids.extend(ids)
+        total_items += len(rows)
+    rebuild_timelines()
+    db.session.commit()
+    return mealplan_ids, total_items
+
+
+def generate(users=1000, foods=None, seed=0):
+    """Seeds the current app's empty database and describes it."""
+    rng = np.random.default_rng(seed)
+    holder = User()
+    holder.set_password(PASSWORD)
+    user_ids = seed_users(rng, users, holder.password_hash)
+    seed_follows(rng, user_ids)
+    food_ids = seed_foods(rng, foods or max(500, users))
+    seed_mealplans(rng, user_ids, food_ids, datetime.utcnow())
+    return describe()
+
+
+def describe():
+    """What the current app's seeded database holds.
+
+    ``viewer`` follows the most people, ``author`` has the most
+    followers and ``mealplan_id`` is one of the author's plans.
+    """
+    viewer = User.query.order_by(User.followed_count.desc()).first()
+    author = User.query.order_by(User.followers_count.desc()).first()
+    mealplan = MealPlan.query.filter_by(user_id=author.id).first() or \
+        MealPlan.query.first()
+    return Dataset(users=User.query.count(), foods=Food.query.count(),
+                   mealplans=MealPlan.query.count(),
+                   fooditems=FoodItem.query.count(), viewer=viewer.username,
+                   author=author.username, mealplan_id=mealplan.id)
+
+
+def main(users, path):
+    class BenchConfig(Config):
+        TESTING = True
+        PASSWORD_HASH_WORKERS = 0
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(path)
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = perf_counter()
+        dataset = generate(users)
+        print('{} users, {} foods, {} meal plans, {} food items in '
+              '{:.1f}s'.format(dataset.users, dataset.foods,
+                               dataset.mealplans, dataset.fooditems,
+                               perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         sys.argv[2] if len(sys.argv) > 2 else 'bench.db')
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Peak memory and time of exporting one account's meal plans.
+
+Seeds a user with plans of 100 items each and exports them as CSV the
+naive way, loading every plan's get_item_data(), and through the
+streaming export. The streaming peak should not grow with the account.
+
+    python -m benchmarks.export [items...]
+"""
+import csv
+import io
+import sys
+import tracemalloc
+from time import perf_counter
+from app import create_app, db
+from app.export import COLUMNS, export_mealplans
+from app.models import NUTRIENTS, User, Food, FoodItem, MealPlan, \
+    NutritionInfo
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+PLAN_ITEMS = 100
+
+
+def seed(items):
+    user = User(username='bench {}'.format(items))
+    db.session.add(user)
+    food = Food(info=NutritionInfo(**{attr: 1.5 for attr in NUTRIENTS}))
+    plans = [MealPlan(name='plan {}'.format(i), length=7, user=user)
+             for i in range(items // PLAN_ITEMS)]
+    db.session.add_all([food] + plans)
+    db.session.flush()
+    db.session.execute(FoodItem.__table__.insert(), [
+        {'mealplan_id': plan.id, 'name': 'item {}'.format(i),
+         'no_servings': 1, 'food_id': food.id}
+        for plan in plans for i in range(PLAN_ITEMS)])
+    db.session.commit()
+    user_id = user.id
+    db.session.expunge_all()
+    return user_id
+
+
+def naive_export(user_id):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for mealplan in db.session.get(User, user_id).mealplans:
+        for data in mealplan.get_item_data():
+            writer.writerow([mealplan.id, mealplan.name, mealplan.length,
+                             mealplan.timestamp.isoformat() + 'Z', data['id'], data['name'],
+                             data['no_servings']] +
+                            [data[attr] for attr in NUTRIENTS])
+    return [buffer.getvalue()]
+
+
+def streaming_export(user_id):
+    return export_mealplans(user_id, 'csv')
+
+
+def measure(func, user_id):
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = perf_counter()
+    size = sum(len(chunk) for chunk in func(user_id))
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main(sizes):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        print('{:>8} {:>10} {:>10} {:>12} {:>12}'.format(
+            'items', 'naive s', 'naive MiB', 'streaming s', 'streaming MiB'))
+        for items in sizes:
+            user_id = seed(items)
+            naive = measure(naive_export, user_id)
+            streaming = measure(streaming_export, user_id)
+            assert naive[2] == streaming[2], (naive[2], streaming[2])
+            print('{:>8} {:>10.2f} {:>10.1f} {:>12.2f} {:>12.1f}'.format(
+                items, naive[0], naive[1] / 2 ** 20,
+                streaming[0], streaming[1] / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Rendering /explore with the feed card fragment cache cold and warm.
+
+Seeds plans by many authors and requests /explore with the fragment
+cache cleared before each request and with it warm, reporting the median
+time of each and the warm hit ratio.
+
+    python -m benchmarks.feed_cards [plans]
+"""
+import statistics
+import sys
+from time import perf_counter
+from app import create_app, db, last_seen
+from app.models import User, MealPlan, NutritionInfo
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def seed(plans):
+    users = [User(username='user{}'.format(i),
+                  email='user{}@example.com'.format(i)) for i in range(50)]
+    users[0].set_password('bench')
+    db.session.add_all(users)
+    db.session.add_all([MealPlan(
+        name='plan {}'.format(i), length=7, user=users[i % len(users)],
+        info=NutritionInfo(calories=2000, protein=80, fat=70, carbs=250))
+        for i in range(plans)])
+    db.session.commit()
+
+
+def median_ms(func, repeat=30):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(plans):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        seed(plans)
+    fragments = app.extensions['caches']['fragments']
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'user0',
+                                     'password': 'bench'})
+
+    def cold():
+        fragments.clear()
+        assert client.get('/explore').status_code == 200
+
+    def warm():
+        assert client.get('/explore').status_code == 200
+
+    print('/explore, {} cards per page'.format(app.config['POSTS_PER_PAGE']))
+    print('{:<6} {:>8.2f} ms'.format('cold', median_ms(cold)))
+    fragments.hits = fragments.misses = 0
+    print('{:<6} {:>8.2f} ms'.format('warm', median_ms(warm)))
+    print('hit ratio {:.2f}'.format(fragments.stats()['hit_ratio']))
+    with app.app_context():
+        last_seen.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
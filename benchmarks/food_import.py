@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Throughput and memory of ``flask food import`` on a generated dump.
+
+Writes a long-format CSV with one row per food and nutrient, imports it
+into a scratch SQLite database and reports rows per second and the peak
+resident memory, which should not grow with the size of the file.
+
+    python -m benchmarks.food_import [foods]
+"""
+import os
+import resource
+import sys
+import tempfile
+from time import perf_counter
+import numpy as np
+from app import create_app, db
+from app.food_import import FoodImporter
+from app.models import NUTRIENTS
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+
+
+def write_dump(path, foods):
+    rng = np.random.default_rng(0)
+    with open(path, 'w') as f:
+        f.write('food_code,food_name,nutrient,amount\n')
+        for start in range(0, foods, 10000):
+            amounts = rng.uniform(0, 100, (min(10000, foods - start),
+                                           len(NUTRIENTS)))
+            for code, row in enumerate(amounts.tolist(), start):
+                f.write(''.join('{0},"Food {0}, raw",{1},{2:.3f}\n'.format(
+                    code, attr, amount) for attr, amount in
+                    zip(NUTRIENTS, row)))
+
+
+def main(foods):
+    workdir = tempfile.mkdtemp()
+    dump = os.path.join(workdir, 'foods.csv')
+    BenchConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+        workdir, 'bench.db')
+    write_dump(dump, foods)
+    app = create_app(BenchConfig)
+    try:
+        with app.app_context():
+            db.create_all()
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            importer = FoodImporter(dump)
+            job = importer.job()
+            start = perf_counter()
+            rate = importer.run(job)
+            elapsed = perf_counter() - start
+            after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print('{} foods, {} rows, {:.1f} MiB file'.format(
+                job.foods, job.rows, job.size / 2 ** 20))
+            print('{:.1f} s, {:.0f} rows/s, peak RSS grew {:.1f} MiB'.format(
+                elapsed, rate, (after - before) / 1024))
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Compares OFFSET pagination with keyset pagination on /explore's query.
+
+Seeds a scratch SQLite database with synthetic meal plans (one million by
+default) and times fetching a page at increasing depths both ways.
+
+    python -m benchmarks.keyset_pagination [count] [database-path]
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+from app import create_app, db
+from app.models import User, MealPlan
+from app.pagination import keyset_paginate, encode_cursor
+from config import Config
+
+PER_PAGE = 25
+CHUNK = 50000
+
+
+def seed(count):
+    db.session.add(User(username='bench'))
+    db.session.commit()
+    user_id = User.query.first().id
+    start = datetime(2020, 1, 1)
+    table = MealPlan.__table__
+    for offset in range(0, count, CHUNK):
+        db.session.execute(table.insert(), [
+            {'name': 'plan {}'.format(i), 'length': 7, 'user_id': user_id,
+             'timestamp': start + timedelta(seconds=i // 3)}
+            for i in range(offset, min(offset + CHUNK, count))])
+        db.session.commit()
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(count, path):
+    class BenchConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        if MealPlan.query.count() != count:
+            db.drop_all()
+            db.create_all()
+            start = perf_counter()
+            seed(count)
+            print('seeded {} meal plans in {:.1f}s'.format(
+                count, perf_counter() - start))
+
+        columns = (MealPlan.timestamp, MealPlan.id)
+        ordered = MealPlan.query.order_by(MealPlan.timestamp.desc(),
+                                          MealPlan.id.desc())
+        print('{:>8} {:>12} {:>12}'.format('page', 'offset ms', 'keyset ms'))
+        page = 1
+        while (page - 1) * PER_PAGE < count:
+            offset_ms = timed(lambda: ordered.paginate(
+                page=page, per_page=PER_PAGE, error_out=False).items)
+            # cursor of the last row on the previous page, as a client
+            # following "next" links would hold it
+            after = None
+            if page > 1:
+                last = ordered.offset((page - 1) * PER_PAGE - 1).first()
+                after = encode_cursor(last.timestamp, last.id)
+            keyset_ms = timed(lambda: keyset_paginate(
+                MealPlan.query, columns, PER_PAGE, after=after).items)
+            print('{:>8} {:>12.2f} {:>12.2f}'.format(page, offset_ms,
+                                                     keyset_ms))
+            page *= 10
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(
+        tempfile.gettempdir(), 'nutritrack-keyset-bench.db')
+    main(count, path)
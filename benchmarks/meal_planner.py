@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Time to generate a meal plan from pools of synthetic foods.
+
+Each food carries a random subset of nutrients at up to a quarter of an
+adult's daily goals. For each pool size it reports the solve time, the
+number of items chosen and the plan's adequacy score, searching the
+whole pool and, as /generate does, a shortlist of PLANNER_POOL_SIZE foods.
+
+    python -m benchmarks.meal_planner [sizes...]
+"""
+import sys
+from time import perf_counter
+import numpy as np
+from app import adequacy, planner
+from app.models import NUTRIENTS, VECTOR_ATTRS
+from app.dri import get_table
+from config import Config
+
+REPEAT = 5
+
+
+def main(sizes):
+    goals = get_table().goals('F', 30, 1.65, 60, 1.55)
+    goals = np.array([goals[attr] for attr in VECTOR_ATTRS])
+    target = adequacy.goal_bounds(goals)[2]
+    rng = np.random.default_rng(0)
+    print('{:>7} {:>9} {:>10} {:>6} {:>7}'.format('foods', 'pool',
+                                                  'best ms', 'items',
+                                                  'score'))
+    for size in sizes:
+        matrix = rng.uniform(0, 1, (size, len(NUTRIENTS))) * \
+            (rng.uniform(0, 1, (size, len(NUTRIENTS))) < 0.4) * target / 4
+        pool = planner.Pool(range(size), map(str, range(size)), matrix)
+        for name, shortlist in (('whole', False), ('shortlist', True)):
+            best = None
+            for _ in range(REPEAT):
+                start = perf_counter()
+                searched = pool.shortlist(goals, Config.PLANNER_POOL_SIZE) \
+                    if shortlist else pool
+                plan = planner.solve(searched, goals)
+                elapsed = perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            daily = plan.servings @ searched.matrix[plan.indexes]
+            print('{:>7} {:>9} {:>10.1f} {:>6} {:>7.1f}'.format(
+                size, name, best * 1000, len(plan.indexes),
+                adequacy.score(daily, goals).scores[0]))
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Measures how long saving a meal plan's totals takes as it grows.
+
+Compares MealPlan.set_nutri_info() against the per-nutrient loop it
+replaced, reporting wall time and statement count for each plan size.
+
+    python -m benchmarks.mealplan_totals [sizes...]
+"""
+import sys
+from time import perf_counter
+from sqlalchemy import event
+from app import create_app, db
+from app.models import NUTRIENTS, User, MealPlan, FoodItem, Food, \
+    NutritionInfo
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def legacy_set_nutri_info(mealplan):
+    if mealplan.info is None:
+        mealplan.info = NutritionInfo()
+    for attr in NUTRIENTS:
+        total = 0
+        for item in mealplan.fooditems:
+            total += getattr(item.info, attr) * float(item.no_servings)
+        setattr(mealplan.info, attr, total / mealplan.length)
+
+
+def make_plan(user, size):
+    mealplan = MealPlan(name='plan {}'.format(size), length=7, user=user)
+    db.session.add(mealplan)
+    foods = Food.intern_many([dict.fromkeys(NUTRIENTS, i + 1)
+                              for i in range(17)])
+    for i in range(size):
+        db.session.add(FoodItem(name='item {}'.format(i), no_servings=1.5,
+                                mealplan=mealplan, food=foods[i % 17]))
+    db.session.commit()
+    return mealplan.id
+
+
+def measure(func, mealplan_id, repeat=5):
+    statements = []
+    listener = lambda *args: statements.append(1)
+    best = None
+    for _ in range(repeat):
+        db.session.expire_all()
+        mealplan = db.session.get(MealPlan, mealplan_id)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        start = perf_counter()
+        func(mealplan)
+        db.session.flush()
+        elapsed = perf_counter() - start
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        best = elapsed if best is None else min(best, elapsed)
+    db.session.rollback()
+    return best, len(statements) // repeat
+
+
+def main(sizes):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench')
+        db.session.add(user)
+        print('{:>6} {:>12} {:>8} {:>12} {:>8}'.format(
+            'items', 'legacy ms', 'queries', 'aggregate ms', 'queries'))
+        for size in sizes:
+            mealplan_id = make_plan(user, size)
+            legacy = measure(legacy_set_nutri_info, mealplan_id)
+            current = measure(MealPlan.set_nutri_info, mealplan_id)
+            print('{:>6} {:>12.2f} {:>8} {:>12.2f} {:>8}'.format(
+                size, legacy[0] * 1000, legacy[1],
+                current[0] * 1000, current[1]))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10, 50, 100, 200, 500])
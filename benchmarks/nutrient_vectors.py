@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Memory and time per 100k food items: ORM columns vs packed vectors.
+
+Loads the same synthetic items from a scratch SQLite database once as
+NutritionInfo instances read attribute by attribute, and once as packed
+blobs viewed as a single NumPy matrix, then sums them per nutrient.
+
+    python -m benchmarks.nutrient_vectors [count]
+"""
+import sys
+import tracemalloc
+from time import perf_counter
+import numpy as np
+from app import create_app, db
+from app.models import NUTRIENTS, VECTOR_ATTRS, VECTOR_DTYPE, \
+    NutritionInfo, pack_nutrients
+from config import Config
+
+CHUNK = 20000
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def seed(count):
+    rng = np.random.default_rng(0)
+    table = NutritionInfo.__table__
+    for offset in range(0, count, CHUNK):
+        values = rng.uniform(0, 500, (min(CHUNK, count - offset),
+                                      len(VECTOR_ATTRS)))
+        db.session.execute(table.insert(), [
+            dict(zip(VECTOR_ATTRS, row), packed=pack_nutrients(row))
+            for row in values.tolist()])
+    db.session.commit()
+
+
+def measure(load, reduce):
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = perf_counter()
+    data = load()
+    loaded = perf_counter()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    totals = reduce(data)
+    done = perf_counter()
+    return memory, loaded - start, done - loaded, totals
+
+
+def load_orm():
+    return NutritionInfo.query.all()
+
+
+def reduce_orm(infos):
+    return [sum(getattr(info, attr) for info in infos) for attr in NUTRIENTS]
+
+
+def load_packed():
+    blobs = db.session.scalars(db.select(NutritionInfo.packed)).all()
+    return np.frombuffer(b''.join(blobs), dtype=VECTOR_DTYPE).reshape(
+        -1, len(VECTOR_ATTRS))
+
+
+def reduce_packed(matrix):
+    return matrix[:, :len(NUTRIENTS)].sum(axis=0)
+
+
+def main(count):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        seed(count)
+        print('{:>8} {:>10} {:>10} {:>10}'.format(
+            '', 'MiB', 'load s', 'sum s'))
+        results = {}
+        for name, load, reduce in (('orm', load_orm, reduce_orm),
+                                   ('packed', load_packed, reduce_packed)):
+            memory, load_s, sum_s, totals = measure(load, reduce)
+            results[name] = np.asarray(totals)
+            print('{:>8} {:>10.1f} {:>10.3f} {:>10.4f}'.format(
+                name, memory / 2 ** 20, load_s, sum_s))
+        assert np.allclose(results['orm'], results['packed'])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
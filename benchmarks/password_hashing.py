@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Concurrent login throughput with hashing inline and on a process pool.
+
+Runs /auth/login from several client threads against one app, the way a
+threaded worker serves a login storm, first hashing in the request
+threads and then on the PasswordHasher pool. Reports logins per second
+and the median latency of a cheap request served alongside them.
+
+    python -m benchmarks.password_hashing [threads] [logins per thread]
+"""
+import os
+import statistics
+import sys
+import threading
+from time import perf_counter
+from app import create_app, db, last_seen
+from app.models import User
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def run(workers, threads, logins):
+    BenchConfig.PASSWORD_HASH_WORKERS = workers
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        users = [User(username='user{}'.format(i)) for i in range(threads)]
+        for user in users:
+            user.set_password('secret')
+        db.session.add_all(users)
+        db.session.commit()
+
+    def login(i):
+        client = app.test_client()
+        for _ in range(logins):
+            response = client.post('/auth/login', data={
+                'username': 'user{}'.format(i), 'password': 'secret'})
+            assert response.status_code == 302
+            client.get('/auth/logout')
+
+    pool = [threading.Thread(target=login, args=(i,))
+            for i in range(threads)]
+    probe = app.test_client()
+    latencies = []
+    start = perf_counter()
+    for thread in pool:
+        thread.start()
+    while any(thread.is_alive() for thread in pool):
+        t = perf_counter()
+        probe.get('/auth/login')
+        latencies.append(perf_counter() - t)
+    for thread in pool:
+        thread.join()
+    elapsed = perf_counter() - start
+    with app.app_context():
+        last_seen.flush()
+    app.extensions['passwords'].shutdown()
+    return threads * logins / elapsed, statistics.median(latencies) * 1000
+
+
+def main(threads, logins):
+    print('{} threads x {} logins'.format(threads, logins))
+    print('{:<10} {:>10} {:>16}'.format('hashing', 'logins/s',
+                                        'other req. ms'))
+    for name, workers in (('inline', 0), ('pool', os.cpu_count())):
+        rate, latency = run(workers, threads, logins)
+        print('{:<10} {:>10.1f} {:>16.2f}'.format(name, rate, latency))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""Latency, query count and memory of every page route on seeded data.
+
+Seeds a database with benchmarks.datagen, logs in as the user who follows
+the most people, and drives each route of the main and auth blueprints
+through the test client. Per route it reports the p50 and p95 latency,
+the SQL statements a request runs and the peak memory a request
+allocates, and writes them as JSON so runs on two commits can be
+compared. It refuses to run while a route has no scenario, so new routes
+can't silently go unmeasured.
+
+    python -m benchmarks.routes [--users N] [--db PATH] [--output PATH]
+                                [--compare OLD.json] [--cold] [--only NAME]
+
+Without --db every run seeds a fresh temporary database from the same
+seed, which is what runs meant for comparison should use. A database
+passed with --db is seeded on the first run and reused after that, but
+the write routes add plans and users to it, so later runs on it are
+slower.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+from time import perf_counter
+import numpy as np
+from app import create_app, db, last_seen
+from app.models import User, MealPlan
+from benchmarks import datagen
+from config import Config
+
+Scenario = namedtuple('Scenario', ['name', 'endpoint', 'method', 'url',
+                                   'data', 'client', 'setup'])
+
+
+class BenchConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_WORKERS = 0
+    LAST_SEEN_FLUSH_INTERVAL = 0
+
+
+def scenario(name, endpoint, url, method='GET', data=None, client='viewer',
+             setup=None):
+    """``url`` and ``data`` are values or functions of the iteration."""
+    return Scenario(name, endpoint, method, url, data, client, setup)
+
+
+def mealplan_data(i, items=20):
+    data = {'name': 'bench plan {}'.format(i), 'length': 7}
+    for j in range(items):
+        data.update({'fooditems-{}-id'.format(j): '',
+                     'fooditems-{}-name'.format(j): 'item {}'.format(j),
+                     'fooditems-{}-no_servings'.format(j): 1 + j % 3,
+                     'fooditems-{}-calories'.format(j): 50 + 10 * j,
+                     'fooditems-{}-protein'.format(j): j % 7})
+    return data
+
+
+def scenarios(app, clients, dataset):
+    viewer, author = dataset.viewer, dataset.author
+    mealplan = dataset.mealplan_id
+    with app.app_context():
+        user = User.query.filter_by(username=viewer).first()
+        profile = {'age': user.age, 'height': user.height,
+                   'weight': user.weight, 'exercise': user.exercise,
+                   'sex': user.sex}
+        token = user.get_reset_password_token(expires_in=3600)
+        email = user.email
+    run = datetime.utcnow().strftime('%H%M%S')
+    created = []
+
+    def create_plan(i):
+        clients['viewer'].post('/new/form', data=mealplan_data(i, 5))
+        with app.app_context():
+            created.append(MealPlan.query.filter_by(
+                name='bench plan {}'.format(i)).order_by(
+                MealPlan.id.desc()).first().id)
+
+    def log_in(i):
+        clients['anonymous'].post('/auth/login', data={
+            'username': viewer, 'password': datagen.PASSWORD})
+
+    return [
+        scenario('index', 'main.index', '/index'),
+        scenario('explore', 'main.explore', '/explore'),
+        scenario('explore by adequacy', 'main.explore',
+                 '/explore?sort=adequacy'),
+        scenario('metrics', 'main.metrics', '/metrics'),
+        scenario('similar to goals', 'main.similar_to_goals', '/similar'),
+        scenario('similar to plan', 'main.similar_to_mealplan',
+                 '/{}/similar'.format(mealplan)),
+        scenario('search', 'main.search_mealplans', '/search?q=item+plan'),
+        scenario('autocomplete', 'main.autocomplete',
+                 '/search/autocomplete?q=fo'),
+        scenario('user', 'main.user', '/user/{}'.format(author)),
+        scenario('edit profile', 'main.edit_profile', '/edit_profile'),
+        scenario('save profile', 'main.edit_profile', '/edit_profile', 'POST',
+                 lambda i: {'username': viewer,
+                            'about_me': 'benchmark run {}'.format(i)}),
+        scenario('follow', 'main.follow', '/follow/{}'.format(author),
+                 'POST', {}, setup=lambda i: clients['viewer'].post(
+                     '/unfollow/{}'.format(author))),
+        scenario('unfollow', 'main.unfollow', '/unfollow/{}'.format(author),
+                 'POST', {}, setup=lambda i: clients['viewer'].post(
+                     '/follow/{}'.format(author))),
+        scenario('edit nutrition', 'main.edit_nutrition', '/edit_nutrition'),
+        scenario('save nutrition', 'main.edit_nutrition', '/edit_nutrition',
+                 'POST', profile),
+        scenario('nutrition goals', 'main.nutrition_goals',
+                 '/nutrition_goals'),
+        scenario('user mealplans', 'main.user_mealplans',
+                 '/user/{}/mealplans'.format(viewer)),
+        scenario('export csv', 'main.export_mealplans',
+                 '/user/{}/mealplans.csv'.format(viewer)),
+        scenario('show mealplan', 'main.show_mealplan',
+                 '/{}'.format(mealplan)),
+        scenario('edit mealplan', 'main.mealplan_form',
+                 '/{}/form'.format(mealplan)),
+        scenario('create mealplan', 'main.mealplan_form', '/new/form', 'POST',
+                 mealplan_data),
+        scenario('generate form', 'main.generate_mealplan', '/generate'),
+        scenario('generate mealplan', 'main.generate_mealplan', '/generate',
+                 'POST', {'name': 'generated', 'length': 7, 'max_items': 8}),
+        scenario('delete mealplan', 'main.delete_mealplan',
+                 lambda i: '/{}/delete'.format(created.pop()),
+                 setup=create_plan),
+        scenario('login form', 'auth.login', '/auth/login',
+                 client='anonymous'),
+        scenario('login', 'auth.login', '/auth/login', 'POST',
+                 {'username': viewer, 'password': datagen.PASSWORD},
+                 client='anonymous', setup=lambda i: clients[
+                     'anonymous'].get('/auth/logout')),
+        scenario('logout', 'auth.logout', '/auth/logout',
+                 client='anonymous', setup=log_in),
+        scenario('register form', 'auth.register', '/auth/register',
+                 client='anonymous'),
+        scenario('register', 'auth.register', '/auth/register', 'POST',
+                 lambda i: {'username': 'bench{}x{}'.format(run, i),
+                            'email': 'bench{}x{}@example.com'.format(run, i),
+                            'password': 'bench', 'password2': 'bench'},
+                 client='anonymous'),
+        scenario('reset request form', 'auth.reset_password_request',
+                 '/auth/reset_password_request', client='anonymous'),
+        scenario('reset request', 'auth.reset_password_request',
+                 '/auth/reset_password_request', 'POST', {'email': email},
+                 client='anonymous'),
+        scenario('reset form', 'auth.reset_password',
+                 '/auth/reset_password/{}'.format(token),
+                 client='anonymous'),
+    ]
+
+
+def unmeasured(app, scenarios):
+    """Endpoints of the page blueprints that no scenario requests."""
+    covered = {s.endpoint for s in scenarios}
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                  if rule.endpoint.split('.')[0] in ('main', 'auth') and
+                  rule.endpoint not in covered)
+
+
+class Runner(object):
+    def __init__(self, app, clients, cold=False):
+        self.app = app
+        self.clients = clients
+        self.caches = [cache for cache in app.extensions['caches'].values()
+                       if hasattr(cache, 'clear')] if cold else []
+        self.statements = 0
+        self.counting = False
+
+    def count(self, *args):
+        if self.counting:
+            self.statements += 1
+
+    def request(self, s, i):
+        if s.setup is not None:
+            s.setup(i)
+        for cache in self.caches:
+            cache.clear()
+        url = s.url(i) if callable(s.url) else s.url
+        data = s.data(i) if callable(s.data) else s.data
+        client = self.clients[s.client]
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        self.statements = 0
+        self.counting = True
+        start = perf_counter()
+        response = client.open(url, method=s.method, data=data)
+        response.get_data()
+        elapsed = perf_counter() - start
+        self.counting = False
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        return elapsed, self.statements, response.status_code, peak
+
+    def measure(self, s, iterations, traced=3):
+        self.request(s, -1)
+        times, queries, statuses = [], [], set()
+        for i in range(iterations):
+            elapsed, statements, status, _ = self.request(s, i)
+            times.append(elapsed * 1000)
+            queries.append(statements)
+            statuses.add(status)
+        peak = 0
+        tracemalloc.start()
+        for i in range(iterations, iterations + traced):
+            peak = max(peak, self.request(s, i)[3])
+        tracemalloc.stop()
+        p50, p95 = np.percentile(times, [50, 95]).tolist()
+        return {'name': s.name, 'endpoint': s.endpoint, 'method': s.method,
+                'status': sorted(statuses), 'p50_ms': round(p50, 3),
+                'p95_ms': round(p95, 3), 'queries': int(np.median(queries)),
+                'peak_kib': round(peak / 1024, 1)}
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    with open(path) as f:
+        old = {route['name']: route for route in json.load(f)['routes']}
+    print('\ncompared with {}'.format(path))
+    print('{:<20} {:>9} {:>9} {:>9}'.format('route', 'p50', 'p95',
+                                            'queries'))
+    for route in results['routes']:
+        before = old.get(route['name'])
+        if before is None:
+            continue
+        print('{:<20} {:>8.2f}x {:>8.2f}x {:>+9d}'.format(
+            route['name'], route['p50_ms'] / before['p50_ms'],
+            route['p95_ms'] / before['p95_ms'],
+            route['queries'] - before['queries']))
+
+
+def main(args):
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    BenchConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(path)
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        if User.query.first() is None:
+            start = perf_counter()
+            dataset = datagen.generate(args.users)
+            print('seeded {} users, {} meal plans, {} food items in '
+                  '{:.1f}s'.format(dataset.users, dataset.mealplans,
+                                   dataset.fooditems, perf_counter() - start))
+        else:
+            dataset = datagen.describe()
+    clients = {'viewer': app.test_client(), 'anonymous': app.test_client()}
+    clients['viewer'].post('/auth/login', data={
+        'username': dataset.viewer, 'password': datagen.PASSWORD})
+    plan = scenarios(app, clients, dataset)
+    missing = unmeasured(app, plan)
+    if missing:
+        sys.exit('no scenario for ' + ', '.join(missing))
+    if args.only:
+        plan = [s for s in plan if args.only in s.name]
+
+    runner = Runner(app, clients, args.cold)
+    with app.app_context():
+        db.event.listen(db.engine, 'before_cursor_execute', runner.count)
+    print('{:<20} {:>9} {:>9} {:>8} {:>10}  {}'.format(
+        'route', 'p50 ms', 'p95 ms', 'queries', 'peak KiB', 'status'))
+    routes = []
+    for s in plan:
+        route = runner.measure(s, args.requests)
+        routes.append(route)
+        print('{:<20} {:>9.2f} {:>9.2f} {:>8} {:>10.1f}  {}'.format(
+            route['name'], route['p50_ms'], route['p95_ms'],
+            route['queries'], route['peak_kib'],
+            ','.join(str(status) for status in route['status'])))
+    with app.app_context():
+        last_seen.flush()
+
+    results = {'meta': {'commit': commit(),
+                        'date': datetime.utcnow().isoformat() + 'Z',
+                        'users': dataset.users,
+                        'mealplans': dataset.mealplans,
+                        'fooditems': dataset.fooditems,
+                        'requests': args.requests, 'cold': args.cold,
+                        'python': platform.python_version(),
+                        'sqlite': sqlite3.sqlite_version},
+               'routes': routes}
+    output = args.output or 'routes-{}.json'.format(
+        results['meta']['commit'] or 'results')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results written to {}'.format(output))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=1000,
+                        help='users to seed an empty database with')
+    parser.add_argument('--db', help='database to seed or reuse')
+    parser.add_argument('--requests', type=int, default=20,
+                        help='timed requests per route')
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--compare', help='earlier results to compare with')
+    parser.add_argument('--cold', action='store_true',
+                        help='clear the page and fragment caches before '
+                             'each request')
+    parser.add_argument('--only', help='run the routes whose name has this')
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Autocomplete latency over a large food item table.
+
+Fills a scratch SQLite database with synthetic food item names, then times
+search.suggest for random prefixes with the FTS5 backend and the in-memory
+inverted index, and reports whether p95 stays under TARGET_MS.
+
+    python -m benchmarks.search [count] [queries]
+"""
+import os
+import sys
+import tempfile
+from time import perf_counter
+import numpy as np
+from app import create_app, db, search
+from app.models import FoodItem, MealPlan
+from config import Config
+
+CHUNK = 50000
+TARGET_MS = 20
+WORDS = ('apple', 'banana', 'bread', 'broccoli', 'brown', 'butter', 'cheese',
+         'chicken', 'chickpea', 'chili', 'cod', 'corn', 'cream', 'egg',
+         'grilled', 'ham', 'honey', 'lentil', 'milk', 'mushroom', 'oat',
+         'olive', 'onion', 'pasta', 'peanut', 'pepper', 'pork', 'potato',
+         'raw', 'rice', 'roasted', 'salmon', 'soup', 'spinach', 'steamed',
+         'tofu', 'tomato', 'tuna', 'turkey', 'white', 'whole', 'yogurt')
+
+
+class BenchConfig(Config):
+    TESTING = True
+
+
+def seed(count):
+    rng = np.random.default_rng(0)
+    plan = MealPlan(name='Benchmark')
+    db.session.add(plan)
+    db.session.commit()
+    table = FoodItem.__table__
+    for offset in range(0, count, CHUNK):
+        size = min(CHUNK, count - offset)
+        words = rng.integers(0, len(WORDS), (size, 3))
+        serial = rng.integers(0, 1000, size)
+        db.session.execute(table.insert(), [
+            {'name': '{} {} {} {}'.format(WORDS[a], WORDS[b], WORDS[c], n),
+             'mealplan_id': plan.id}
+            for (a, b, c), n in zip(words.tolist(), serial.tolist())])
+    db.session.commit()
+
+
+def prefixes(queries):
+    rng = np.random.default_rng(1)
+    result = []
+    for i in range(queries):
+        words = [WORDS[w] for w in rng.integers(0, len(WORDS), 2)]
+        cut = int(rng.integers(search.MIN_PREFIX, len(words[-1]) + 1))
+        result.append(' '.join(words[:i % 2] + [words[-1][:cut]]))
+    return result
+
+
+def measure(queries):
+    times = []
+    for query in queries:
+        start = perf_counter()
+        search.suggest(query, 10)
+        times.append(perf_counter() - start)
+    return 1000 * np.percentile(times, [50, 95])
+
+
+def main(count, queries):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    BenchConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+    app = create_app(BenchConfig)
+    try:
+        with app.app_context():
+            db.create_all()
+            start = perf_counter()
+            seed(count)
+            print('seeded {} items in {:.1f} s'.format(
+                count, perf_counter() - start))
+            queries = prefixes(queries)
+            for backend in ('fts', 'memory'):
+                app.config['SEARCH_BACKEND'] = backend
+                app.extensions.pop('search', None)
+                start = perf_counter()
+                search.get_backend()
+                ready = perf_counter() - start
+                p50, p95 = measure(queries)
+                print('{:>7} ready {:6.2f} s  p50 {:6.2f} ms  p95 {:6.2f} ms'
+                      '  {}'.format(backend, ready, p50, p95,
+                                    'ok' if p95 <= TARGET_MS else 'SLOW'))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Serving a meal plan page cold, with its ingredients cached and as a 304.
+
+Requests /<mealplan_id> for a plan of the given size with the page cache
+cleared before each request, with the ingredients table in it, and with
+If-None-Match set, reporting the median time of each and the size of the
+cached table.
+
+    python -m benchmarks.show_mealplan [items]
+"""
+import statistics
+import sys
+from time import perf_counter
+from app import create_app, db, last_seen
+from app.models import NUTRIENTS, User, Food, FoodItem, MealPlan
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def seed(items):
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('bench')
+    mealplan = MealPlan(name='shared', length=7, user=user)
+    db.session.add_all([user, mealplan])
+    foods = Food.intern_many([dict.fromkeys(NUTRIENTS, i + 1)
+                              for i in range(17)])
+    for i in range(items):
+        db.session.add(FoodItem(name='item {}'.format(i), no_servings=1,
+                                mealplan=mealplan, food=foods[i % 17]))
+    mealplan.set_nutri_info()
+    user.sex, user.age, user.height, user.weight, user.exercise = \
+        'F', 30, 1.65, 60, 1.55
+    user.set_nutri_info()
+    db.session.commit()
+    return mealplan.id
+
+
+def median_ms(func, repeat=50):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(items):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        url = '/{}'.format(seed(items))
+    pages = app.extensions['caches']['pages']
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench',
+                                     'password': 'bench'})
+    client.get('/index')
+    etag = client.get(url).headers['ETag']
+
+    def cold():
+        pages.clear()
+        assert client.get(url).status_code == 200
+
+    def warm():
+        assert client.get(url).status_code == 200
+
+    def not_modified():
+        assert client.get(url, headers={
+            'If-None-Match': etag}).status_code == 304
+
+    print('{} items'.format(items))
+    for name, func in (('render', cold), ('ingredients', warm),
+                       ('304', not_modified)):
+        print('{:<12} {:>8.2f} ms'.format(name, median_ms(func)))
+    print('cached       {:>8} bytes'.format(pages.stats()['bytes']))
+    with app.app_context():
+        last_seen.flush()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Recall and latency of the meal plan similarity index.
+
+Builds a PlanIndex over synthetic daily averages and compares its top-k
+against an exact float64 full sort for a set of random targets, then times
+incremental upserts like those made when plans are saved.
+
+    python -m benchmarks.similar_plans [count] [queries]
+"""
+import sys
+from time import perf_counter
+import numpy as np
+from app import create_app, similar
+from app.models import NUTRIENTS
+from config import Config
+
+K = 10
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def main(count, queries):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        scale = similar.reference_scale()
+    rng = np.random.default_rng(0)
+    vectors = rng.uniform(0, 2, (count, len(NUTRIENTS))) / np.where(
+        scale > 0, scale, 1)
+    index = similar.PlanIndex(scale)
+    start = perf_counter()
+    index.build(zip(range(count), vectors))
+    print('build {:>10.3f} s for {} plans'.format(perf_counter() - start,
+                                                   count))
+
+    scaled = vectors * scale
+    targets = rng.uniform(0, 2, (queries, len(NUTRIENTS))) / np.where(
+        scale > 0, scale, 1)
+    hits = 0
+    index_s = exact_s = 0
+    for target in targets:
+        start = perf_counter()
+        found = [id for id, _ in index.query(target, k=K)]
+        index_s += perf_counter() - start
+        start = perf_counter()
+        distances = ((scaled - target * scale) ** 2).sum(axis=1)
+        exact = np.argsort(distances)[:K]
+        exact_s += perf_counter() - start
+        hits += len(set(found) & set(exact.tolist()))
+    print('recall@{} {:>7.4f}'.format(K, hits / (K * queries)))
+    print('query {:>10.2f} ms (exact sort {:.2f} ms)'.format(
+        1000 * index_s / queries, 1000 * exact_s / queries))
+
+    start = perf_counter()
+    for id in range(count, count + 1000):
+        index.upsert(id, vectors[id % count])
+    print('upsert {:>9.2f} us'.format((perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 100)
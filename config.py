@@ -15,7 +15,37 @@ class Config(object):
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS') or 2)
+    MAIL_BATCH_SIZE = 50
+    MAIL_QUEUE_SIZE = 1000
+    MAIL_QUEUE_TIMEOUT = 1
     ADMINS = ['your-email@example.com']
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or \
+        'pbkdf2:sha256:600000'
+    # Hashing processes per gunicorn worker. 0 hashes in the request
+    # thread, which is all sync workers can use. With --threads or async
+    # workers a pool keeps logins from stalling other requests; keep
+    # gunicorn workers times this near the number of cores.
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 0)
     LANGUAGES = ['en', 'es']
     MS_TRANSLATOR_KEY = os.environ.get('MS_TRANSLATOR_KEY')
     POSTS_PER_PAGE = 25
+    TIMELINE_FANOUT_LIMIT = 5000
+    LAST_SEEN_MIN_INTERVAL = 60
+    LAST_SEEN_FLUSH_INTERVAL = int(os.environ.get('LAST_SEEN_FLUSH_INTERVAL')
+                                   or 10)
+    # Per worker: other workers see a user's changes after USER_CACHE_TTL.
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 30
+    PAGE_CACHE_BYTES = 64 * 1024 * 1024
+    PAGE_CACHE_TTL = 600
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL')
+    FRAGMENT_CACHE_SIZE = 20000
+    FRAGMENT_CACHE_TTL = 3600
+    SIMILAR_INDEX_MAX_AGE = 300
+    SIMILAR_RESULTS = 10
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND')
+    SEARCH_INDEX_MAX_AGE = 300
+    SEARCH_SUGGESTIONS = 10
+    PLANNER_POOL_SIZE = 2000
+    API_TOKEN_EXPIRES = 3600
@@ -0,0 +1,55 @@
+"""full-text search index
+
+Revision ID: c5e2a7f19d38
+Revises: 4b2d8f0e6c13
+Create Date: 2026-10-18 15:02:44.318502
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e2a7f19d38'
+down_revision = '4b2d8f0e6c13'
+branch_labels = None
+depends_on = None
+
+TABLES = ('mealplan', 'fooditem')
+
+# Same statements as app.search.fts_ddl at the time of this revision.
+DDL = [
+    "CREATE VIRTUAL TABLE {0}_fts USING fts5(name, content='{0}', "
+    "content_rowid='id', prefix='2 3', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER {0}_fts_ai AFTER INSERT ON {0} BEGIN "
+    "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER {0}_fts_ad AFTER DELETE ON {0} BEGIN "
+    "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER {0}_fts_au AFTER UPDATE OF name ON {0} BEGIN "
+    "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); "
+    "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+
+
+def upgrade():
+    # Other databases use the in-memory index in app/search.py.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in TABLES:
+        for statement in DDL:
+            op.execute(statement.format(table))
+        op.execute("INSERT INTO {0}_fts({0}_fts) VALUES ('rebuild')".format(
+            table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in TABLES:
+        for trigger in ('ai', 'ad', 'au'):
+            op.execute('DROP TRIGGER IF EXISTS {}_fts_{}'.format(table,
+                                                                 trigger))
+        op.execute('DROP TABLE IF EXISTS {}_fts'.format(table))
@@ -0,0 +1,172 @@
+"""shared food catalog
+
+Revision ID: d91f3b6a2e47
+Revises: c5e2a7f19d38
+Create Date: 2026-10-18 16:21:09.804117
+
+"""
+from hashlib import sha1
+from alembic import op
+import sqlalchemy as sa
+import numpy as np
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f3b6a2e47'
+down_revision = 'c5e2a7f19d38'
+branch_labels = None
+depends_on = None
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fiber', 'sugar', 'fat',
+             'sat_fat', 'calcium', 'iron', 'magnesium', 'phosphorus',
+             'potassium', 'sodium', 'zinc', 'vitA', 'vitE', 'vitD', 'vitC',
+             'thiamin', 'riboflavin', 'niacin', 'vitB6', 'vitB12',
+             'chlorine', 'vitK', 'folate')
+COLUMNS = NUTRIENTS + ('protein_low', 'carbs_low', 'fat_low', 'packed')
+BATCH = 5000
+
+food = sa.Table('food', sa.MetaData(),
+                sa.Column('id', sa.Integer, primary_key=True),
+                sa.Column('name', sa.String(40)),
+                sa.Column('digest', sa.String(40)))
+fooditem = sa.table('fooditem', sa.column('id', sa.Integer),
+                    sa.column('name', sa.String),
+                    sa.column('food_id', sa.Integer))
+nutri_info = sa.table('nutri_info', sa.column('id', sa.Integer),
+                      sa.column('food_id', sa.Integer),
+                      sa.column('fooditem_id', sa.Integer),
+                      *[sa.column(c) for c in COLUMNS])
+
+# Batch mode copies fooditem into a new table on SQLite, which drops the
+# triggers keeping the search index current.
+FOODITEM_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS fooditem_fts_ai AFTER INSERT ON fooditem "
+    "BEGIN INSERT INTO fooditem_fts(rowid, name) "
+    "VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS fooditem_fts_ad AFTER DELETE ON fooditem "
+    "BEGIN INSERT INTO fooditem_fts(fooditem_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS fooditem_fts_au AFTER UPDATE OF name "
+    "ON fooditem BEGIN INSERT INTO fooditem_fts(fooditem_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); "
+    "INSERT INTO fooditem_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+
+
+def digest(row):
+    values = np.nan_to_num(np.array([row[attr] or 0 for attr in NUTRIENTS],
+                                    dtype='<f8'))
+    return sha1((values + 0.0).tobytes()).hexdigest()
+
+
+def restore_triggers():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in FOODITEM_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('food',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=40), nullable=True),
+    sa.Column('digest', sa.String(length=40), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_food'))
+    )
+    with op.batch_alter_table('food', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_food_digest'), ['digest'], unique=True)
+
+    with op.batch_alter_table('fooditem', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('food_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_fooditem_food_id'), ['food_id'], unique=False)
+        batch_op.create_foreign_key(batch_op.f('fk_fooditem_food_id_food'), 'food', ['food_id'], ['id'])
+
+    with op.batch_alter_table('nutri_info', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('food_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(batch_op.f('fk_nutri_info_food_id_food'), 'food', ['food_id'], ['id'])
+
+    # ### end Alembic commands ###
+    restore_triggers()
+
+    # Intern every item's nutrition info: the first row seen with a given
+    # set of values becomes the food's info, later copies are deleted.
+    connection = op.get_bind()
+    foods = {}
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.select(
+            fooditem.c.id.label('item_id'), fooditem.c.name,
+            nutri_info).join(nutri_info,
+                             nutri_info.c.fooditem_id == fooditem.c.id).where(
+                fooditem.c.id > last_id).order_by(fooditem.c.id).limit(
+                    BATCH)).mappings().all()
+        if not rows:
+            break
+        last_id = rows[-1]['item_id']
+        kept, dropped, items = [], [], []
+        for row in rows:
+            key = digest(row)
+            food_id = foods.get(key)
+            if food_id is None:
+                food_id = foods[key] = connection.execute(
+                    food.insert().values(name=row['name'], digest=key)
+                ).inserted_primary_key[0]
+                kept.append({'info_id': row['id'], 'food_id': food_id})
+            else:
+                dropped.append({'info_id': row['id']})
+            items.append({'item_id': row['item_id'], 'food_id': food_id})
+        connection.execute(fooditem.update().where(
+            fooditem.c.id == sa.bindparam('item_id')).values(
+                food_id=sa.bindparam('food_id')), items)
+        if kept:
+            connection.execute(nutri_info.update().where(
+                nutri_info.c.id == sa.bindparam('info_id')).values(
+                    food_id=sa.bindparam('food_id'), fooditem_id=None), kept)
+        if dropped:
+            connection.execute(nutri_info.delete().where(
+                nutri_info.c.id == sa.bindparam('info_id')), dropped)
+
+    with op.batch_alter_table('nutri_info', schema=None) as batch_op:
+        batch_op.drop_column('fooditem_id')
+
+
+def downgrade():
+    with op.batch_alter_table('nutri_info', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fooditem_id', sa.INTEGER(), nullable=True))
+        batch_op.create_foreign_key('fk_nutri_info_fooditem_id_fooditem', 'fooditem', ['fooditem_id'], ['id'])
+
+    # Give every item its own copy of its food's nutrition info again.
+    connection = op.get_bind()
+    columns = [nutri_info.c[c] for c in COLUMNS]
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.select(
+            fooditem.c.id.label('item_id'), *columns).join(
+                nutri_info, nutri_info.c.food_id == fooditem.c.food_id).where(
+                    fooditem.c.id > last_id).order_by(fooditem.c.id).limit(
+                        BATCH)).mappings().all()
+        if not rows:
+            break
+        last_id = rows[-1]['item_id']
+        connection.execute(nutri_info.insert(), [
+            dict({c: row[c] for c in COLUMNS}, fooditem_id=row['item_id'])
+            for row in rows])
+    connection.execute(nutri_info.delete().where(
+        nutri_info.c.food_id != None))
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('nutri_info', schema=None) as batch_op:
+        batch_op.drop_constraint(batch_op.f('fk_nutri_info_food_id_food'), type_='foreignkey')
+        batch_op.drop_column('food_id')
+
+    with op.batch_alter_table('fooditem', schema=None) as batch_op:
+        batch_op.drop_constraint(batch_op.f('fk_fooditem_food_id_food'), type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_fooditem_food_id'))
+        batch_op.drop_column('food_id')
+
+    with op.batch_alter_table('food', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_food_digest'))
+
+    op.drop_table('food')
+    # ### end Alembic commands ###
+    restore_triggers()
@@ -1,14 +1,40 @@
 #!/usr/bin/env python
 from datetime import datetime, timedelta
+import csv
+import gc
+import gzip
+import io
+import json
+import math
+import os
+import socketserver
+import sys
+import tempfile
+import threading
 import unittest
-from app import create_app, db
-from app.models import User, MealPlan, NutritionInfo, FoodItem
+import weakref
+import numpy as np
+import sqlalchemy
+from app import create_app, db, adequacy, dri, export, fragments, last_seen, \
+    similar, search, planner, startup
+from app.cache import TTLCache
+from app.email import MailQueueFull
+from app.food_import import FoodImporter
+from app.last_seen import LastSeenBuffer
+from app.passwords import PasswordHasher
+from flask_mail import Message
+from werkzeug.security import generate_password_hash
+from app.models import NUTRIENTS, User, MealPlan, NutritionInfo, FoodItem, \
+    Food, VECTOR_ATTRS, rebuild_timelines, recount_follows, unpack_nutrients
+from app.pagination import keyset_paginate
 from config import Config
 
 
 class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    LAST_SEEN_FLUSH_INTERVAL = 0
+    PASSWORD_HASH_WORKERS = 0
 
 
 class CascadeDeleteCase(unittest.TestCase):
@@ -75,17 +101,21 @@ class CascadeDeleteCase(unittest.TestCase):
         db.session.commit()
         self.assertEqual(None, NutritionInfo.query.first())
 
-    def test_cascade_fooditem_info(self):
-        u = FoodItem()
+    def test_cascade_food_info(self):
+        f = Food()
         i = NutritionInfo()
-        db.session.add(u)
-        db.session.add(i)
-        u.info = i
+        u = FoodItem(food=f)
+        db.session.add_all([f, i, u])
+        f.info = i
         db.session.commit()
         self.assertEqual(i, u.info)
 
         db.session.delete(u)
         db.session.commit()
+        self.assertEqual(i, f.info)
+
+        db.session.delete(f)
+        db.session.commit()
         self.assertEqual(None, NutritionInfo.query.first())
 
 
@@ -130,11 +160,29 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(u2.followers.count(), 1)
         self.assertEqual(u2.followers.first().username, 'john')
 
+        self.assertEqual(u1.followed_count, 1)
+        self.assertEqual(u2.followers_count, 1)
+
         u1.unfollow(u2)
         db.session.commit()
         self.assertFalse(u1.is_following(u2))
         self.assertEqual(u1.followed.count(), 0)
         self.assertEqual(u2.followers.count(), 0)
+        self.assertEqual(u1.followed_count, 0)
+        self.assertEqual(u2.followers_count, 0)
+
+    def test_recount_follows(self):
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        db.session.add_all([u1, u2])
+        u1.follow(u2)
+        u2.follow(u1)
+        u1.followers_count = 7
+        u2.followed_count = None
+        db.session.commit()
+        recount_follows()
+        self.assertEqual([u1.followers_count, u1.followed_count,
+                          u2.followers_count, u2.followed_count], [1] * 4)
 
     def test_follow_mealplans(self):
         # create four users
@@ -174,6 +222,1520 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(f3, [p3, p4])
         self.assertEqual(f4, [p4])
 
+    def test_timeline_follow_unfollow(self):
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        db.session.add_all([u1, u2])
+        now = datetime.utcnow()
+        p1 = MealPlan(name="mealplan from john", user=u1, timestamp=now)
+        p2 = MealPlan(name="mealplan from susan", user=u2,
+                      timestamp=now + timedelta(seconds=1))
+        db.session.add_all([p1, p2])
+        db.session.commit()
+        self.assertEqual(u1.followed_mealplans().all(), [p1])
+
+        u1.follow(u2)
+        db.session.commit()
+        self.assertEqual(u1.followed_mealplans().all(), [p2, p1])
+        p3 = MealPlan(name="another from susan", user=u2,
+                      timestamp=now + timedelta(seconds=2))
+        db.session.add(p3)
+        db.session.commit()
+        self.assertEqual(u1.followed_mealplans().all(), [p3, p2, p1])
+
+        db.session.delete(p2)
+        db.session.commit()
+        self.assertEqual(u1.followed_mealplans().all(), [p3, p1])
+
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertEqual(u1.followed_mealplans().all(), [p1])
+
+    def test_timeline_fanout_limit(self):
+        self.app.config['TIMELINE_FANOUT_LIMIT'] = 1
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        u3 = User(username='mary', email='mary@example.com')
+        db.session.add_all([u1, u2, u3])
+        u1.follow(u3)
+        u2.follow(u3)
+        db.session.commit()
+        p1 = MealPlan(name="mealplan from mary", user=u3)
+        db.session.add(p1)
+        db.session.commit()
+        self.assertFalse(u3.timeline_fanout)
+        self.assertEqual(u1.followed_mealplans().all(), [p1])
+        self.assertEqual(u2.followed_mealplans().all(), [p1])
+
+        rebuild_timelines()
+        self.assertFalse(u3.timeline_fanout)
+        self.app.config['TIMELINE_FANOUT_LIMIT'] = 5
+        rebuild_timelines()
+        self.assertTrue(u3.timeline_fanout)
+        self.assertEqual(u1.followed_mealplans().all(), [p1])
+
+
+class NutritionGoalsCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_set_nutri_info(self):
+        u = User(username='susan', sex='F', age=60, height=1.8, weight=80,
+                 exercise=1.55)
+        u.set_nutri_info()
+        self.assertAlmostEqual(u.info.calories, 2269.2)
+        self.assertAlmostEqual(u.info.protein_low, 56.73)
+        self.assertAlmostEqual(u.info.protein, 198.555)
+        self.assertAlmostEqual(u.info.fat_low, 50.42666666)
+        self.assertEqual(u.info.fiber, 31)
+        self.assertEqual(u.info.sugar, 56)
+        self.assertEqual(u.info.sat_fat, 25)
+        self.assertEqual(u.info.iron, 8)
+        self.assertEqual(u.info.vitB6, 1.5)
+
+    def test_get_data(self):
+        u = User(username='susan', sex='F', age=60, height=1.8, weight=80,
+                 exercise=1.55)
+        m = MealPlan(name='plan', length=1,
+                     info=NutritionInfo(**{n: 12.7 for n in NUTRIENTS}))
+        u.set_nutri_info()
+        db.session.add_all([u, m])
+        db.session.commit()
+        db.session.refresh(u.info)
+        db.session.refresh(m.info)
+        statements = []
+        count = lambda *args: statements.append(args[2])
+        db.event.listen(db.engine, 'before_cursor_execute', count)
+        goals = u.info.get_data(display=True)
+        averages = m.info.get_data(display=True)
+        raw = m.info.get_data()
+        db.event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(statements, [])
+        self.assertEqual(goals['Protein (g)'], '56-198')
+        self.assertEqual(goals['Added Sugars (g)'], '<56')
+        self.assertEqual(goals['Iron (mg)'], 8)
+        self.assertEqual(averages['Protein (g)'], 12)
+        self.assertEqual(list(goals), list(averages))
+        self.assertNotIn('protein_low', raw)
+        self.assertIn('protein_low', u.info.get_data())
+        with self.assertRaises(TypeError):
+            raw['calories'] = 0
+        self.assertEqual(m.info.calories, 12.7)
+
+    def test_age_band_lookup(self):
+        table = dri.get_table()
+        self.assertEqual(table.ages['M'][table.band('M', 19)], 14)
+        self.assertEqual(table.ages['M'][table.band('M', 20)], 19)
+        self.assertEqual(table.ages['M'][table.band('M', 90)], 51)
+
+    def test_set_nutri_info_many(self):
+        users = [User(username=str(i), sex='MF'[i % 2], age=15 + i * 4,
+                      height=1.5 + i / 50, weight=50 + i, exercise=1.375)
+                 for i in range(12)]
+        User.set_nutri_info_many(users)
+        for u in users:
+            self.assertEqual(u.goals_version, 1)
+            expected = dri.get_table().goals(u.sex, u.age, u.height,
+                                             u.weight, u.exercise)
+            for key, value in expected.items():
+                self.assertAlmostEqual(getattr(u.info, key), value)
+
+
+class MealPlanModelCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_set_nutri_info(self):
+        m = MealPlan(name='plan', length=2)
+        db.session.add(m)
+        db.session.add_all([
+            FoodItem(name='rice', no_servings=2, mealplan=m, food=Food(
+                info=NutritionInfo(**{n: 10 for n in NUTRIENTS}))),
+            FoodItem(name='beans', no_servings=0.5, mealplan=m, food=Food(
+                info=NutritionInfo(**{n: 4 for n in NUTRIENTS})))])
+        m.set_nutri_info()
+        db.session.commit()
+        for n in NUTRIENTS:
+            self.assertEqual(getattr(m.info, n), 11)
+
+    def test_set_nutri_info_empty(self):
+        m = MealPlan(name='plan', length=3)
+        db.session.add(m)
+        m.set_nutri_info()
+        self.assertEqual(m.info.calories, 0)
+
+    def test_packed_vector(self):
+        info = NutritionInfo(calories=250, protein=10)
+        db.session.add(info)
+        db.session.commit()
+        vector = info.vector
+        self.assertFalse(vector.flags.writeable)
+        self.assertIs(vector.base, info.packed)
+        self.assertEqual(vector[VECTOR_ATTRS.index('calories')], 250)
+        self.assertTrue(math.isnan(vector[VECTOR_ATTRS.index('fiber')]))
+
+        info.protein = 12
+        self.assertEqual(info.vector[VECTOR_ATTRS.index('protein')], 12)
+        db.session.commit()
+        self.assertEqual(unpack_nutrients(info.packed)[1], 12)
+
+        info.vector = range(len(VECTOR_ATTRS))
+        db.session.commit()
+        self.assertEqual(info.folate, VECTOR_ATTRS.index('folate'))
+        self.assertEqual(list(info.vector), list(range(len(VECTOR_ATTRS))))
+
+    def test_update_fooditems(self):
+        m = MealPlan(name='plan')
+        db.session.add(m)
+        rows = [dict({n: 10 for n in NUTRIENTS}, name='rice', no_servings=2),
+                dict({n: 4 for n in NUTRIENTS}, name='beans', no_servings=1),
+                dict({n: 1 for n in NUTRIENTS}, name='salt', no_servings=1)]
+        m.update_fooditems(rows, 2)
+        db.session.commit()
+        self.assertEqual(m.info.calories, 12.5)
+
+        rows = m.get_item_data()
+        rice, beans, salt = rows
+        ids = {row['name']: row['id'] for row in rows}
+        rice['no_servings'] = 3
+        rows = [rice, beans, dict({n: 6 for n in NUTRIENTS}, name='kale',
+                                  no_servings=1)]
+        m.update_fooditems(rows, 3)
+        db.session.commit()
+        self.assertEqual(m.info.calories, 40 / 3)
+        stored = {item.name: item.id for item in m.fooditems}
+        self.assertEqual(stored['rice'], ids['rice'])
+        self.assertEqual(stored['beans'], ids['beans'])
+        self.assertNotIn('salt', stored)
+        self.assertEqual(Food.query.count(), 4)
+
+        m.set_nutri_info()
+        self.assertAlmostEqual(m.info.calories, 40 / 3)
+
+    def test_foods_are_shared(self):
+        banana = dict({n: 0 for n in NUTRIENTS}, name='Banana',
+                      calories=105, carbs=27, no_servings=1)
+        plans = [MealPlan(name=str(i)) for i in range(2)]
+        db.session.add_all(plans)
+        plans[0].update_fooditems([banana, dict(banana, name='banana')], 1)
+        db.session.commit()
+        plans[1].update_fooditems([dict(banana, calories=-0.0 + 105,
+                                        no_servings=2)], 1)
+        db.session.commit()
+        self.assertEqual(Food.query.count(), 1)
+        self.assertEqual(NutritionInfo.query.filter(
+            NutritionInfo.food_id != None).count(), 1)
+        self.assertEqual(plans[1].info.calories, 210)
+
+        plans[1].update_fooditems([dict(banana, calories=110)], 1)
+        db.session.commit()
+        self.assertEqual(Food.query.count(), 2)
+        self.assertEqual(plans[0].fooditems.first().info.calories, 105)
+
+    def test_food_digest_is_unique(self):
+        oats = dict.fromkeys(NUTRIENTS, 0)
+        oats['calories'] = 380
+        id, = Food.intern_ids([oats])
+        digest = Food.digest_of(oats)
+        # As when another request added the food after our lookup.
+        found = Food.add_missing({digest: ('Oats', oats)})
+        self.assertEqual(found, {digest: id})
+        db.session.commit()
+        self.assertEqual(Food.query.count(), 1)
+        self.assertEqual(NutritionInfo.query.count(), 1)
+        db.session.add(Food(digest=digest))
+        with self.assertRaises(sqlalchemy.exc.IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+class PaginationCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='susan', email='susan@example.com')
+        now = datetime.utcnow()
+        # pairs of plans share a timestamp so the id has to break ties
+        self.plans = [MealPlan(name=str(i), user=self.user,
+                               timestamp=now + timedelta(seconds=i // 2))
+                      for i in range(7)]
+        db.session.add_all(self.plans)
+        db.session.commit()
+        self.plans.reverse()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def walk(self, query, columns):
+        page = keyset_paginate(query, columns, 3)
+        self.assertFalse(page.has_prev)
+        pages = [page.items]
+        while page.has_next:
+            page = keyset_paginate(query, columns, 3, after=page.next_cursor)
+            pages.append(page.items)
+        self.assertEqual(pages, [self.plans[:3], self.plans[3:6],
+                                 self.plans[6:]])
+        page = keyset_paginate(query, columns, 3, before=page.prev_cursor)
+        self.assertEqual(page.items, self.plans[3:6])
+        page = keyset_paginate(query, columns, 3, before=page.prev_cursor)
+        self.assertEqual(page.items, self.plans[:3])
+        self.assertFalse(page.has_prev)
+
+    def test_explore(self):
+        self.walk(MealPlan.query, (MealPlan.timestamp, MealPlan.id))
+
+    def test_timeline(self):
+        self.walk(*self.user.feed_source())
+
+    def test_followed_query(self):
+        self.walk(self.user.followed_mealplans_query().order_by(None),
+                  (MealPlan.timestamp, MealPlan.id))
+
+    def test_count_and_bad_cursor(self):
+        page = keyset_paginate(MealPlan.query,
+                               (MealPlan.timestamp, MealPlan.id), 3,
+                               after='not-a-cursor', count=True)
+        self.assertEqual(page.items, self.plans[:3])
+        self.assertEqual(page.total, 7)
+
+
+class QueryCountCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.user = User(username='john', email='john@example.com')
+        self.user.set_password('cat')
+        authors = [User(username='user{}'.format(i),
+                        email='user{}@example.com'.format(i))
+                   for i in range(5)]
+        db.session.add_all([self.user] + authors)
+        for author in authors:
+            self.user.follow(author)
+        for i in range(30):
+            m = MealPlan(name='plan {}'.format(i), user=authors[i % 5])
+            db.session.add(m)
+            m.update_fooditems([dict(name='item', no_servings=1,
+                                     calories=100)] * 5, 1)
+        db.session.commit()
+        self.mealplan_id = m.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+        self.statements = []
+        db.event.listen(db.engine, 'before_cursor_execute', self.count)
+
+    def tearDown(self):
+        db.event.remove(db.engine, 'before_cursor_execute', self.count)
+        last_seen.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def assertMaxQueries(self, url, limit):
+        self.statements = []
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(self.statements), limit,
+                             '\n'.join(self.statements))
+
+    def test_feeds(self):
+        self.assertMaxQueries('/index', 5)
+        self.assertMaxQueries('/explore', 4)
+        self.assertMaxQueries('/user/user1', 5)
+
+    def test_show_mealplan(self):
+        self.assertMaxQueries('/{}'.format(self.mealplan_id), 7)
+
+
+class LastSeenCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_buffered_updates(self):
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        before = u1.last_seen
+        last_seen.touch(u1.id)
+        last_seen.touch(u2.id)
+        self.assertEqual(u1.last_seen, before)
+        self.assertEqual(last_seen.flush(), 2)
+        db.session.expire_all()
+        self.assertGreater(u1.last_seen, before)
+
+        # a second request within the minimum interval is not recorded
+        last_seen.touch(u1.id)
+        self.assertEqual(last_seen.flush(), 0)
+
+    def test_flush_on_shutdown(self):
+        u = User(username='john', email='john@example.com')
+        db.session.add(u)
+        db.session.commit()
+        buffer = self.app.extensions['last_seen']
+        buffer.flush_interval = 60
+        when = datetime(2030, 1, 1)
+        buffer.touch(u.id, when)
+        self.assertTrue(buffer._thread.is_alive())
+        buffer.shutdown()
+        db.session.expire_all()
+        self.assertEqual(u.last_seen, when)
+
+    def test_discarded_buffer_is_released(self):
+        buffer = LastSeenBuffer(self.app)
+        buffer.flush_interval = 60
+        buffer.touch(1)
+        thread = buffer._thread
+        ref = weakref.ref(buffer)
+        del buffer
+        gc.collect()
+        self.assertIsNone(ref())
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+
+class UserCacheCase(unittest.TestCase):
+    # Requests here run without an outer app context, so that each one gets
+    # its own session and g, like in production.
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='john', email='john@example.com')
+            u.set_password('cat')
+            db.session.add(u)
+            db.session.commit()
+        self.cache = self.app.extensions['caches']['users']
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+
+    def tearDown(self):
+        with self.app.app_context():
+            last_seen.flush()
+            db.drop_all()
+
+    def test_cached_user(self):
+        self.client.get('/index')
+        self.assertEqual(len(self.cache), 1)
+        hits = self.cache.hits
+        response = self.client.get('/user/john')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'john', response.data)
+        self.assertEqual(self.cache.hits, hits + 1)
+
+    def test_invalidated_on_update(self):
+        self.client.get('/index')
+        self.assertEqual(len(self.cache), 1)
+        response = self.client.post('/edit_profile', data={
+            'username': 'johnny', 'about_me': 'hi'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self.cache), 0)
+        response = self.client.get('/edit_profile')
+        self.assertIn(b'johnny', response.data)
+        stats = self.client.get('/metrics').get_json()['caches']['users']
+        self.assertGreater(stats['hits'], 0)
+
+    def test_evicted_on_commit_only(self):
+        self.client.get('/index')
+        with self.app.app_context():
+            user = User.query.filter_by(username='john').first()
+            user.about_me = 'draft'
+            db.session.flush()
+            self.assertEqual(len(self.cache), 1)
+            db.session.rollback()
+            self.assertEqual(len(self.cache), 1)
+            user.about_me = 'final'
+            db.session.flush()
+            self.assertEqual(len(self.cache), 1)
+            db.session.commit()
+            self.assertEqual(len(self.cache), 0)
+
+
+class AdequacyCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='susan', email='susan@example.com',
+                         sex='F', age=40, height=1.7, weight=65,
+                         exercise=1.375)
+        self.user.set_nutri_info()
+        db.session.add(self.user)
+        db.session.commit()
+        self.goals = self.user.info.vector
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def plan(self, **values):
+        goals = self.user.info.get_data()
+        return [values.get(n, goals[n]) for n in NUTRIENTS]
+
+    def test_status(self):
+        plan = self.plan(protein=self.user.info.protein_low - 1,
+                         sugar=self.user.info.sugar + 1, iron=100)
+        result = adequacy.score([plan], self.goals)
+        status = dict(zip(NUTRIENTS, result.status[0].tolist()))
+        self.assertEqual(status['protein'], adequacy.BELOW)
+        self.assertEqual(status['sugar'], adequacy.ABOVE)
+        self.assertEqual(status['iron'], adequacy.WITHIN)
+        self.assertEqual(status['calories'], adequacy.WITHIN)
+        percent = dict(zip(NUTRIENTS, result.percent[0].tolist()))
+        self.assertAlmostEqual(percent['iron'], 100 * 100 / 18)
+
+    def test_scores(self):
+        plans = [self.plan(), self.plan(calcium=500), [0] * len(NUTRIENTS)]
+        scores = adequacy.score(plans, self.goals).scores
+        self.assertEqual(scores[0], 100)
+        self.assertAlmostEqual(scores[1], 100 - 50 / len(NUTRIENTS))
+        self.assertLess(scores[2], scores[1])
+
+    def test_rank_catalog(self):
+        infos = [NutritionInfo(**dict(zip(NUTRIENTS, row)))
+                 for row in ([0] * len(NUTRIENTS), self.plan(),
+                             self.plan(calcium=500))]
+        plans = [MealPlan(name=str(i), info=info)
+                 for i, info in enumerate(infos)]
+        db.session.add_all(plans)
+        db.session.commit()
+        rows = [(info.mealplan_id, info.packed) for info in infos]
+        ids, scores = adequacy.rank_catalog(rows, self.goals)
+        self.assertEqual(ids.tolist(), [plans[1].id, plans[2].id,
+                                        plans[0].id])
+
+    def test_explore_page_is_clamped(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.user.set_password('cat')
+        db.session.add_all([MealPlan(name='plan {}'.format(i), user=self.user,
+                                     info=NutritionInfo(**dict(zip(
+                                         NUTRIENTS, self.plan()))))
+                            for i in range(3)])
+        db.session.commit()
+        client = self.app.test_client()
+        client.post('/auth/login', data={'username': 'susan',
+                                         'password': 'cat'})
+        for page in (0, -3):
+            response = client.get('/explore?sort=adequacy&page={}'.format(
+                page))
+            self.assertEqual(response.status_code, 200)
+            for i in range(3):
+                self.assertIn('plan {}'.format(i).encode(), response.data)
+        last_seen.flush()
+
+
+class SimilarPlansCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_query_matches_exact_search(self):
+        rng = np.random.default_rng(1)
+        vectors = rng.uniform(0, 100, (500, len(NUTRIENTS)))
+        index = similar.PlanIndex(np.ones(len(NUTRIENTS)), block=64)
+        index.build(zip(range(1, 501), vectors))
+        target = rng.uniform(0, 100, len(NUTRIENTS))
+        exact = np.argsort(((vectors - target) ** 2).sum(axis=1))[:6] + 1
+        found = index.query(target, k=5)
+        self.assertEqual([id for id, _ in found], exact[:5].tolist())
+        found = index.query(target, k=5, exclude=[int(exact[0])])
+        self.assertEqual([id for id, _ in found], exact[1:6].tolist())
+
+    def test_upsert_and_remove(self):
+        index = similar.PlanIndex(np.ones(2))
+        index.build([(1, [0, 0]), (2, [5, 5])])
+        for id in range(3, 40):
+            index.upsert(id, [id * 10, id * 10])
+        index.upsert(2, [1, 1])
+        index.remove(1)
+        self.assertEqual(len(index), 38)
+        self.assertEqual([id for id, _ in index.query([0, 0], k=2)], [2, 3])
+        index.remove(2)
+        self.assertEqual(index.query([0, 0], k=1)[0][0], 3)
+
+    def test_index_follows_saves(self):
+        index = similar.get_index()
+        self.assertEqual(len(index), 0)
+        plans = [MealPlan(name=str(i), info=NutritionInfo(
+            **dict.fromkeys(NUTRIENTS, i * 100))) for i in range(3)]
+        db.session.add_all(plans)
+        db.session.commit()
+        self.assertEqual(len(index), 3)
+        nearest = index.query(plans[2].info.vector, k=2,
+                              exclude=[plans[2].id])
+        self.assertEqual([id for id, _ in nearest],
+                         [plans[1].id, plans[0].id])
+        plans[0].info.calories = 10000
+        db.session.delete(plans[1])
+        db.session.commit()
+        self.assertEqual(len(index), 2)
+        self.assertGreater(index.query(plans[2].info.vector, k=2)[1][1],
+                           nearest[1][1])
+
+    def test_index_ignores_rolled_back_saves(self):
+        index = similar.get_index()
+        plan = MealPlan(name='kept', info=NutritionInfo(
+            **dict.fromkeys(NUTRIENTS, 100)))
+        db.session.add(plan)
+        db.session.commit()
+        id = plan.id
+        db.session.add(MealPlan(name='lost', info=NutritionInfo(
+            **dict.fromkeys(NUTRIENTS, 200))))
+        plan.info.calories = 5000
+        db.session.flush()
+        self.assertEqual(len(index), 1)
+        db.session.rollback()
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.query([100] * len(NUTRIENTS), k=1),
+                         [(id, 0.0)])
+        db.session.delete(db.session.get(MealPlan, id))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(len(index), 1)
+
+
+class SearchCase(unittest.TestCase):
+    backend = 'fts'
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['SEARCH_BACKEND'] = self.backend
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.plans = [MealPlan(name='Crème brûlée week'),
+                      MealPlan(name='Chicken and rice'),
+                      MealPlan(name='Lean bulk')]
+        self.items = [FoodItem(name='Chicken breast', mealplan=self.plans[2]),
+                      FoodItem(name='Brown rice', mealplan=self.plans[2])]
+        db.session.add_all(self.plans + self.items)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_prefix_match(self):
+        self.assertEqual(search.search_mealplans('chick', 10),
+                         [self.plans[1].id, self.plans[2].id])
+        self.assertEqual(search.search_mealplans('creme bru', 10),
+                         [self.plans[0].id])
+        self.assertEqual(search.search_mealplans('rice chicken', 10),
+                         [self.plans[1].id])
+        self.assertEqual(search.search_mealplans('c', 10), [])
+
+    def test_suggest(self):
+        self.assertEqual(search.suggest('chi', 10),
+                         ['Chicken and rice', 'Chicken breast'])
+        self.assertEqual(search.suggest('chi', 1), ['Chicken and rice'])
+
+    def test_follows_changes(self):
+        search.get_backend()
+        self.plans[0].name = 'Chickpea curry'
+        db.session.delete(self.items[0])
+        db.session.commit()
+        self.assertEqual(search.search_mealplans('chick', 10),
+                         [self.plans[1].id, self.plans[0].id])
+        self.assertEqual(search.search_mealplans('brulee', 10), [])
+
+
+class InvertedIndexSearchCase(SearchCase):
+    backend = 'memory'
+
+    def test_ignores_rolled_back_changes(self):
+        search.get_backend()
+        db.session.add(MealPlan(name='Ghostplan'))
+        db.session.delete(self.plans[1])
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(search.search_mealplans('ghost', 10), [])
+        self.assertEqual(search.suggest('gho', 10), [])
+        self.assertEqual(search.search_mealplans('chick', 10),
+                         [self.plans[1].id, self.plans[2].id])
+
+
+class FoodImportCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('food_code,food_name,nutrient,amount\n')
+            for code in range(1, 6):
+                f.write('{0},"Food, {0}",calories,{1}\n'.format(code,
+                                                               code * 100))
+                f.write('{0},"Food, {0}",Protein (g),{0}\n'.format(code))
+                f.write('{0},"Food, {0}",water,50\n'.format(code))
+
+    def tearDown(self):
+        os.remove(self.path)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_import(self):
+        importer = FoodImporter(self.path, chunk_size=2)
+        importer.run(importer.job())
+        foods = Food.query.order_by(Food.id).all()
+        self.assertEqual([f.name for f in foods],
+                         ['Food, {}'.format(i) for i in range(1, 6)])
+        self.assertEqual(foods[2].info.calories, 300)
+        self.assertEqual(foods[2].info.protein, 3)
+        self.assertEqual(foods[2].info.vector[0], 300)
+        self.assertIsNone(foods[2].info.fiber)
+        self.assertEqual(importer.skipped['rows'], 5)
+
+    def test_resume(self):
+        def interrupt(job, rate):
+            raise KeyboardInterrupt
+        importer = FoodImporter(self.path, chunk_size=2)
+        with self.assertRaises(KeyboardInterrupt):
+            importer.run(importer.job(), interrupt)
+        self.assertEqual(Food.query.count(), 2)
+
+        job = FoodImporter(self.path).job()
+        self.assertEqual(job.foods, 2)
+        self.assertIsNone(job.finished)
+        FoodImporter(self.path, chunk_size=2).run(job)
+        self.assertEqual([f.name for f in Food.query.order_by(Food.id)],
+                         ['Food, {}'.format(i) for i in range(1, 6)])
+        self.assertEqual(job.rows, 15)
+        self.assertIsNotNone(job.finished)
+
+    def test_command(self):
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['food', 'import', self.path])
+        self.assertIn('Imported 5 foods from 15 rows', result.output)
+        result = runner.invoke(args=['food', 'import', self.path])
+        self.assertIn('already imported', result.output)
+        self.assertEqual(Food.query.count(), 5)
+
+
+class PlannerCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='susan', email='susan@example.com',
+                         sex='F', age=30, height=1.65, weight=60,
+                         exercise=1.55)
+        self.user.set_nutri_info()
+        db.session.add(self.user)
+        db.session.commit()
+        self.goals = self.user.info.vector
+        target = adequacy.goal_bounds(self.goals)[2]
+        rng = np.random.default_rng(0)
+        self.matrix = rng.uniform(0, 1, (500, len(NUTRIENTS))) * \
+            (rng.uniform(0, 1, (500, len(NUTRIENTS))) < 0.4) * target / 4
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_solve(self):
+        pool = planner.Pool(range(500), map(str, range(500)), self.matrix)
+        plan = planner.solve(pool, self.goals, max_items=10)
+        self.assertEqual(plan.cost, 0)
+        self.assertLessEqual(len(plan.indexes), 10)
+        self.assertTrue((plan.servings > 0).all())
+        daily = plan.servings @ self.matrix[plan.indexes]
+        self.assertEqual(adequacy.score(daily, self.goals).scores[0], 100)
+
+    def test_shortlist(self):
+        pool = planner.Pool(range(500), map(str, range(500)), self.matrix)
+        shortlist = pool.shortlist(self.goals, 100)
+        self.assertLessEqual(len(shortlist), 100)
+        self.assertIs(pool.shortlist(self.goals, 500), pool)
+        plan = planner.solve(shortlist, self.goals, max_items=10)
+        self.assertEqual(plan.cost, 0)
+        self.assertTrue(np.isin(shortlist.ids[plan.indexes],
+                                pool.ids).all())
+
+    def test_solve_empty_pool(self):
+        pool = planner.Pool([], [], np.empty((0, len(NUTRIENTS))))
+        self.assertEqual(len(planner.solve(pool, self.goals).indexes), 0)
+
+    def test_create_mealplan(self):
+        db.session.add_all([Food(name=str(i), info=NutritionInfo(
+            **dict(zip(NUTRIENTS, row)))) for i, row in
+            enumerate(self.matrix[:100].tolist())])
+        db.session.commit()
+        pool = planner.Pool.from_catalog()
+        plan = planner.solve(pool, self.goals)
+        mealplan = planner.create_mealplan(self.user, 'generated', 7, pool,
+                                           plan)
+        db.session.commit()
+        self.assertEqual(mealplan.fooditems.count(), len(plan.indexes))
+        score = adequacy.score(mealplan.info.vector[:len(NUTRIENTS)],
+                               self.goals).scores[0]
+        self.assertGreater(score, 90)
+
+        rows = mealplan.get_item_data()
+        mealplan.update_fooditems(rows, 7)
+        db.session.commit()
+        self.assertEqual(Food.query.count(), 100)
+
+    def test_pool_reloads_when_catalog_changes(self):
+        db.session.add(Food(name='oats', info=NutritionInfo(calories=380)))
+        db.session.commit()
+        pool = planner.get_pool()
+        self.assertEqual(pool.names, ['oats'])
+        self.assertIs(planner.get_pool(), pool)
+        db.session.add(Food(name='milk', info=NutritionInfo(calories=60)))
+        db.session.commit()
+        self.assertEqual(planner.get_pool().names, ['oats', 'milk'])
+
+
+class ApiCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        with self.app.app_context():
+            db.create_all()
+            for name in ('john', 'susan'):
+                u = User(username=name, email=name + '@example.com')
+                u.set_password('cat')
+                db.session.add(u)
+            db.session.commit()
+        self.client = self.app.test_client()
+        self.headers = self.auth_headers('john')
+
+    def tearDown(self):
+        with self.app.app_context():
+            last_seen.flush()
+            db.drop_all()
+
+    def auth_headers(self, username):
+        response = self.client.post('/api/v1/tokens', auth=(username, 'cat'))
+        self.assertEqual(response.status_code, 200)
+        return {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+    def item(self, name, calories, servings=1):
+        return {'name': name, 'no_servings': servings, 'calories': calories,
+                'protein': 10}
+
+    def test_token_required(self):
+        self.assertEqual(self.client.post(
+            '/api/v1/tokens', auth=('john', 'dog')).status_code, 401)
+        self.assertEqual(self.client.get('/api/v1/goals').status_code, 401)
+        response = self.client.get('/api/v1/goals', headers={
+            'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/api/v1/nowhere', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()['error'], 'Not Found')
+
+    def test_goals(self):
+        response = self.client.put('/api/v1/goals', headers=self.headers,
+                                   json={'sex': 'F', 'age': 30,
+                                         'height': 1.65, 'weight': 60,
+                                         'exercise': 1.55})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.get_json()['goals']['calories'], 1000)
+        response = self.client.get('/api/v1/goals', headers=self.headers)
+        self.assertEqual(response.get_json()['profile']['age'], 30)
+
+        response = self.client.put('/api/v1/goals', headers=self.headers,
+                                   json={'sex': 'X', 'age': 'old',
+                                         'height': 1.65, 'weight': 60,
+                                         'exercise': 1.55, 'shoe': 44})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.get_json()['errors']),
+                         {'sex', 'age', 'shoe'})
+
+    def test_rejects_non_finite_numbers(self):
+        body = ('{"name": "x", "length": 1e999, "fooditems": [{"name": "y", '
+                '"calories": Infinity, "protein": NaN, "fat": -1e999, '
+                '"fiber": ' + str(10 ** 400) + '}]}')
+        response = self.client.post('/api/v1/mealplans', data=body,
+                                    headers=dict(self.headers, **{
+                                        'Content-Type': 'application/json'}))
+        self.assertEqual(response.status_code, 400)
+        errors = response.get_json()['errors']
+        self.assertEqual(errors['length'], 'must be an integer')
+        for name in ('calories', 'protein', 'fat', 'fiber'):
+            self.assertEqual(errors['fooditems.0.' + name],
+                             'must be a number')
+
+    def test_mealplan_crud(self):
+        response = self.client.post('/api/v1/mealplans', headers=self.headers,
+                                    json={'name': 'week', 'length': 2,
+                                          'fooditems': [
+                                              self.item('oats', 300),
+                                              self.item('milk', 100, 2)]})
+        self.assertEqual(response.status_code, 201)
+        data = response.get_json()
+        self.assertEqual(response.headers['Location'], data['_links']['self'])
+        self.assertEqual(len(data['fooditems']), 2)
+        self.assertEqual(data['info']['calories'], 250)
+        url = data['_links']['self']
+
+        response = self.client.post(url + '/fooditems', headers=self.headers,
+                                    json={'fooditems': [{
+                                        'name': 'more milk',
+                                        'food_id': data['fooditems'][1][
+                                            'food_id']}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()['info']['calories'], 300)
+        with self.app.app_context():
+            self.assertEqual(Food.query.count(), 2)
+
+        response = self.client.put(url, headers=self.headers, json={
+            'name': 'weekend', 'length': 1,
+            'fooditems': [self.item('toast', 200)]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['name'], 'weekend')
+        self.assertEqual([i['name'] for i in data['fooditems']], ['toast'])
+        self.assertEqual(data['info']['calories'], 200)
+
+        other = self.auth_headers('susan')
+        self.assertEqual(self.client.get(url, headers=other).status_code, 200)
+        self.assertEqual(self.client.delete(url, headers=other).status_code,
+                         403)
+        item_url = '{}/fooditems/{}'.format(url, data['fooditems'][0]['id'])
+        self.assertEqual(self.client.delete(
+            item_url, headers=self.headers).status_code, 204)
+        self.assertEqual(self.client.get(
+            url + '/fooditems', headers=self.headers).get_json()['items'], [])
+        self.assertEqual(self.client.delete(
+            url, headers=self.headers).status_code, 204)
+        self.assertEqual(self.client.get(
+            url, headers=self.headers).status_code, 404)
+
+    def test_batch(self):
+        response = self.client.post('/api/v1/mealplans/batch',
+                                    headers=self.headers, json={'mealplans': [
+                                        {'name': 'plan {}'.format(i),
+                                         'length': 1, 'fooditems': [
+                                             self.item('oats', 300),
+                                             self.item('egg', 80 + i)]}
+                                        for i in range(3)]})
+        self.assertEqual(response.status_code, 200)
+        items = response.get_json()['items']
+        self.assertEqual([m['info']['calories'] for m in items],
+                         [380, 381, 382])
+        with self.app.app_context():
+            self.assertEqual(Food.query.count(), 4)
+            self.assertEqual(FoodItem.query.count(), 6)
+
+        response = self.client.post('/api/v1/mealplans/batch',
+                                    headers=self.headers, json={'mealplans': [
+                                        {'id': items[0]['id'], 'name': 'new',
+                                         'length': 2, 'fooditems': [
+                                             self.item('oats', 300)]},
+                                        {'name': 'another', 'length': 1}]})
+        self.assertEqual(response.status_code, 200)
+        items = response.get_json()['items']
+        self.assertEqual(items[0]['info']['calories'], 150)
+        self.assertEqual(items[1]['info']['calories'], 0)
+        response = self.client.get('/api/v1/mealplans', headers=self.headers)
+        self.assertEqual(len(response.get_json()['items']), 4)
+
+    def test_batch_is_atomic(self):
+        self.client.post('/api/v1/mealplans', headers=self.headers,
+                         json={'name': 'mine', 'length': 1})
+        theirs = self.client.post('/api/v1/mealplans',
+                                  headers=self.auth_headers('susan'),
+                                  json={'name': 'theirs', 'length': 1})
+        response = self.client.post('/api/v1/mealplans/batch',
+                                    headers=self.headers, json={'mealplans': [
+                                        {'name': 'ok', 'length': 1},
+                                        {'name': 'bad', 'length': 0,
+                                         'fooditems': [{'name': 'x',
+                                                        'calories': -1}]}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.get_json()['errors']), {
+            'mealplans.1.length', 'mealplans.1.fooditems.0.calories'})
+
+        response = self.client.post('/api/v1/mealplans/batch',
+                                    headers=self.headers, json={'mealplans': [
+                                        {'name': 'ok', 'length': 1},
+                                        {'id': theirs.get_json()['id'],
+                                         'name': 'stolen', 'length': 1},
+                                        {'name': 'both', 'length': 1,
+                                         'fooditems': [{'name': 'y',
+                                                        'food_id': 999,
+                                                        'calories': 1}]},
+                                        {'name': 'unknown', 'length': 1,
+                                         'fooditems': [{'name': 'z',
+                                                        'food_id': 999}]}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.get_json()['errors']), {
+            'mealplans.1.id', 'mealplans.2.fooditems.0', 'food_id'})
+        with self.app.app_context():
+            self.assertEqual(MealPlan.query.count(), 2)
+
+
+class ExportCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            db.create_all()
+            u1 = User(username='john', email='john@example.com')
+            u1.set_password('cat')
+            u2 = User(username='susan', email='susan@example.com')
+            m1 = MealPlan(name='week', length=7, user=u1)
+            m2 = MealPlan(name='empty', length=1, user=u1)
+            m3 = MealPlan(name='other', length=1, user=u2)
+            db.session.add_all([u1, u2, m1, m2, m3])
+            db.session.add_all([FoodItem(
+                name='item {}'.format(i), no_servings=i + 1, mealplan=m1,
+                food=Food(info=NutritionInfo(calories=100 * i, protein=i)))
+                for i in range(3)] + [FoodItem(
+                    name='theirs', no_servings=1, mealplan=m3,
+                    food=Food(info=NutritionInfo(calories=1)))])
+            db.session.commit()
+            self.user_id = u1.id
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+
+    def tearDown(self):
+        with self.app.app_context():
+            last_seen.flush()
+            db.drop_all()
+
+    def test_rows(self):
+        with self.app.app_context():
+            rows = list(export.export_rows(self.user_id, chunk=2))
+        self.assertEqual([(r[1], r[5]) for r in rows], [
+            ('week', 'item 0'), ('week', 'item 1'), ('week', 'item 2'),
+            ('empty', None)])
+        calories = export.COLUMNS.index('calories')
+        self.assertEqual([r[calories] for r in rows], [0, 100, 200, None])
+
+    def test_csv(self):
+        response = self.client.get('/user/john/mealplans.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(True))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1]['fooditem_name'], 'item 1')
+        self.assertEqual(float(rows[1]['no_servings']), 2)
+        self.assertEqual(rows[3]['fooditem_id'], '')
+
+    def test_ndjson_gzip(self):
+        response = self.client.get('/user/john/mealplans.ndjson?gzip=1')
+        self.assertEqual(response.mimetype, 'application/gzip')
+        self.assertIn('mealplans.ndjson.gz',
+                      response.headers['Content-Disposition'])
+        lines = gzip.decompress(response.data).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([r['calories'] for r in rows], [0, 100, 200, None])
+        self.assertTrue(rows[0]['timestamp'].endswith('Z'))
+
+    def test_only_own_plans(self):
+        response = self.client.get('/user/susan/mealplans.csv')
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get('/user/john/mealplans.xml')
+        self.assertEqual(response.status_code, 302)
+
+
+class HttpCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='john', email='john@example.com')
+            u.set_password('cat')
+            m = MealPlan(name='week', length=1, user=u)
+            db.session.add_all([u, m, FoodItem(
+                name='oats', no_servings=1, mealplan=m,
+                food=Food(info=NutritionInfo(calories=300)))])
+            m.set_nutri_info()
+            db.session.commit()
+            self.url = '/{}'.format(m.id)
+        self.pages = self.app.extensions['caches']['pages']
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+        self.client.get('/index')
+
+    def tearDown(self):
+        with self.app.app_context():
+            last_seen.flush()
+            db.drop_all()
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'oats', response.data)
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('private', response.headers['Cache-Control'])
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        hits = self.pages.hits
+        response = self.client.get(self.url)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.pages.hits, hits + 1)
+
+    def test_save_changes_etag(self):
+        etag = self.client.get(self.url).headers['ETag']
+        response = self.client.post(self.url + '/form', data={
+            'name': 'week', 'length': 1,
+            'fooditems-0-name': 'rice', 'fooditems-0-no_servings': 1,
+            'fooditems-0-calories': 200})
+        self.assertEqual(response.status_code, 302)
+        self.client.get('/index')
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'rice', response.data)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_goals_change_etag(self):
+        etag = self.client.get(self.url).headers['ETag']
+        self.client.post('/edit_nutrition', data={
+            'sex': 'F', 'age': 30, 'height': 1.65, 'weight': 60,
+            'exercise': '1.55'})
+        self.client.get('/index')
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Your Goals', response.data)
+
+    def test_ingredients_shared_between_viewers(self):
+        with self.app.app_context():
+            u = User(username='susan', email='susan@example.com')
+            u.set_password('dog')
+            db.session.add(u)
+            db.session.commit()
+        self.assertIn(b'oats', self.client.get(self.url).data)
+        other = self.app.test_client()
+        other.post('/auth/login', data={'username': 'susan',
+                                        'password': 'dog'})
+        hits = self.pages.hits
+        response = other.get(self.url)
+        self.assertIn(b'oats', response.data)
+        self.assertEqual(self.pages.hits, hits + 1)
+        self.assertEqual(len(self.pages), 1)
+        self.assertNotEqual(response.headers['ETag'],
+                            self.client.get(self.url).headers['ETag'])
+
+    def test_page_cache_bounded_by_bytes(self):
+        cache = TTLCache(None, maxbytes=3 * sys.getsizeof('x' * 100))
+        for i in range(4):
+            cache.set(i, str(i) * 100)
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(0))
+        cache.set(1, '1')
+        cache.pop(2)
+        self.assertEqual(cache.stats()['bytes'],
+                         sys.getsizeof('1') + sys.getsizeof('3' * 100))
+        cache.clear()
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_recreated_plan_changes_etag(self):
+        etag = self.client.get(self.url).headers['ETag']
+        with self.app.app_context():
+            old = db.session.get(MealPlan, int(self.url[1:]))
+            u, version = old.user, old.version
+            db.session.delete(old)
+            db.session.commit()
+            m = MealPlan(name='month', length=1, user=u)
+            db.session.add(FoodItem(
+                name='rice', no_servings=1, mealplan=m,
+                food=Food(info=NutritionInfo(calories=200))))
+            m.set_nutri_info()
+            db.session.commit()
+            self.assertEqual((m.id, m.version),
+                             (int(self.url[1:]), version))
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'month', response.data)
+        self.assertNotIn(b'oats', response.data)
+
+    def test_flashed_messages_bypass_cache(self):
+        self.client.get(self.url)
+        self.client.get('/user/nobody/mealplans')
+        response = self.client.get(self.url)
+        self.assertIn(b'User nobody not found.', response.data)
+        self.assertNotIn('ETag', response.headers)
+        response = self.client.get(self.url)
+        self.assertNotIn(b'User nobody not found.', response.data)
+
+
+class FragmentCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='john', email='john@example.com')
+            u.set_password('cat')
+            m = MealPlan(name='week', length=1, user=u)
+            db.session.add_all([u, m, FoodItem(
+                name='oats', no_servings=1, mealplan=m,
+                food=Food(info=NutritionInfo(calories=300)))])
+            m.set_nutri_info()
+            db.session.commit()
+            self.mealplan_id = m.id
+        self.fragments = self.app.extensions['caches']['fragments']
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'username': 'john',
+                                              'password': 'cat'})
+
+    def tearDown(self):
+        with self.app.app_context():
+            last_seen.flush()
+            db.drop_all()
+
+    def test_card_reused(self):
+        response = self.client.get('/explore')
+        self.assertIn(b'week', response.data)
+        self.assertIn(b'fromNow', response.data)
+        self.assertEqual(len(self.fragments), 1)
+        hits = self.fragments.hits
+        self.client.get('/explore')
+        self.client.get('/user/john')
+        self.assertEqual(self.fragments.hits, hits + 2)
+        stats = self.client.get('/metrics').get_json()['caches']
+        self.assertGreater(stats['fragments']['hit_ratio'], 0)
+
+    def test_key_follows_versions(self):
+        self.client.get('/explore')
+        self.client.post('/{}/form'.format(self.mealplan_id), data={
+            'name': 'weekend', 'length': 1,
+            'fooditems-0-name': 'oats', 'fooditems-0-no_servings': 1,
+            'fooditems-0-calories': 300})
+        self.assertIn(b'weekend', self.client.get('/explore').data)
+        self.client.post('/edit_profile', data={'username': 'johnny',
+                                                'about_me': ''})
+        self.assertIn(b'johnny', self.client.get('/explore').data)
+        self.client.get('/explore', headers={'Accept-Language': 'es'})
+        self.assertEqual(len(self.fragments), 4)
+
+    def test_recreated_plan_not_reused(self):
+        self.assertIn(b'week', self.client.get('/explore').data)
+        with self.app.app_context():
+            old = db.session.get(MealPlan, self.mealplan_id)
+            u, version = old.user, old.version
+            db.session.delete(old)
+            db.session.commit()
+            m = MealPlan(name='month', length=1, user=u)
+            db.session.add(FoodItem(
+                name='rice', no_servings=1, mealplan=m,
+                food=Food(info=NutritionInfo(calories=200))))
+            m.set_nutri_info()
+            db.session.commit()
+            self.assertEqual((m.id, m.version), (self.mealplan_id, version))
+        response = self.client.get('/explore')
+        self.assertIn(b'month', response.data)
+        self.assertNotIn(b'week', response.data)
+
+    def test_shared_backend(self):
+        class Store(dict):
+            def set(self, key, value, ex=None):
+                self[key] = value.encode('utf-8')
+
+        cache = fragments.SharedCache(Store())
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', '<p>card</p>')
+        self.assertEqual(cache.get('a'), '<p>card</p>')
+        self.assertEqual(cache.stats()['hit_ratio'], 0.5)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib, keeping each message's text.
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.greeting.wait()
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply('220 localhost ready')
+        data = None
+        for line in self.rfile:
+            line = line.decode('utf-8').rstrip('\r\n')
+            if data is not None:
+                if line == '.':
+                    with self.server.lock:
+                        self.server.messages.append('\n'.join(data))
+                    data = None
+                    self.reply('250 OK')
+                else:
+                    data.append(line)
+                continue
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == 'RCPT' and 'refused@' in line:
+                self.reply('550 No such user')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 SMTPHandler)
+        self.greeting = threading.Event()
+        self.greeting.set()
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+
+
+class MailTestConfig(TestConfig):
+    MAIL_SERVER = '127.0.0.1'
+    MAIL_SUPPRESS_SEND = False
+    MAIL_WORKERS = 1
+    MAIL_QUEUE_SIZE = 100
+    MAIL_QUEUE_TIMEOUT = 0.05
+
+
+class MailQueueCase(unittest.TestCase):
+    def setUp(self):
+        self.server = SMTPStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        MailTestConfig.MAIL_PORT = self.server.server_address[1]
+        self.app = create_app(MailTestConfig)
+        self.mail_queue = self.app.extensions['mail_queue']
+
+    def tearDown(self):
+        self.server.greeting.set()
+        if hasattr(self, 'mail_queue'):
+            self.mail_queue.shutdown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def message(self, i, recipient='b@example.com'):
+        return Message('Hello {}'.format(i), sender='a@example.com',
+                       recipients=[recipient], body='Message body')
+
+    def test_batches_share_connections(self):
+        self.server.greeting.clear()
+        for i in range(30):
+            self.mail_queue.put(self.message(i))
+        self.server.greeting.set()
+        self.mail_queue.join()
+        self.assertEqual(len(self.server.messages), 30)
+        self.assertLessEqual(self.server.connections, 2)
+        self.assertEqual(self.mail_queue.stats()['sent'], 30)
+        self.assertEqual(self.mail_queue.stats()['connections'],
+                         self.server.connections)
+
+    def test_refused_message_keeps_batch(self):
+        self.server.greeting.clear()
+        for i in range(5):
+            self.mail_queue.put(self.message(
+                i, 'refused@example.com' if i == 2 else 'b@example.com'))
+        self.server.greeting.set()
+        self.mail_queue.join()
+        self.assertEqual(len(self.server.messages), 4)
+        self.assertIn('Hello 4', self.server.messages[-1])
+        stats = self.mail_queue.stats()
+        self.assertEqual((stats['sent'], stats['failed']), (4, 1))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_backpressure(self):
+        self.mail_queue.batch_size = 1
+        self.mail_queue.queue.maxsize = 2
+        self.server.greeting.clear()
+        with self.assertRaises(MailQueueFull):
+            for i in range(4):
+                self.mail_queue.put(self.message(i))
+        self.server.greeting.set()
+        self.mail_queue.join()
+        self.assertEqual(len(self.server.messages), 3)
+
+    def test_discarded_queue_is_released(self):
+        self.mail_queue.put(self.message(0))
+        self.mail_queue.join()
+        threads = self.mail_queue._threads
+        ref = weakref.ref(self.mail_queue)
+        del self.app, self.mail_queue
+        gc.collect()
+        self.assertIsNone(ref())
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+    def test_drained_on_shutdown(self):
+        for i in range(5):
+            self.mail_queue.put(self.message(i))
+        self.mail_queue.shutdown()
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertIn('Hello 0', self.server.messages[0])
+
+    def test_reset_password_request(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(User(username='john', email='john@example.com'))
+            db.session.commit()
+        client = self.app.test_client()
+        response = client.post('/auth/reset_password_request',
+                               data={'email': 'john@example.com'})
+        self.assertEqual(response.status_code, 302)
+        self.mail_queue.join()
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertIn('john@example.com', self.server.messages[0])
+        with self.app.app_context():
+            db.drop_all()
+
+
+class PasswordCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.hasher = self.app.extensions['passwords']
+        u = User(username='john', email='john@example.com',
+                 password_hash=generate_password_hash(
+                     'cat', 'pbkdf2:sha256:1000'))
+        db.session.add(u)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_authenticate(self):
+        self.assertIsNone(User.authenticate('john', 'dog'))
+        self.assertIsNone(User.authenticate('nobody', 'cat'))
+        u = User.query.first()
+        self.assertTrue(self.hasher.needs_rehash(u.password_hash))
+        self.assertEqual(User.authenticate('john', 'cat'), u)
+        self.assertTrue(u.password_hash.startswith(
+            self.app.config['PASSWORD_HASH_METHOD'] + '$'))
+        self.assertFalse(self.hasher.needs_rehash(u.password_hash))
+        self.assertTrue(u.check_password('cat'))
+
+    def test_rehash_on_login(self):
+        client = self.app.test_client()
+        response = client.post('/auth/login', data={'username': 'john',
+                                                    'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        u = User.query.first()
+        self.assertFalse(self.hasher.needs_rehash(u.password_hash))
+        last_seen.flush()
+
+    def test_missing_hash(self):
+        u = User(username='susan', email='susan@example.com')
+        db.session.add(u)
+        db.session.commit()
+        self.assertIsNone(User.authenticate('susan', ''))
+
+    def test_pool(self):
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=2)
+        try:
+            pwhash = hasher.hash('cat')
+            self.assertTrue(pwhash.startswith('pbkdf2:sha256:1000$'))
+            self.assertTrue(hasher.verify(pwhash, 'cat'))
+            self.assertFalse(hasher.verify(pwhash, 'dog'))
+            self.assertFalse(hasher.dummy_verify('cat'))
+        finally:
+            hasher.shutdown()
+
+    def test_discarded_hasher_is_released(self):
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1)
+        hasher.hash('cat')
+        processes = list(hasher._pool._processes.values())
+        ref = weakref.ref(hasher)
+        del hasher
+        gc.collect()
+        self.assertIsNone(ref())
+        for process in processes:
+            process.join(10)
+            self.assertFalse(process.is_alive())
+
+    def test_scrypt_fits(self):
+        hasher = PasswordHasher('scrypt', workers=0)
+        pwhash = hasher.hash('cat')
+        self.assertLessEqual(len(pwhash),
+                             User.__table__.c.password_hash.type.length)
+
+
+class StartupCase(unittest.TestCase):
+    def test_within_budget(self):
+        report = startup.profile('nutritrack')
+        self.assertEqual(startup.over_budget(report), [])
+        self.assertIn('flask', report['times'])
+        self.assertGreater(report['memory']['sqlalchemy'], 0)
+
+    def test_over_budget(self):
+        report = {'seconds': startup.BUDGET_SECONDS + 1,
+                  'rss_mib': startup.BUDGET_RSS_MIB + 1,
+                  'modules': ['alembic.context', 'flask'],
+                  'times': {}, 'memory': {}}
+        self.assertEqual(len(startup.over_budget(report)), 3)
+
+    def test_import_times(self):
+        stderr = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:       500 |        500 |   app.cache\n'
+                  'import time:      1500 |       2000 | app\n')
+        self.assertEqual(startup.import_times(stderr), {'app': 0.002})
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)